@@ -0,0 +1,417 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.timestamps import cet_to_utc, to_datetime_index
+
+# Aggregations for sources finer than the requested resolution
+aggregations = ["mean", "min", "max", "first", "last", "sum"]
+
+# A registered source: sorted int64 UTC times and one 1-D array per column (arrays or
+# PMUStore memmaps, read only for the rows a build needs)
+AlignedSource = namedtuple("AlignedSource", ["time", "values", "columns", "resolution", "how"])
+
+NAT = np.iinfo(np.int64).min
+
+
+## Time handling
+def _utc_ns(index, tz):
+    # Aware indexes are already instants. Naive ones are CET/CEST wall-clock time by
+    # default (the loaders' and Toledo's convention), or wall-clock time in tz
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        return index.as_unit("ns").asi8
+    if tz is None:
+        return cet_to_utc(index.as_unit("ns").asi8)
+    if tz == "UTC":
+        return index.as_unit("ns").asi8
+    return index.tz_localize(tz, ambiguous="NaT", nonexistent="NaT").as_unit("ns").asi8
+
+
+def _median_step(time):
+    sample = np.diff(time[:100_000])
+    sample = sample[sample > 0]
+    return int(np.median(sample)) if len(sample) else 0
+
+
+def _grid(freq, start, end, tz):
+    step = pd.Timedelta(freq).value
+    bounds = []
+    for bound in (start, end):
+        bound = pd.Timestamp(bound)
+        if bound.tz is None:
+            bound = bound.tz_localize("UTC" if tz is None else tz)
+        bounds.append(bound.value)
+    return np.arange(bounds[0], bounds[1], step, dtype=np.int64), step
+
+
+## Joins
+def _asof(source, column, grid):
+    # Coarser (or equal) sources: the sample whose interval [t, t + resolution) holds
+    # the start of each row
+    position = np.searchsorted(source.time, grid, side="right") - 1
+    valid = (position >= 0) & (grid < source.time[np.maximum(position, 0)] + source.resolution)
+    out = np.full(len(grid), np.nan)
+    out[valid] = source.values[column][position[valid]]
+    return out
+
+
+def _aggregate(source, column, grid, step, how, max_samples):
+    # Finer sources: reduce the samples of each row [g, g + step) with one reduceat per
+    # block of rows, so only the samples of a block are in memory at a time
+    out = np.full(len(grid), np.nan)
+    edges = (
+        np.searchsorted(source.time, np.append(grid, grid[-1] + step), side="left")
+        if len(grid)
+        else np.zeros(1, dtype=np.int64)
+    )
+    rows_per_block = max(1, int(max_samples * len(grid) / max(1, edges[-1] - edges[0])))
+    for r0 in range(0, len(grid), rows_per_block):
+        r1 = min(r0 + rows_per_block, len(grid))
+        b0, b1 = edges[r0], edges[r1]
+        if b1 == b0:
+            continue
+        values = np.asarray(source.values[column][b0:b1], dtype=np.float64)
+        counts = np.diff(edges[r0 : r1 + 1])
+        filled = counts > 0
+        # Segments of the rows with samples; the empty rows between them hold nothing
+        starts = edges[r0:r1][filled] - b0
+        finite = np.isfinite(values)
+        if how in ("mean", "sum"):
+            sums = np.add.reduceat(np.where(finite, values, 0.0), starts)
+            n = np.add.reduceat(finite.astype(np.int64), starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                block = sums / n if how == "mean" else np.where(n > 0, sums, np.nan)
+        elif how == "min":
+            block = np.fmin.reduceat(values, starts)
+        elif how == "max":
+            block = np.fmax.reduceat(values, starts)
+        elif how == "first":
+            block = values[starts]
+        else:
+            block = values[starts + counts[filled] - 1]
+        out[r0:r1][filled] = block
+    return out
+
+
+## Engine
+class SourceAligner:
+    """Register time series at their native resolution and join them on a common grid.
+
+    Every source is converted once to sorted UTC nanoseconds, whatever its index: naive
+    CET/CEST wall-clock time (ENTSO-E, Toledo), a fixed offset (the NTC export) or UTC
+    (GridRadar). build() then produces a table at any resolution:
+
+    - sources at the requested resolution or coarser are joined as of the start of each
+      row (a value holds over [t, t + resolution)), via one searchsorted per source;
+    - finer sources are aggregated over each row's interval with reduceat.
+
+    For example, a 15-minute table of generation, flows, NTC and PMU frequency::
+
+        aligner = SourceAligner()
+        aligner.register("generation", generation_df)
+        aligner.register("ntc", ntc_df, columns=["ntc_flow"])
+        aligner.register("pmu", PMUStore(store_dir), columns=["ES_Malaga"], how="mean")
+        table = aligner.build("15min", "2025-04-01", "2025-05-01")
+    """
+
+    def __init__(self):
+        self.sources = {}
+
+    def __repr__(self):
+        return f"SourceAligner({', '.join(f'{n}: {len(s.time)} rows' for n, s in self.sources.items())})"
+
+    def register(
+        self, name, data, resolution=None, tz=None, columns=None, how="mean", label="start"
+    ):
+        """Add a source.
+
+        Args:
+            name (str): Source name, the first column level of built tables
+            data (pd.DataFrame, pd.Series or pmu.PMUStore): Values with a DatetimeIndex,
+                or a store (read lazily)
+            resolution (str or pd.Timedelta, optional): Native resolution, the interval
+                each sample covers. Defaults to the median spacing.
+            tz (str, optional): Time zone of a naive index. Defaults to None, i.e. CET/CEST
+                wall-clock time with the repeated October hour in file order.
+            columns (list, optional): Columns to keep. Defaults to all.
+            how (str, optional): Aggregation when the source is finer than a build, one of
+                aggregations. Defaults to 'mean'.
+            label (str, optional): 'start' if timestamps label the start of their interval
+                (ENTSO-E MTUs, samples), 'end' if they label its end. Defaults to 'start'.
+
+        Returns:
+            SourceAligner: self
+        """
+        if how not in aggregations:
+            raise ValueError(f"Unknown aggregation: {how}")
+        if hasattr(data, "column") and hasattr(data, "time"):
+            # A PMUStore: UTC times, columns mapped from disk
+            columns = data.columns if columns is None else list(columns)
+            if not data.is_sorted:
+                raise ValueError("Stores need sorted timestamps to be aligned")
+            time, values = data.time, {c: data.column(c) for c in columns}
+        else:
+            if isinstance(data, pd.Series):
+                data = data.to_frame(name if data.name is None else data.name)
+            columns = list(data.columns) if columns is None else list(columns)
+            time = _utc_ns(data.index, tz)
+            keep = time != NAT
+            order = np.argsort(time[keep], kind="stable")
+            time = time[keep][order]
+            values = {c: data[c].to_numpy(dtype=np.float64)[keep][order] for c in columns}
+
+        step = _median_step(time) if resolution is None else pd.Timedelta(resolution).value
+        if label == "end":
+            time = time - step
+        elif label != "start":
+            raise ValueError(f"Unknown label option: {label}")
+        self.sources[name] = AlignedSource(time, values, columns, step, how)
+        return self
+
+    def build(
+        self, freq, start=None, end=None, tz="Europe/Madrid", sources=None, max_samples=10_000_000
+    ):
+        """Aligned table of the registered sources.
+
+        Args:
+            freq (str or pd.Timedelta): Resolution of the table
+            start (datetime-like, optional): First row (inclusive); naive bounds are read in
+                tz. Defaults to the earliest source sample.
+            end (datetime-like, optional): End of the last row (exclusive). Defaults to the
+                end of the latest source.
+            tz (str, optional): Time zone of the index (None for naive UTC). Defaults to
+                'Europe/Madrid'.
+            sources (list, optional): Sources to include. Defaults to all.
+            max_samples (int, optional): Samples of a fine source read per block. Defaults
+                to 10,000,000.
+
+        Returns:
+            pd.DataFrame: One row per interval [t, t + freq) with a tz-aware ``time``
+                index, and (source, column) columns; NaN where a source has no data
+        """
+        names = list(self.sources) if sources is None else list(sources)
+        selected = [self.sources[n] for n in names]
+        if start is None:
+            start = pd.Timestamp(min(s.time[0] for s in selected if len(s.time)), tz="UTC")
+        if end is None:
+            end = pd.Timestamp(
+                max(s.time[-1] + s.resolution for s in selected if len(s.time)), tz="UTC"
+            )
+        grid, step = _grid(freq, start, end, tz)
+
+        columns, blocks = [], []
+        for name, source in zip(names, selected):
+            for column in source.columns:
+                if source.resolution >= step:
+                    blocks.append(_asof(source, column, grid))
+                else:
+                    blocks.append(_aggregate(source, column, grid, step, source.how, max_samples))
+                columns.append((name, column))
+
+        return pd.DataFrame(
+            np.column_stack(blocks) if blocks else np.empty((len(grid), 0)),
+            index=to_datetime_index(grid, tz=tz, name="time"),
+            columns=pd.MultiIndex.from_tuples(columns, names=["source", "column"]),
+        )
+
+
+## Clock alignment
+# Fitted clock error of one series against a reference: lag(t) = offset + drift * (t - t0)
+ClockFit = namedtuple("ClockFit", ["windows", "offset", "drift", "t0"])
+
+
+def _on_grid(series, tz, grid, max_gap):
+    # Linear interpolation onto the grid; NaN where the series has a gap or no data
+    time = _utc_ns(series.index, tz)
+    values = series.to_numpy(dtype=np.float64)
+    keep = (time != NAT) & np.isfinite(values)
+    order = np.argsort(time[keep], kind="stable")
+    time, values = time[keep][order], values[keep][order]
+    out = np.full(len(grid), np.nan)
+    if len(time) < 2:
+        return out
+    out[:] = np.interp(grid, time, values)
+    after = np.clip(np.searchsorted(time, grid, side="left"), 1, len(time) - 1)
+    covered = (grid >= time[0]) & (grid <= time[-1]) & (time[after] - time[after - 1] <= max_gap)
+    out[~covered] = np.nan
+    return out
+
+
+def _windows(values, n_window, n_step):
+    # (windows, n_window) view of the grid, plus the share of samples with data per window
+    view = np.lib.stride_tricks.sliding_window_view(values, n_window)[::n_step]
+    return view, np.isfinite(view).mean(axis=1)
+
+
+def _spectra(windows, n_fft):
+    # Zero-mean, unit-norm windows (gaps as zeros) and their FFTs, all windows at once
+    x = np.where(np.isfinite(windows), windows, np.nan)
+    x = x - np.nanmean(x, axis=1, keepdims=True)
+    x = np.nan_to_num(x)
+    norm = np.sqrt((x**2).sum(axis=1, keepdims=True))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = np.where(norm > 0, x / norm, 0.0)
+    return np.fft.rfft(x, n=n_fft, axis=1)
+
+
+def _peak_lags(reference_spectra, other_spectra, n_fft, max_shift):
+    # Normalized cross-correlation of every window pair; lag in grid steps (> 0 when the
+    # other series is late), refined with a parabola through the peak
+    correlation = np.fft.irfft(np.conj(reference_spectra) * other_spectra, n=n_fft, axis=1)
+    shifts = np.arange(-max_shift, max_shift + 1)
+    correlation = correlation[:, shifts % n_fft]
+    best = np.argmax(correlation, axis=1)
+    rows = np.arange(len(correlation))
+    inner = (best > 0) & (best < len(shifts) - 1)
+    left = correlation[rows, np.maximum(best - 1, 0)]
+    center = correlation[rows, best]
+    right = correlation[rows, np.minimum(best + 1, len(shifts) - 1)]
+    denominator = left - 2 * center + right
+    with np.errstate(invalid="ignore", divide="ignore"):
+        refine = np.where(inner & (denominator < 0), 0.5 * (left - right) / denominator, 0.0)
+    return shifts[best] + refine, center
+
+
+def estimate_clock_offsets(
+    reference,
+    others,
+    resolution="100ms",
+    window="10min",
+    step="5min",
+    max_lag="10s",
+    start=None,
+    end=None,
+    tz=None,
+    differentiate=True,
+    min_coverage=0.9,
+    min_correlation=0.5,
+    fit_drift=True,
+):
+    """Estimate the clock offset, and optionally the drift, of series against a reference.
+
+    Every series is interpolated onto a common grid (e.g. 2 s Toledo data onto the 100 ms
+    grid of a PMU) and cut into sliding windows. The cross-correlation of each window
+    with the matching reference window is computed with one batched FFT per series, and
+    its peak within max_lag, refined between grid steps, is that window's lag. The
+    reference spectra are computed once and shared by all the other series. A weighted
+    line through the window lags gives the offset and drift.
+
+    Args:
+        reference (pd.Series): Reference frequency [Hz], e.g. a GridRadar PMU
+        others (dict or pd.Series): Series to check, by name
+        resolution (str, optional): Common grid step. Defaults to '100ms'.
+        window (str, optional): Window length. Defaults to '10min'.
+        step (str, optional): Window spacing. Defaults to '5min'.
+        max_lag (str, optional): Largest lag searched, either sign. Defaults to '10s'.
+        start (datetime-like, optional): Start of the compared span. Defaults to the
+            latest first sample.
+        end (datetime-like, optional): End of the compared span. Defaults to the earliest
+            last sample.
+        tz (str, optional): Time zone of naive indexes (see SourceAligner.register).
+            Defaults to CET/CEST wall-clock time.
+        differentiate (bool, optional): Correlate the changes over the coarsest sample
+            step (the RoCoF pattern) rather than the levels, which sharpens the peak.
+            Defaults to True.
+        min_coverage (float, optional): Share of grid points with data in both windows
+            for a window to count. Defaults to 0.9.
+        min_correlation (float, optional): Peak correlation for a window to count.
+            Defaults to 0.5.
+        fit_drift (bool, optional): Fit a drift; otherwise the offset is the weighted
+            median lag. Defaults to True.
+
+    Returns:
+        dict: Name -> ClockFit. windows is a DataFrame with one row per window ('time' of
+            its center, 'lag' [s], 'correlation', 'used'); offset [s] is the lag at t0
+            and drift [s/s] its rate of change. A positive lag means the series runs late.
+    """
+    others = {others.name: others} if isinstance(others, pd.Series) else dict(others)
+    step_ns = pd.Timedelta(resolution).value
+    n_window = int(pd.Timedelta(window).value // step_ns)
+    n_step = max(1, int(pd.Timedelta(step).value // step_ns))
+    max_shift = int(np.ceil(pd.Timedelta(max_lag).value / step_ns))
+    # Padding to at least twice the window keeps the correlation free of wrap-around
+    n_fft = 1 << int(np.ceil(np.log2(n_window + max_shift + 1)))
+
+    series_list = [reference] + list(others.values())
+    if start is None:
+        start = pd.Timestamp(
+            max(_utc_ns(s.dropna().index[:1], tz)[0] for s in series_list), tz="UTC"
+        )
+    if end is None:
+        end = pd.Timestamp(
+            min(_utc_ns(s.dropna().index[-1:], tz)[0] for s in series_list), tz="UTC"
+        )
+    grid, _ = _grid(resolution, start, end, "UTC")
+
+    # Differences over the coarsest native sample step, so a 2 s series is compared with
+    # the 2 s changes of a 100 ms one rather than with its sample-to-sample noise
+    native = {
+        id(s): _median_step(np.sort(_utc_ns(s.dropna().index[:100_000], tz))) for s in series_list
+    }
+    span = max(1, int(round(max(native.values()) / step_ns)))
+
+    def prepare(series):
+        # Gaps of more than a few native samples are not interpolated across
+        values = _on_grid(series, tz, grid, 4 * max(native[id(series)], step_ns))
+        if not differentiate:
+            return values
+        return np.concatenate([np.full(span, np.nan), values[span:] - values[:-span]])
+
+    reference_windows, reference_coverage = _windows(prepare(reference), n_window, n_step)
+    reference_spectra = _spectra(reference_windows, n_fft)
+    centers = grid[: len(grid) - n_window + 1][::n_step] + n_window * step_ns // 2
+    t0 = pd.Timestamp(int(grid[0]), tz="UTC")
+
+    fits = {}
+    for name, series in others.items():
+        windows, coverage = _windows(prepare(series), n_window, n_step)
+        shifts, correlation = _peak_lags(
+            reference_spectra, _spectra(windows, n_fft), n_fft, max_shift
+        )
+        lag = shifts * step_ns / 1e9
+        used = (np.minimum(coverage, reference_coverage) >= min_coverage) & (
+            correlation >= min_correlation
+        )
+        table = pd.DataFrame(
+            {"lag": lag, "correlation": correlation, "used": used},
+            index=to_datetime_index(centers, tz="Europe/Madrid", name="time"),
+        )
+
+        offset, drift = np.nan, 0.0
+        if used.any():
+            elapsed = (centers[used] - grid[0]) / 1e9
+            weights = correlation[used]
+            if fit_drift and used.sum() > 2:
+                drift, offset = np.polyfit(elapsed, lag[used], 1, w=weights)
+            else:
+                order = np.argsort(lag[used])
+                cumulative = np.cumsum(weights[order])
+                offset = lag[used][order][np.searchsorted(cumulative, cumulative[-1] / 2)]
+        fits[name] = ClockFit(table, float(offset), float(drift), t0)
+    return fits
+
+
+def corrected_index(index, fit, tz=None):
+    """Shift an index by a fitted clock error, onto the reference clock.
+
+    Args:
+        index (pd.DatetimeIndex): Index of the checked series
+        fit (ClockFit): From estimate_clock_offsets
+        tz (str, optional): Time zone of a naive index (see SourceAligner.register)
+
+    Returns:
+        pd.DatetimeIndex: Corrected index, in the time zone of index (Europe/Madrid for
+            naive indexes)
+    """
+    utc_ns = _utc_ns(index, tz)
+    elapsed = (utc_ns - fit.t0.value) / 1e9
+    if not np.isfinite(fit.offset):
+        raise ValueError("The clock fit has no usable windows")
+    lag_ns = np.round((fit.offset + fit.drift * elapsed) * 1e9).astype(np.int64)
+    corrected = np.where(utc_ns == NAT, NAT, utc_ns - lag_ns)
+    index = pd.DatetimeIndex(index)
+    return to_datetime_index(
+        corrected, tz=str(index.tz) if index.tz is not None else "Europe/Madrid", name=index.name
+    )
@@ -0,0 +1,252 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.timestamps import NS_PER_DAY
+
+BASELINE_VERSION = 2
+
+# Month -> season index for the season options
+season_months = {
+    "month": {m: m - 1 for m in range(1, 13)},
+    "meteorological": {12: 0, 1: 0, 2: 0, 3: 1, 4: 1, 5: 1, 6: 2, 7: 2, 8: 2, 9: 3, 10: 3, 11: 3},
+    None: {m: 0 for m in range(1, 13)},
+}
+
+
+def _wall_ns(index, tz):
+    # Naive indexes are CET/CEST wall-clock time (the loaders' default)
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert(tz).tz_localize(None)
+    return index.as_unit("ns").asi8
+
+
+## Sketch
+class QuantileBaseline:
+    """Mergeable quantile sketch of a quantity per time-of-day slot and season.
+
+    Every (season, slot) cell holds a histogram on fixed bins from lo to hi, plus an
+    under- and overflow bin, so memory is fixed by the bins and slots however many years
+    are added. Two baselines with the same configuration merge by adding their counts.
+
+    Args:
+        lo (float): Lower edge of the bins
+        hi (float): Upper edge of the bins
+        bin_width (float): Bin width, in the units of the quantity
+        freq (str or pd.Timedelta, optional): Slot width. Defaults to '15min'.
+        season (str, optional): 'month' (12 seasons), 'meteorological' (DJF, MAM, JJA,
+            SON) or None (one). Defaults to 'month'.
+        tz (str, optional): Wall clock for tz-aware data. Defaults to 'Europe/Madrid'.
+    """
+
+    def __init__(self, lo, hi, bin_width, freq="15min", season="month", tz="Europe/Madrid"):
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.bin_width = float(bin_width)
+        self.freq = pd.Timedelta(freq)
+        self.season = season
+        self.tz = tz
+        self.n_bins = int(np.ceil((self.hi - self.lo) / self.bin_width))
+        self.n_slots = NS_PER_DAY // self.freq.value
+        self.n_seasons = len(set(season_months[season].values()))
+        # Bin 0 is the underflow, bin n_bins + 1 the overflow
+        self.counts = np.zeros((self.n_seasons, self.n_slots, self.n_bins + 2), dtype=np.int64)
+        # Wall-clock days already added (sorted day numbers) and the latest time added on each
+        self.days = np.empty(0, dtype=np.int64)
+        self.day_last = np.empty(0, dtype=np.int64)
+
+    def __repr__(self):
+        return (
+            f"QuantileBaseline(lo={self.lo}, hi={self.hi}, bin_width={self.bin_width}, "
+            f"season={self.season!r}, samples={int(self.counts.sum())})"
+        )
+
+    def _cells(self, index):
+        wall_ns = _wall_ns(index, self.tz)
+        month = pd.DatetimeIndex(wall_ns.view("datetime64[ns]")).month.to_numpy()
+        season_of_month = np.array([season_months[self.season][m] for m in range(1, 13)])
+        slot = (wall_ns % NS_PER_DAY) // self.freq.value
+        return season_of_month[month - 1], slot
+
+    def _bins(self, values):
+        bins = np.floor((values - self.lo) / self.bin_width).astype(np.int64) + 1
+        return np.clip(bins, 0, self.n_bins + 1)
+
+    def _added(self, day, wall_ns):
+        # Rows at or before the latest time already added on their day
+        if not len(self.days):
+            return np.zeros(len(day), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.days, day), len(self.days) - 1)
+        return (self.days[pos] == day) & (wall_ns <= self.day_last[pos])
+
+    def _record(self, day, wall_ns):
+        # Merge days into the ingested days, keeping the latest time per day
+        days = np.concatenate([self.days, day])
+        last = np.concatenate([self.day_last, wall_ns])
+        order = np.lexsort((last, days))
+        days, last = days[order], last[order]
+        final = np.append(days[1:] != days[:-1], True)
+        self.days, self.day_last = days[final], last[final]
+
+    def update(self, series, exclude=None):
+        """Add samples, skipping rows that were already added.
+
+        Rows are deduplicated per wall-clock day: a day not seen before is added whole, so
+        older days can be backfilled in any order, and on a day already seen only rows
+        later than its latest added time are kept, so a day can be completed as rows arrive.
+
+        Args:
+            series (pd.Series): Values with a DatetimeIndex, e.g. new ENTSO-E rows
+            exclude (list, optional): Days (datetime-like) to leave out, e.g. the day under study
+
+        Returns:
+            QuantileBaseline: self
+        """
+        series = series.dropna()
+        index = pd.DatetimeIndex(series.index)
+        wall_ns = _wall_ns(index, self.tz)
+        day = wall_ns // NS_PER_DAY
+        keep = ~self._added(day, wall_ns)
+        if exclude is not None and len(series):
+            excluded = _wall_ns(
+                pd.DatetimeIndex([pd.Timestamp(d) for d in exclude]).normalize(), self.tz
+            )
+            keep &= ~np.isin(day, excluded // NS_PER_DAY)
+        if not keep.any():
+            return self
+
+        season, slot = self._cells(index[keep])
+        bins = self._bins(series.to_numpy(dtype=np.float64)[keep])
+        flat = np.ravel_multi_index((season, slot, bins), self.counts.shape)
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        self._record(day[keep], wall_ns[keep])
+        return self
+
+    def merge(self, other):
+        """Add the counts of a baseline with the same configuration (e.g. another zone or archive)."""
+        if self.counts.shape != other.counts.shape or (self.lo, self.bin_width) != (
+            other.lo,
+            other.bin_width,
+        ):
+            raise ValueError("Baselines with different bins or slots cannot be merged")
+        self.counts += other.counts
+        self._record(other.days, other.day_last)
+        return self
+
+    ## Queries
+    def _season_of(self, day):
+        return season_months[self.season][pd.Timestamp(day).month]
+
+    def _slot_labels(self):
+        return pd.Index(np.arange(self.n_slots) * self.freq.value / 3.6e12, name="time_of_day")
+
+    def _order_statistic(self, counts, cumulative, k):
+        # Value of the k-th smallest sample (0-based) per slot, with the samples of a bin
+        # spread evenly across it; under- and overflow collapse onto lo and hi
+        rows = np.arange(len(k))
+        b = np.minimum((cumulative <= k[:, None]).sum(axis=1), self.n_bins + 1)
+        before = np.where(b > 0, cumulative[rows, np.maximum(b - 1, 0)], 0.0)
+        in_bin = counts[rows, b]
+        fraction = (k - before + 0.5) / np.where(in_bin > 0, in_bin, 1.0)
+        inside = (b > 0) & (b <= self.n_bins)
+        value = self.lo + (b - 1 + fraction) * self.bin_width
+        return np.where(inside, value, np.where(b == 0, self.lo, self.hi))
+
+    def bands(self, day, percentiles=(5, 25, 50, 75, 95)):
+        """Percentile bands for every slot of a day's season.
+
+        Percentiles interpolate between order statistics as np.percentile does, so they
+        match percentiles of the raw samples to within bin_width.
+
+        Args:
+            day (datetime-like): Any day of the season
+            percentiles (tuple, optional): Defaults to (5, 25, 50, 75, 95).
+
+        Returns:
+            pd.DataFrame: One row per slot (time of day in hours), one column per percentile
+        """
+        counts = self.counts[self._season_of(day)].astype(np.float64)
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1]
+
+        out = np.full((self.n_slots, len(percentiles)), np.nan)
+        for j, p in enumerate(percentiles):
+            rank = np.maximum(total - 1, 0) * p / 100.0
+            below = np.floor(rank)
+            low = self._order_statistic(counts, cumulative, below)
+            high = self._order_statistic(
+                counts, cumulative, np.minimum(below + 1, np.maximum(total - 1, 0))
+            )
+            out[:, j] = np.where(total > 0, low + (rank - below) * (high - low), np.nan)
+        return pd.DataFrame(
+            out, index=self._slot_labels(), columns=pd.Index(list(percentiles), name="percentile")
+        )
+
+    def score(self, series):
+        """Rank a day's values against the baseline of their slot and season.
+
+        Args:
+            series (pd.Series): Values of the target day (any resolution; each sample is
+                ranked in its own slot)
+
+        Returns:
+            pd.DataFrame: 'value', 'percentile' (mid-rank, 0-100) and 'z' (the normal
+                quantile of the percentile), indexed like series
+        """
+        series = series.dropna()
+        season, slot = self._cells(series.index)
+        bins = self._bins(series.to_numpy(dtype=np.float64))
+        cumulative = np.cumsum(self.counts, axis=2)
+        total = cumulative[season, slot, -1].astype(np.float64)
+        below = np.where(bins > 0, cumulative[season, slot, np.maximum(bins - 1, 0)], 0)
+        within = self.counts[season, slot, bins]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rank = (below + 0.5 * within) / total
+        clipped = np.clip(rank, 0.5 / np.maximum(total, 1), 1 - 0.5 / np.maximum(total, 1))
+        normal = NormalDist()
+        z = np.array([normal.inv_cdf(r) if np.isfinite(r) else np.nan for r in clipped])
+        return pd.DataFrame(
+            {"value": series.to_numpy(), "percentile": 100 * rank, "z": z}, index=series.index
+        )
+
+    def anomaly_score(self, series):
+        """Mean z over a day's samples: negative when the day ran below its baseline."""
+        return float(np.nanmean(self.score(series)["z"]))
+
+    ## Persistence
+    def save(self, path):
+        """Write the sketch to an .npz file so later updates only add new rows."""
+        np.savez(
+            path,
+            version=BASELINE_VERSION,
+            counts=self.counts,
+            config=np.array([self.lo, self.hi, self.bin_width]),
+            freq=self.freq.value,
+            season=str(self.season),
+            tz=str(self.tz),
+            days=self.days,
+            day_last=self.day_last,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Read a sketch written by save."""
+        with np.load(path) as f:
+            if int(f["version"]) != BASELINE_VERSION:
+                raise ValueError(f"Unsupported baseline version in {path}")
+            lo, hi, bin_width = f["config"]
+            season = str(f["season"])
+            baseline = cls(
+                lo,
+                hi,
+                bin_width,
+                freq=pd.Timedelta(int(f["freq"]), "ns"),
+                season=None if season == "None" else season,
+                tz=str(f["tz"]),
+            )
+            baseline.counts = f["counts"].copy()
+            baseline.days = f["days"].copy()
+            baseline.day_last = f["day_last"].copy()
+        return baseline
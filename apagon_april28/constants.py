@@ -95,4 +95,10 @@ pmu_aliases = {
     'LV_Daugavpils': 'Latvia (Daugavpils)',
     'LV_Adazi': 'Latvia (Adazi)',
     'HR_STER': 'Croatia'
-}
\ No newline at end of file
+}
+
+# Frequency limits (ENTSO-E)
+nominal_frequency = 50.0  # Hz
+entsoe_rocof_limit = 1.25  # Hz/s, over a 500ms moving average
+fcr_saturation = 0.2  # Hz, FCR fully activated at +/- 200mHz
+fcr_continental_europe = 3000.0  # MW, sized for the 3 GW reference incident, shared by net generation
@@ -0,0 +1,311 @@
+import numpy as np
+import pandas as pd
+
+from apagon_april28.inertia import compute_inertia, stack_generation
+
+# Calendar levels, finest first, and the calendar axes each one keeps
+cube_levels = ["mtu", "hour", "day", "month", "year"]
+level_axes = {
+    "mtu": ["key", "year", "month", "day", "hour", "slot", "column"],
+    "hour": ["key", "year", "month", "day", "hour", "column"],
+    "day": ["key", "year", "month", "day", "column"],
+    "month": ["key", "year", "month", "column"],
+    "year": ["key", "year", "column"],
+}
+
+
+## Building
+def _split_index(index, key_levels):
+    # (codes, keys, times): a key code per row from the non-time levels, the sorted key
+    # tuples, and the time level
+    if not isinstance(index, pd.MultiIndex):
+        return np.zeros(len(index), dtype=np.int64), [()], pd.DatetimeIndex(index)
+    names = list(index.names[:-1])
+    if key_levels is None:
+        # A 'year' key (e.g. compute_inertia(..., names=['year'])) repeats the calendar year
+        key_levels = [name for name in names if name != "year"]
+    times = pd.DatetimeIndex(index.get_level_values(-1))
+    if not key_levels:
+        return np.zeros(len(index), dtype=np.int64), [()], times
+    keys = pd.MultiIndex.from_arrays([index.get_level_values(name) for name in key_levels])
+    codes, uniques = keys.factorize(sort=True)
+    return codes, list(uniques), times
+
+
+def build_calendar_cube(data, columns=None, key_levels=None, levels=None, dtype=np.float32):
+    """Aggregate an MTU-indexed frame into dense calendar arrays at every level at once.
+
+    Each level is an array with one axis per calendar field, e.g. the hour level has axes
+    (key, year, month, day, hour, column) with 12 months, 31 days and 24 hours. Dates
+    that do not exist (30 February) and hours without data (the skipped March hour) are
+    NaN; the repeated October hour is averaged into its wall-clock slot. Means are
+    computed from sums and counts at the MTU level, so every level matches a
+    groupby(...).mean() over the same fields.
+
+    Args:
+        data (pd.DataFrame): Values with a DatetimeIndex, or a MultiIndex whose last level
+            is the time (e.g. compute_inertia on a dict of zones and years). Times are
+            read as wall-clock time.
+        columns (list, optional): Columns to aggregate. Defaults to all.
+        key_levels (list, optional): Index levels forming the key axis (e.g. ['zone']).
+            Defaults to all non-time levels except 'year'.
+        levels (list, optional): Levels to materialize. Defaults to cube_levels.
+        dtype (np.dtype, optional): Storage type. Defaults to float32.
+
+    Returns:
+        CalendarCube
+    """
+    columns = list(data.columns) if columns is None else list(columns)
+    levels = cube_levels if levels is None else list(levels)
+    key_position, key_labels, times = _split_index(data.index, key_levels)
+    years = np.unique(times.year)
+    step_minutes = (
+        max(1, int(round(pd.Series(times).diff().abs().median() / pd.Timedelta("1min"))))
+        if len(times) > 1
+        else 60
+    )
+    slots_per_hour = max(1, 60 // min(step_minutes, 60))
+
+    shape = (len(key_labels), len(years), 12, 31, 24, slots_per_hour)
+    cell = np.ravel_multi_index(
+        (
+            key_position,
+            np.searchsorted(years, times.year),
+            times.month - 1,
+            times.day - 1,
+            times.hour,
+            times.minute * slots_per_hour // 60,
+        ),
+        shape,
+    )
+    n_cells = int(np.prod(shape))
+
+    arrays = {
+        level: np.empty(shape[: 6 - cube_levels.index(level)] + (len(columns),), dtype=dtype)
+        for level in levels
+    }
+    # One column at a time, so the float64 sums and counts never hold more than one column
+    for j, column in enumerate(columns):
+        values = data[column].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        sums = np.bincount(cell[valid], weights=values[valid], minlength=n_cells).reshape(shape)
+        counts = np.bincount(cell[valid], minlength=n_cells).reshape(shape)
+        for depth, level in enumerate(cube_levels):
+            if depth:
+                # Roll up one calendar axis (slot -> hour -> day -> month -> year)
+                sums = sums.sum(axis=-1)
+                counts = counts.sum(axis=-1)
+            if level in arrays:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    arrays[level][..., j] = sums / counts
+
+    return CalendarCube(arrays, key_labels, years, columns, slots_per_hour, key_levels=key_levels)
+
+
+def inertia_cube(
+    generation, inertia_constants=None, names=None, key_levels=None, levels=None, dtype=np.float32
+):
+    """Calendar cube of generation, generation shares and inertia from generation data.
+
+    Args:
+        generation (pd.DataFrame or dict): Generation [MW] per type, or a dict such as
+            {(zone, year): frame} (see inertia.stack_generation)
+        inertia_constants (pd.DataFrame, optional): Output of inertia.load_inertia_constants
+        names (list, optional): Index level names for the dict keys, e.g. ['zone', 'year']
+        key_levels, levels, dtype: See build_calendar_cube
+
+    Returns:
+        CalendarCube: Columns are the generation types [MW], 'Share <type>' [-], each type's
+            inertia contribution ('H <type>' [s]), 'Total Inertia', 'Kinetic Energy' and
+            'Total Generation'
+    """
+    values, index, types = stack_generation(generation, names=names)
+    inertia_df = compute_inertia(
+        pd.DataFrame(values, index=index, columns=types), inertia_constants
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = values / inertia_df["Total Generation"].to_numpy()[:, None]
+
+    frame = pd.concat(
+        [
+            pd.DataFrame(values, index=index, columns=types),
+            pd.DataFrame(shares, index=index, columns=[f"Share {t}" for t in types]),
+            inertia_df[types].add_prefix("H "),
+            inertia_df[["Total Inertia", "Kinetic Energy", "Total Generation"]],
+        ],
+        axis=1,
+    )
+    return build_calendar_cube(frame, key_levels=key_levels, levels=levels, dtype=dtype)
+
+
+## Cube
+class CalendarCube:
+    """Dense year/month/day/hour/MTU rollups of one or more MTU time series.
+
+    Built by build_calendar_cube or inertia_cube. select() answers calendar slices with
+    basic NumPy indexing, so the result is a view into the stored array, e.g. every April
+    day of every year at hourly resolution::
+
+        april = cube.select("hour", month=4, column="Total Inertia")  # (year, day, hour)
+
+    Args:
+        arrays (dict): Level name -> array with the axes in level_axes
+        keys (list): Key tuples along the key axis (a single () without key levels)
+        years (np.ndarray): Calendar years along the year axis
+        columns (list): Column names along the last axis
+        slots_per_hour (int): MTUs per hour at the 'mtu' level
+        key_levels (list, optional): Names of the key fields
+    """
+
+    def __init__(self, arrays, keys, years, columns, slots_per_hour, key_levels=None):
+        self.arrays = arrays
+        self.keys = list(keys)
+        self.years = np.asarray(years)
+        self.columns = list(columns)
+        self.slots_per_hour = slots_per_hour
+        self.key_levels = key_levels
+
+    def __repr__(self):
+        return (
+            f"CalendarCube(keys={len(self.keys)}, years={self.years.min()}-{self.years.max()}, "
+            f"columns={len(self.columns)}, levels={list(self.arrays)})"
+        )
+
+    def level(self, name):
+        """The full array of one level (axes in level_axes[name])."""
+        return self.arrays[name]
+
+    def _labels(self, axis):
+        if axis == "key":
+            return self.keys
+        if axis == "year":
+            return list(self.years)
+        if axis == "month":
+            return list(range(1, 13))
+        if axis == "day":
+            return list(range(1, 32))
+        if axis == "hour":
+            return list(range(24))
+        if axis == "slot":
+            return [i * 60 // self.slots_per_hour for i in range(self.slots_per_hour)]
+        return self.columns
+
+    def _position(self, axis, label):
+        labels = self._labels(axis)
+        if axis == "key" and not isinstance(label, tuple):
+            label = (label,)
+        try:
+            return labels.index(label)
+        except ValueError:
+            raise KeyError(f"{label!r} not in the {axis} axis") from None
+
+    def _indexer(self, axis, selection):
+        # None -> everything, a label -> one position (axis dropped), a slice of labels ->
+        # a range (inclusive, like .loc), a list -> fancy indexing (a copy)
+        if selection is None:
+            return slice(None)
+        if isinstance(selection, slice):
+            start = None if selection.start is None else self._position(axis, selection.start)
+            stop = None if selection.stop is None else self._position(axis, selection.stop) + 1
+            return slice(start, stop, selection.step)
+        if isinstance(selection, (list, np.ndarray)):
+            return [self._position(axis, label) for label in selection]
+        return self._position(axis, selection)
+
+    def select(
+        self, level, key=None, year=None, month=None, day=None, hour=None, slot=None, column=None
+    ):
+        """Slice a level by calendar labels.
+
+        Labels and slices of labels (inclusive at both ends, e.g. year=slice(2015, 2025))
+        give views; lists give copies. Axes selected by a single label are dropped. With
+        only one key the key axis is dropped unless key is given as a slice.
+
+        Args:
+            level (str): One of cube_levels
+            key, year, month, day, hour, slot, column: Selections per axis (months and days
+                start at 1, hours at 0, slots are minutes past the hour)
+
+        Returns:
+            np.ndarray: The selected block; the remaining axes keep their level_axes order
+        """
+        if key is None and len(self.keys) == 1:
+            key = self.keys[0]
+        selections = {
+            "key": key,
+            "year": year,
+            "month": month,
+            "day": day,
+            "hour": hour,
+            "slot": slot,
+            "column": column,
+        }
+        axes = level_axes[level]
+        for axis, selection in selections.items():
+            if selection is not None and axis not in axes:
+                raise ValueError(f"The {level} level has no {axis} axis")
+
+        array = self.arrays[level]
+        # Basic indexing (ints and slices) in one step keeps the result a view
+        indexers = [self._indexer(axis, selections[axis]) for axis in axes]
+        if not any(isinstance(i, list) for i in indexers):
+            return array[tuple(indexers)]
+        for position in reversed(range(len(axes))):
+            indexer = indexers[position]
+            if isinstance(indexer, list):
+                array = np.take(array, indexer, axis=position)
+            else:
+                array = array[(slice(None),) * position + (indexer,)]
+        return array
+
+    def to_frame(self, level, dropna=True, **selections):
+        """Materialize a selection as a DataFrame with one row per calendar cell.
+
+        Args:
+            level (str): One of cube_levels
+            dropna (bool, optional): Drop cells with no data in any column (nonexistent
+                dates, hours without data). Defaults to True.
+            **selections: As in select; column takes a name or a list of names
+
+        Returns:
+            pd.DataFrame: Indexed by the remaining calendar axes, one column per column
+        """
+        column = selections.pop("column", None)
+        columns = (
+            self.columns
+            if column is None
+            else ([column] if isinstance(column, str) else list(column))
+        )
+        block = self.select(level, column=None if column is None else columns, **selections)
+
+        remaining = []
+        for axis in level_axes[level][:-1]:
+            selection = selections.get(axis)
+            if axis == "key" and selection is None and len(self.keys) == 1:
+                continue
+            if selection is None:
+                remaining.append((axis, self._labels(axis)))
+            elif isinstance(selection, (slice, list, np.ndarray)):
+                labels = self._labels(axis)
+                indexer = self._indexer(axis, selection)
+                remaining.append(
+                    (
+                        axis,
+                        (
+                            [labels[i] for i in indexer]
+                            if isinstance(indexer, list)
+                            else labels[indexer]
+                        ),
+                    )
+                )
+
+        if remaining:
+            index = pd.MultiIndex.from_product(
+                [labels for _, labels in remaining], names=[axis for axis, _ in remaining]
+            )
+        else:
+            index = pd.RangeIndex(1)
+        frame = pd.DataFrame(
+            np.asarray(block).reshape(len(index), len(columns)), index=index, columns=columns
+        )
+        return frame.dropna(how="all") if dropna else frame
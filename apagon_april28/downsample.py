@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+# Above this many points per trace, plots switch from SVG Scatter to WebGL Scattergl
+webgl_point_threshold = 20_000
+
+
+## Helpers
+def _as_float_time(x):
+    if isinstance(x, pd.DatetimeIndex):
+        return x.as_unit("ns").asi8.astype(np.float64)
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def _time_buckets(t, n_buckets):
+    # Equal-width time buckets (one per horizontal pixel), so uneven sampling is handled
+    span = t[-1] - t[0]
+    if span <= 0:
+        return np.zeros(len(t), dtype=np.int64)
+    return np.minimum(((t - t[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+
+
+## Min/max
+def minmax_indices(x, y, n_buckets):
+    """Indices of the minimum and maximum sample in each time bucket.
+
+    Keeping both extrema per pixel column draws the same envelope as the raw data, so
+    nadirs and peaks are never lost. NaN gaps are preserved by keeping the first NaN
+    of each bucket that contains one.
+
+    Args:
+        x (array-like): Sorted timestamps (DatetimeIndex, datetime64 or numbers)
+        y (array-like): Values
+        n_buckets (int): Number of buckets, typically the plot width in pixels
+
+    Returns:
+        np.ndarray: Sorted, unique indices into x and y (at most 3 per bucket)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= 2 * n_buckets:
+        return np.arange(len(y))
+
+    bucket = _time_buckets(_as_float_time(x), n_buckets)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(y)])
+
+    is_nan = np.isnan(y)
+    low = np.fmin.reduceat(y, starts)
+    high = np.fmax.reduceat(y, starts)
+
+    # First position in each bucket where the bucket's min (max) is reached
+    keep = []
+    for target in (low, high):
+        hits = np.flatnonzero(y == np.repeat(target, counts))
+        _, first = np.unique(bucket[hits], return_index=True)
+        keep.append(hits[first])
+    nan_hits = np.flatnonzero(is_nan)
+    if len(nan_hits):
+        _, first = np.unique(bucket[nan_hits], return_index=True)
+        keep.append(nan_hits[first])
+    keep.append(np.array([0, len(y) - 1]))
+
+    return np.unique(np.concatenate(keep))
+
+
+## LTTB
+def _first_hits(values, targets, bucket, counts):
+    # First position in each bucket where the bucket's target value is reached
+    hits = np.flatnonzero(values == np.repeat(targets, counts))
+    _, first = np.unique(bucket[hits], return_index=True)
+    return hits[first]
+
+
+def lttb_indices(x, y, n_out, extrema=True):
+    """Largest-Triangle-Three-Buckets selection of about n_out representative points.
+
+    The buckets are processed in order because each choice depends on the previous one;
+    work inside a bucket is vectorized. LTTB keeps the visual shape but not the extremes,
+    so by default the minimum and maximum of every bucket are kept as well (up to three
+    points per bucket). NaN gaps are kept: the first NaN of every gap and the valid
+    samples on both sides of it are always selected, so lines break instead of crossing it.
+
+    Args:
+        x (array-like): Sorted timestamps (DatetimeIndex, datetime64 or numbers)
+        y (array-like): Values
+        n_out (int): Number of LTTB buckets, i.e. points before extrema and gap markers (at least 3)
+        extrema (bool, optional): Also keep each bucket's min and max. Defaults to True.
+
+    Returns:
+        np.ndarray: Sorted indices into x and y
+    """
+    y = np.asarray(y, dtype=np.float64)
+    is_nan = np.isnan(y)
+    valid = np.flatnonzero(~is_nan)
+    if len(y) <= n_out or n_out < 3:
+        return np.arange(len(y))
+    if len(valid) <= n_out:
+        selected = np.arange(len(valid))
+    else:
+        t = _as_float_time(x)[valid]
+        v = y[valid]
+        edges = np.linspace(1, len(valid) - 1, n_out - 1).astype(np.int64)
+
+        selected = np.empty(n_out, dtype=np.int64)
+        selected[0], selected[-1] = 0, len(valid) - 1
+        previous = 0
+        for k in range(n_out - 2):
+            lo, hi = edges[k], edges[k + 1]
+            next_lo, next_hi = hi, edges[k + 2] if k + 2 < len(edges) else len(valid)
+            t_next = t[next_lo:next_hi].mean() if next_hi > next_lo else t[-1]
+            v_next = v[next_lo:next_hi].mean() if next_hi > next_lo else v[-1]
+            area = np.abs(
+                (t[previous] - t_next) * (v[lo:hi] - v[previous])
+                - (t[previous] - t[lo:hi]) * (v_next - v[previous])
+            )
+            previous = lo + int(np.argmax(area))
+            selected[k + 1] = previous
+
+        if extrema:
+            starts = np.unique(edges[:-1])
+            counts = np.diff(np.r_[starts, len(valid)])
+            bucket = np.repeat(np.arange(len(starts)), counts)
+            tail = v[starts[0] :]
+            low = _first_hits(tail, np.minimum.reduceat(tail, starts - starts[0]), bucket, counts)
+            high = _first_hits(tail, np.maximum.reduceat(tail, starts - starts[0]), bucket, counts)
+            selected = np.concatenate([selected, starts[0] + low, starts[0] + high])
+
+    keep = [valid[selected]]
+    # Gap markers: first NaN of each gap and its valid neighbours
+    gap_start = np.flatnonzero(is_nan & ~np.r_[False, is_nan[:-1]])
+    gap_end = np.flatnonzero(is_nan & ~np.r_[is_nan[1:], False])
+    if len(gap_start):
+        neighbours = np.concatenate([gap_start - 1, gap_end + 1])
+        keep += [gap_start, neighbours[(neighbours >= 0) & (neighbours < len(y))]]
+
+    return np.unique(np.concatenate(keep))
+
+
+def downsample_indices(x, y, n_pixels, method="minmax"):
+    """Indices to keep when drawing (x, y) into a plot n_pixels wide.
+
+    Args:
+        x (array-like): Sorted timestamps
+        y (array-like): Values
+        n_pixels (int): Plot width in pixels
+        method (str, optional): 'minmax' (extrema-preserving) or 'lttb' (one bucket per
+            pixel, plus each bucket's extrema). Defaults to 'minmax'.
+
+    Returns:
+        np.ndarray: Sorted indices into x and y
+    """
+    if method == "minmax":
+        return minmax_indices(x, y, n_pixels)
+    if method == "lttb":
+        return lttb_indices(x, y, n_pixels)
+    raise ValueError(f"Unknown downsampling method: {method}")
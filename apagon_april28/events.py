@@ -0,0 +1,394 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.timestamps import bound_ns
+
+event_kinds = ("generation_loss", "nadir", "recovery", "separation", "loss_of_signal")
+event_columns = ["kind", "pmu", "time", "end", "value"]
+
+
+## Runs
+def _runs(mask):
+    """(column, start, stop) of every run of True in a 2-D mask, per column, rows [start, stop)."""
+    n_rows, n_cols = mask.shape
+    padded = np.zeros((n_cols, n_rows + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.T
+    edges = np.diff(padded, axis=1)
+    col_start, start = np.nonzero(edges == 1)
+    _, stop = np.nonzero(edges == -1)
+    return col_start, start, stop
+
+
+def _merge_close_runs(col, start, stop, gap):
+    """Join runs in the same column separated by fewer than gap rows."""
+    if len(col) == 0:
+        return col, start, stop
+    joins = (col[1:] == col[:-1]) & (start[1:] - stop[:-1] < gap)
+    first = np.r_[True, ~joins]
+    groups = np.cumsum(first) - 1
+    new_stop = np.zeros(first.sum(), dtype=stop.dtype)
+    np.maximum.at(new_stop, groups, stop)
+    return col[first], start[first], new_stop
+
+
+def _merge_intervals(events, tolerance_ns):
+    # Interval events found in overlapping chunks: union touching intervals per (kind, pmu)
+    if events.empty:
+        return events
+    events = events.sort_values(["kind", "pmu", "time"]).reset_index(drop=True)
+    group = events[["kind", "pmu"]].astype(str).agg("|".join, axis=1)
+    end_ns = events["end"].astype(np.int64)
+    running_end = end_ns.groupby(group).cummax()
+    previous_end = running_end.groupby(group).shift()
+    new_interval = previous_end.isna() | (
+        events["time"].astype(np.int64) > previous_end + tolerance_ns
+    )
+    interval = new_interval.cumsum()
+    value = events["value"]
+    peak = value.abs().groupby(interval).transform("max") == value.abs()
+    merged = events.groupby(interval).agg(
+        kind=("kind", "first"), pmu=("pmu", "first"), time=("time", "min"), end=("end", "max")
+    )
+    merged["value"] = value[peak].groupby(interval[peak]).first()
+    return merged.reset_index(drop=True)
+
+
+## Chunks
+def _time_chunks(time_ns, start_ns, end_ns, chunk_ns, overlap_ns):
+    # Row ranges of consecutive chunks, each padded by overlap on both sides, with the
+    # core [core_start, core_end) that owns point events
+    for core_start in range(start_ns, end_ns + 1, chunk_ns):
+        core_end = core_start + chunk_ns
+        i0 = int(np.searchsorted(time_ns, core_start - overlap_ns, side="left"))
+        i1 = int(np.searchsorted(time_ns, core_end + overlap_ns, side="left"))
+        if i1 > i0:
+            yield i0, i1, core_start, core_end
+
+
+def _source(data, columns):
+    # DataFrames (pmu_df) or a pmu.PMUStore; returns times (UTC ns), columns and a row reader
+    if isinstance(data, pd.DataFrame):
+        columns = list(data.columns) if columns is None else list(columns)
+        values = data[columns]
+        return (
+            data.index.as_unit("ns").asi8,
+            columns,
+            lambda i0, i1: values.iloc[i0:i1].to_numpy(dtype=np.float64),
+        )
+    columns = list(data.columns) if columns is None else list(columns)
+    maps = [data.column(c) for c in columns]
+    return (
+        np.asarray(data.time),
+        columns,
+        lambda i0, i1: np.column_stack([m[i0:i1] for m in maps]).astype(np.float64),
+    )
+
+
+## Detection
+def _gather(values, rows, cols, length, limit):
+    """(len(rows), length) windows values[rows + k, cols], NaN outside [0, limit)."""
+    index = rows[:, None] + np.arange(length)
+    inside = (index >= 0) & (index < limit[:, None])
+    window = values[np.clip(index, 0, len(values) - 1), cols[:, None]]
+    return np.where(inside, window, np.nan)
+
+
+def _trailing_mean(values, n):
+    """Mean of the finite values in rows [i - n, i) for every row i (NaN if none)."""
+    finite = np.isfinite(values)
+    sums = np.vstack(
+        [np.zeros((1, values.shape[1])), np.cumsum(np.where(finite, values, 0.0), axis=0)]
+    )
+    counts = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(finite, axis=0)])
+    lower = np.maximum(np.arange(len(values)) - n, 0)
+    upper = np.arange(len(values))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums[upper] - sums[lower]) / (counts[upper] - counts[lower])
+
+
+def _scan(time_ns, frequency, params):
+    """Events in one chunk, as a list of (kind, column, time_ns, end_ns, value) tuples."""
+    n_rows, n_cols = frequency.shape
+    found = []
+    if n_rows < 2:
+        return found
+    step_ns = int(np.median(np.diff(time_ns)))
+
+    # Loss of signal: NaN or implausible frequencies, plus gaps in the time axis
+    low, high = params["frequency_range"]
+    with np.errstate(invalid="ignore"):
+        invalid = np.isnan(frequency) | (frequency < low) | (frequency > high)
+    frequency = np.where(invalid, np.nan, frequency)
+    col, start, stop = _runs(invalid)
+    run_end = np.where(stop < n_rows, time_ns[np.minimum(stop, n_rows - 1)], time_ns[-1] + step_ns)
+    long_enough = run_end - time_ns[start] >= params["min_gap_ns"]
+    for c, s, e in zip(col[long_enough], start[long_enough], run_end[long_enough]):
+        found.append(("loss_of_signal", c, time_ns[s], e, (e - time_ns[s]) / 1e9))
+    gaps = np.flatnonzero(np.diff(time_ns) >= params["min_gap_ns"])
+    for i in gaps:
+        for c in range(n_cols):
+            found.append(
+                (
+                    "loss_of_signal",
+                    c,
+                    time_ns[i] + step_ns,
+                    time_ns[i + 1],
+                    (time_ns[i + 1] - time_ns[i] - step_ns) / 1e9,
+                )
+            )
+
+    # Generation loss: frequency falls by more than step_threshold within step_window.
+    # Runs closer than the refractory period are scanned together. The onset is the
+    # steepest single-sample drop; a run holds further onsets wherever a drop is the
+    # steepest within the refractory period and the fall steepens by step_threshold
+    # across it (a second loss while the frequency is already falling).
+    w = max(1, int(round(params["step_window_ns"] / step_ns)))
+    if n_rows > w:
+        change = frequency[w:] - frequency[:-w]
+        with np.errstate(invalid="ignore"):
+            falling = change < -params["step_threshold"]
+        refractory_n = max(1, int(params["refractory_ns"] / step_ns))
+        col, start, stop = _merge_close_runs(*_runs(falling), gap=refractory_n)
+        step = np.diff(frequency, axis=0)
+        nadir_n = int(params["nadir_window_ns"] / step_ns)
+        pre_n = w * 5
+
+        onset_col, onset_row = [], []
+        for c, s, e in zip(col, start, stop):
+            segment = step[s : e + w - 1, c]
+            if np.all(np.isnan(segment)):
+                continue
+            rows = [s + int(np.nanargmin(segment)) + 1]
+            if len(segment) > 2 * refractory_n:
+                filled = np.where(np.isnan(segment), np.inf, segment)
+                padded = np.pad(filled, refractory_n, constant_values=np.inf)
+                local_min = filled <= np.lib.stride_tricks.sliding_window_view(
+                    padded, 2 * refractory_n + 1
+                ).min(axis=1)
+                candidates = s + np.flatnonzero(local_min & np.isfinite(filled)) + 1
+                before = frequency[np.maximum(candidates - 1 - w, 0), c]
+                at = frequency[candidates - 1, c]
+                after = frequency[np.minimum(candidates - 1 + w, n_rows - 1), c]
+                with np.errstate(invalid="ignore"):
+                    steepens = (after - at) - (at - before) < -params["step_threshold"]
+                # Steepest first; ties (a linear ramp) keep only one onset per refractory period
+                candidates = candidates[steepens]
+                for row in candidates[np.argsort(step[candidates - 1, c], kind="stable")]:
+                    if all(abs(row - kept) > refractory_n for kept in rows):
+                        rows.append(int(row))
+                rows.sort()
+            onset_col.extend([c] * len(rows))
+            onset_row.extend(rows)
+
+        # Next onset of the same PMU, for every onset at once
+        onset_col = np.asarray(onset_col, dtype=np.int64)
+        onset_row = np.asarray(onset_row, dtype=np.int64)
+        order = np.lexsort((onset_row, onset_col))
+        onset_col, onset_row = onset_col[order], onset_row[order]
+        same_next = np.r_[onset_col[1:] == onset_col[:-1], False]
+        next_onset = np.where(same_next, np.r_[onset_row[1:], n_rows], n_rows)
+
+        # Drop, nadir and recovery of every onset from fixed-length windows gathered in blocks
+        pre_mean = _trailing_mean(frequency, pre_n)
+        for b0 in range(0, len(onset_row), 4096):
+            c, onset, following = (
+                onset_col[b0 : b0 + 4096],
+                onset_row[b0 : b0 + 4096],
+                next_onset[b0 : b0 + 4096],
+            )
+
+            # The fall of the windows that contain the drop
+            drop = _gather(change, onset - w, c, w, np.minimum(onset, len(change)))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                drop = np.nanmin(drop, axis=1)
+            found.extend(
+                ("generation_loss", cc, time_ns[o], None, float(d))
+                for cc, o, d in zip(c, onset, drop)
+            )
+
+            # Nadir: lowest frequency before the next loss on this PMU, within nadir_window
+            search = _gather(frequency, onset, c, nadir_n, following)
+            has_nadir = np.isfinite(search).any(axis=1)
+            nadir = onset + np.argmin(np.where(np.isfinite(search), search, np.inf), axis=1)
+            nadir_value = frequency[np.minimum(nadir, n_rows - 1), c]
+            found.extend(
+                ("nadir", cc, time_ns[i], None, float(v))
+                for cc, i, v in zip(c[has_nadir], nadir[has_nadir], nadir_value[has_nadir])
+            )
+
+            # Recovery: back within (1 - recovery_fraction) of the dip from the pre-event level
+            pre = pre_mean[onset, c]
+            target = pre - (1 - params["recovery_fraction"]) * (pre - nadir_value)
+            after = _gather(frequency, nadir, c, nadir_n, following)
+            with np.errstate(invalid="ignore"):
+                back = after >= target[:, None]
+            first = np.argmax(back, axis=1)
+            recovered = has_nadir & np.isfinite(pre) & back.any(axis=1)
+            found.extend(
+                ("recovery", cc, time_ns[i], None, float(frequency[i, cc]))
+                for cc, i in zip(c[recovered], nadir[recovered] + first[recovered])
+            )
+            # Slow recoveries, beyond one nadir_window after the nadir
+            late = has_nadir & np.isfinite(pre) & ~recovered & (following - nadir > nadir_n)
+            for cc, i, t, end in zip(c[late], nadir[late], target[late], following[late]):
+                with np.errstate(invalid="ignore"):
+                    back = np.flatnonzero(frequency[i + nadir_n : end, cc] >= t)
+                if len(back):
+                    j = i + nadir_n + int(back[0])
+                    found.append(("recovery", cc, time_ns[j], None, float(frequency[j, cc])))
+
+    # Separation: a PMU departs from the median of all PMUs for at least min_separation
+    if n_cols >= 3:
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows
+            deviation = frequency - np.nanmedian(frequency, axis=1, keepdims=True)
+            apart = np.abs(deviation) > params["separation_threshold"]
+        col, start, stop = _runs(apart)
+        run_end = time_ns[np.minimum(stop, n_rows - 1)]
+        long_enough = run_end - time_ns[start] >= params["min_separation_ns"]
+        for c, s, e, end in zip(
+            col[long_enough], start[long_enough], stop[long_enough], run_end[long_enough]
+        ):
+            peak = s + int(np.nanargmax(np.abs(deviation[s:e, c])))
+            found.append(("separation", c, time_ns[s], end, float(deviation[peak, c])))
+
+    return found
+
+
+def detect_events(
+    data,
+    columns=None,
+    start=None,
+    end=None,
+    step_window="1s",
+    step_threshold=0.015,
+    refractory="1s",
+    nadir_window="30s",
+    recovery_fraction=0.9,
+    separation_threshold=0.1,
+    min_separation="1s",
+    min_gap="1s",
+    frequency_range=(45.0, 55.0),
+    chunk="1D",
+    overlap="5min",
+    tz="Europe/Madrid",
+):
+    """Scan every PMU column for frequency events and return them as one table.
+
+    Event kinds (see event_kinds):
+
+    - ``generation_loss``: frequency falls by more than step_threshold within step_window;
+      the time is the steepest single-sample drop, the value the fall [Hz] (negative)
+    - ``nadir``: lowest frequency after a loss, before the next one or nadir_window [Hz]
+    - ``recovery``: first return to within 1 - recovery_fraction of the dip [Hz]
+    - ``separation``: a PMU more than separation_threshold away from the median of all
+      PMUs for at least min_separation; value is the largest deviation [Hz], 'end' is set
+    - ``loss_of_signal``: NaN, implausible (outside frequency_range) or missing samples for
+      at least min_gap; value is the duration [s], 'end' is set
+
+    The archive is processed in chunks (one day by default) padded with overlap on both
+    sides, and all PMU columns of a chunk are scanned at once with array operations, so
+    memory follows the chunk size and a month of 10 Hz data takes seconds.
+
+    Args:
+        data (pd.DataFrame or pmu.PMUStore): Frequencies [Hz], e.g. pmu_df or the store
+            from pmu.load_gridradar
+        columns (list, optional): PMUs to scan. Defaults to all.
+        start, end (datetime-like, optional): Time range. Defaults to all data. Naive
+            values are wall-clock times in the timezone of the DataFrame index, or in tz
+            for a store.
+        step_window, refractory, nadir_window, min_separation, min_gap, chunk, overlap
+            (str or pd.Timedelta, optional): Durations, see above
+        step_threshold (float, optional): Hz. Defaults to 0.015.
+        recovery_fraction (float, optional): Defaults to 0.9.
+        separation_threshold (float, optional): Hz. Defaults to 0.1.
+        frequency_range (tuple, optional): Plausible frequencies [Hz]. Defaults to (45, 55).
+        tz (str, optional): Timezone of 'time' and 'end'. Defaults to 'Europe/Madrid'.
+
+    Returns:
+        pd.DataFrame: One row per event with 'kind', 'pmu', 'time', 'end' (NaT for point
+            events) and 'value', sorted by time
+    """
+    time_ns, columns, read = _source(data, columns)
+    ns = lambda duration: pd.Timedelta(duration).value  # noqa: E731
+    params = {
+        "step_window_ns": ns(step_window),
+        "step_threshold": step_threshold,
+        "refractory_ns": ns(refractory),
+        "nadir_window_ns": ns(nadir_window),
+        "recovery_fraction": recovery_fraction,
+        "separation_threshold": separation_threshold,
+        "min_separation_ns": ns(min_separation),
+        "min_gap_ns": ns(min_gap),
+        "frequency_range": frequency_range,
+    }
+    if len(time_ns) == 0:
+        return pd.DataFrame(columns=event_columns)
+    # Naive bounds are wall-clock times in the timezone of the data (or tz for a store)
+    bounds_tz = data.index.tz if isinstance(data, pd.DataFrame) else ("UTC" if tz is None else tz)
+    start_ns = int(time_ns[0]) if start is None else bound_ns(start, bounds_tz)
+    end_ns = int(time_ns[-1]) if end is None else bound_ns(end, bounds_tz)
+
+    points, intervals = [], []
+    for i0, i1, core_start, core_end in _time_chunks(
+        time_ns, start_ns, end_ns, ns(chunk), ns(overlap)
+    ):
+        for kind, c, t, t_end, value in _scan(np.asarray(time_ns[i0:i1]), read(i0, i1), params):
+            if t_end is not None:
+                if t <= end_ns and t_end >= start_ns:
+                    intervals.append((kind, columns[c], t, t_end, value))
+            elif core_start <= t < core_end and start_ns <= t <= end_ns:
+                points.append((kind, columns[c], t, None, value))
+
+    step_ns = int(np.median(np.diff(time_ns[:1000]))) if len(time_ns) > 1 else 0
+    events = pd.concat(
+        [
+            pd.DataFrame(points, columns=event_columns).drop_duplicates(["kind", "pmu", "time"]),
+            _merge_intervals(pd.DataFrame(intervals, columns=event_columns), tolerance_ns=step_ns),
+        ],
+        ignore_index=True,
+    )
+    for column in ("time", "end"):
+        utc = pd.to_datetime(events[column].astype("Int64"), unit="ns", utc=True)
+        events[column] = utc if tz is None else utc.dt.tz_convert(tz)
+    return events.sort_values(["time", "kind", "pmu"]).reset_index(drop=True)[event_columns]
+
+
+## Helpers for plots
+def event_times(events, kinds=("generation_loss", "separation"), pmu=None):
+    """Event times for the ``events=`` argument of plots.create_frequency_plot.
+
+    Args:
+        events (pd.DataFrame): Output of detect_events
+        kinds (tuple, optional): Kinds to keep. Defaults to losses and separations.
+        pmu (str, optional): Keep one PMU's events. Defaults to all (duplicates removed).
+
+    Returns:
+        list: Sorted unique pd.Timestamps
+    """
+    selected = events[events["kind"].isin(kinds)]
+    if pmu is not None:
+        selected = selected[selected["pmu"] == pmu]
+    return sorted(selected["time"].unique())
+
+
+def unreliable_after(events, pmu="ES_Malaga", kinds=("loss_of_signal", "separation"), after=None):
+    """Start of the first loss-of-signal (or separation) of a PMU, e.g. for the RoCoF plots.
+
+    Args:
+        events (pd.DataFrame): Output of detect_events
+        pmu (str, optional): Defaults to 'ES_Malaga'.
+        kinds (tuple, optional): Kinds that make the data unreliable. Defaults to loss of
+            signal and separation.
+        after (datetime-like, optional): Ignore events before this time
+
+    Returns:
+        pd.Timestamp or None
+    """
+    selected = events[(events["pmu"] == pmu) & events["kind"].isin(kinds)]
+    if after is not None:
+        selected = selected[selected["time"] >= pd.Timestamp(after)]
+    return selected["time"].min() if len(selected) else None
@@ -0,0 +1,313 @@
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+inertia_constants_path = Path(__file__).parent / "inertia_constants.csv"
+
+
+## Inertia constants
+def load_inertia_constants(path=None):
+    """Load the per-generation-type inertia constants (from entsoe_InertiaRoCoF_2020).
+
+    Args:
+        path (str or Path, optional): CSV with ``generation_type`` and ``h_entsoe_sec``
+            columns. Defaults to the table shipped with the package.
+
+    Returns:
+        pd.DataFrame: Inertia constants indexed by generation type
+    """
+    path = inertia_constants_path if path is None else path
+    return pd.read_csv(path).set_index("generation_type")
+
+
+def inertia_vector(generation_types, inertia_constants=None, h_column="h_entsoe_sec"):
+    """Map generation types to their inertia constants in one lookup.
+
+    Types without a constant get H = 0, i.e. they add to total generation but not to
+    inertia, which is how the original notebook loop treated them.
+
+    Args:
+        generation_types (list): Generation type names, e.g. the columns of a generation frame
+        inertia_constants (pd.DataFrame, optional): Output of load_inertia_constants.
+            Defaults to the packaged table.
+        h_column (str, optional): Column holding H [s]. Defaults to 'h_entsoe_sec'.
+
+    Returns:
+        tuple: (h, missing) where h is a float64 array aligned with generation_types and
+            missing is the list of types with no constant
+    """
+    if inertia_constants is None:
+        inertia_constants = load_inertia_constants()
+    h = inertia_constants[h_column].reindex(list(generation_types)).to_numpy(dtype=np.float64)
+    missing = [g for g, value in zip(generation_types, h) if np.isnan(value)]
+    return np.nan_to_num(h, nan=0.0), missing
+
+
+## Stacking
+def stack_generation(generation, names=None):
+    """Stack one or many generation frames into a single (rows x types) array.
+
+    Args:
+        generation (pd.DataFrame or dict): A generation frame [MW] with one column per
+            type, or a dict mapping keys (e.g. year, or (zone, year)) to such frames
+        names (list, optional): Index level names for the dict keys
+
+    Returns:
+        tuple: (values, index, columns) where values is a float64 array, index is the
+            (Multi)Index of the stacked rows and columns is the union of generation types
+    """
+    if isinstance(generation, pd.DataFrame):
+        return generation.to_numpy(dtype=np.float64), generation.index, list(generation.columns)
+
+    columns = []
+    for df in generation.values():
+        columns.extend(c for c in df.columns if c not in columns)
+
+    blocks, keys = [], []
+    for key, df in generation.items():
+        blocks.append(df.reindex(columns=columns).to_numpy(dtype=np.float64))
+        keys.append(key if isinstance(key, tuple) else (key,))
+
+    values = np.concatenate(blocks, axis=0)
+    n_levels = len(keys[0])
+    arrays = [
+        np.repeat([k[level] for k in keys], [len(b) for b in blocks]) for level in range(n_levels)
+    ]
+    arrays.append(np.concatenate([df.index.to_numpy() for df in generation.values()]))
+    if names is None:
+        names = [None] * n_levels
+    first_index = next(iter(generation.values())).index
+    index = pd.MultiIndex.from_arrays(arrays, names=list(names) + [first_index.name])
+
+    return values, index, columns
+
+
+def row_hours(index):
+    """Hours each row of a (stacked) index stands for.
+
+    A row lasts until the next row of the same key block (e.g. the same year), so hourly
+    and 15-minute blocks can be stacked together. The last row of a block repeats the
+    block's previous spacing; a block of one row counts as one hour.
+
+    Args:
+        index (pd.Index or pd.MultiIndex): Datetime index, or the index of stack_generation
+            whose innermost level holds the times
+
+    Returns:
+        np.ndarray: Float64 hours per row
+    """
+    is_multi = isinstance(index, pd.MultiIndex)
+    times = pd.Series(index.get_level_values(-1) if is_multi else index)
+    hours = (times.shift(-1) - times) / pd.Timedelta("1h")
+    if is_multi and index.nlevels > 1:
+        block = pd.Series(index.droplevel(-1).factorize()[0])
+    else:
+        block = pd.Series(np.zeros(len(index), dtype=np.int64))
+    hours[block.shift(-1) != block] = np.nan
+    return hours.groupby(block).ffill().fillna(1.0).clip(lower=0.0).to_numpy(dtype=np.float64)
+
+
+## Inertia
+def compute_inertia(
+    generation, inertia_constants=None, names=None, contributions=True, min_total_inertia=0.1
+):
+    """Compute per-type contributions, total inertia and kinetic energy for any number of
+    years and bidding zones at once.
+
+    All input rows are stacked into one array, so the whole computation is a single
+    matrix-vector product regardless of how many years or zones are passed.
+
+    Args:
+        generation (pd.DataFrame or dict): Generation [MW] per type, or a dict mapping keys
+            such as year or (zone, year) to generation frames
+        inertia_constants (pd.DataFrame, optional): Output of load_inertia_constants.
+            Defaults to the packaged table.
+        names (list, optional): Index level names for the dict keys, e.g. ['zone', 'year']
+        contributions (bool, optional): Include one column per generation type with its
+            share-weighted contribution to H. Defaults to True.
+        min_total_inertia (float, optional): Total inertia below this value [s] is set to
+            NaN (outages and missing data). Defaults to 0.1.
+
+    Returns:
+        pd.DataFrame: Columns for each type's contribution [s] (optional), 'Total Inertia' [s],
+            'Kinetic Energy' [MW s] and 'Total Generation' [MW]
+    """
+    values, index, columns = stack_generation(generation, names=names)
+    h, _ = inertia_vector(columns, inertia_constants)
+
+    filled = np.nan_to_num(values, nan=0.0)
+    total_generation = filled.sum(axis=1)
+    kinetic_energy = filled @ h
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total_inertia = kinetic_energy / total_generation
+    total_inertia = np.where(total_inertia < min_total_inertia, np.nan, total_inertia)
+
+    result = {}
+    if contributions:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shares = values / total_generation[:, None]
+        contribution_values = shares * h
+        for i, column in enumerate(columns):
+            result[column] = contribution_values[:, i]
+    result["Total Inertia"] = total_inertia
+    result["Kinetic Energy"] = kinetic_energy
+    result["Total Generation"] = total_generation
+
+    return pd.DataFrame(result, index=index)
+
+
+## Synthetic inertia scenarios
+InertiaSweep = namedtuple("InertiaSweep", ["summary", "cube", "index", "scenarios"])
+
+
+def synthetic_inertia(
+    shares, synthetic_types=("Solar",), synthetic_constant=4.0, adoption_rate=0.333
+):
+    """Synthetic inertia [s] from inverter-based generation, as in inertia.qmd.
+
+    Args:
+        shares (pd.DataFrame): Share of total generation per type
+        synthetic_types (tuple, optional): Types providing synthetic inertia. Defaults to ('Solar',).
+        synthetic_constant (float, optional): H of the synthetic inertia [s]. Defaults to 4.
+        adoption_rate (float, optional): Fraction of that generation providing it. Defaults to 0.333.
+
+    Returns:
+        pd.Series: Synthetic inertia [s]
+    """
+    present = [t for t in synthetic_types if t in shares.columns]
+    return shares[present].sum(axis=1) * synthetic_constant * adoption_rate
+
+
+def synthetic_inertia_sweep(
+    generation,
+    synthetic_constants,
+    adoption_rates,
+    h_overrides=None,
+    synthetic_types=("Solar",),
+    inertia_constants=None,
+    names=None,
+    threshold=2.0,
+    min_total_inertia=0.1,
+    keep_cube=True,
+    max_cells=20_000_000,
+):
+    """Total inertia (physical + synthetic) for every scenario of a grid, in one broadcast.
+
+    The generation shares are stacked into one (rows x types) array once. Each H scenario
+    (the packaged constants with some types overridden) is a column of an H matrix, so the
+    physical inertia of all scenarios is one matrix product. The synthetic inertia of every
+    constant x adoption rate is broadcast on top. Rows are processed in chunks of at most
+    max_cells cube cells, so memory stays bounded for large grids; summary statistics are
+    accumulated chunk by chunk. Hours below the threshold sum the duration of each row
+    (see row_hours), so blocks of different resolution can be swept together.
+
+    Args:
+        generation (pd.DataFrame or dict): Generation [MW] per type, or a dict such as
+            {year: frame} (see stack_generation)
+        synthetic_constants (array-like): H of the synthetic inertia [s]
+        adoption_rates (array-like): Fractions of synthetic_types providing it
+        h_overrides (dict, optional): Scenario name -> {generation type: H [s]} replacing
+            the packaged constants. Defaults to {'entsoe': {}} (the constants as they are).
+        synthetic_types (tuple, optional): Types providing synthetic inertia. Defaults to ('Solar',).
+        inertia_constants (pd.DataFrame, optional): Output of load_inertia_constants
+        names (list, optional): Index level names for the dict keys, e.g. ['year']
+        threshold (float, optional): Minimum acceptable total inertia [s]. Defaults to 2.
+        min_total_inertia (float, optional): Rows whose physical inertia is below this
+            value [s] are treated as missing, as in compute_inertia. Defaults to 0.1.
+        keep_cube (bool, optional): Return the dense cube; False keeps only the summary.
+            Defaults to True.
+        max_cells (int, optional): Cube cells per chunk. Defaults to 20,000,000.
+
+    Returns:
+        InertiaSweep: ``summary`` (pd.DataFrame indexed by scenario, constant and adoption
+            rate with 'hours_below', 'share_below', 'min_inertia' and 'worst_time'), ``cube``
+            (float32 array of shape (rows, scenarios, constants, adoption rates), or None),
+            ``index`` (the stacked row index) and ``scenarios`` (the override names)
+    """
+    values, index, columns = stack_generation(generation, names=names)
+    h, _ = inertia_vector(columns, inertia_constants)
+    h_overrides = {"entsoe": {}} if h_overrides is None else h_overrides
+    scenarios = list(h_overrides)
+
+    # (types x scenarios) H matrix
+    h_matrix = np.repeat(h[:, None], len(scenarios), axis=1)
+    for k, overrides in enumerate(h_overrides.values()):
+        for generation_type, value in overrides.items():
+            if generation_type in columns:
+                h_matrix[columns.index(generation_type), k] = value
+
+    constants = np.asarray(synthetic_constants, dtype=np.float64)
+    rates = np.asarray(adoption_rates, dtype=np.float64)
+    synthetic_gain = constants[:, None] * rates[None, :]
+    synthetic_columns = [columns.index(t) for t in synthetic_types if t in columns]
+    grid_shape = (len(scenarios), len(constants), len(rates))
+
+    n_rows = len(values)
+    cube = np.empty((n_rows,) + grid_shape, dtype=np.float32) if keep_cube else None
+    hours = row_hours(index)
+    n_below = np.zeros(grid_shape, dtype=np.int64)
+    hours_below = np.zeros(grid_shape)
+    n_valid = np.zeros(grid_shape, dtype=np.int64)
+    min_inertia = np.full(grid_shape, np.inf)
+    worst_row = np.full(grid_shape, -1, dtype=np.int64)
+
+    chunk_rows = max(1, max_cells // int(np.prod(grid_shape)))
+    for r0 in range(0, n_rows, chunk_rows):
+        filled = np.nan_to_num(values[r0 : r0 + chunk_rows], nan=0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shares = filled / filled.sum(axis=1, keepdims=True)
+        physical = shares @ h_matrix
+        physical[~(physical >= min_total_inertia)] = np.nan
+        synthetic = shares[:, synthetic_columns].sum(axis=1)
+
+        total = (
+            physical[:, :, None, None]
+            + synthetic[:, None, None, None] * synthetic_gain[None, None, :, :]
+        )
+        if keep_cube:
+            cube[r0 : r0 + len(total)] = total
+
+        valid = ~np.isnan(total)
+        n_valid += valid.sum(axis=0)
+        below = total < threshold
+        n_below += below.sum(axis=0)
+        hours_below += np.tensordot(hours[r0 : r0 + len(total)], below, axes=1)
+        chunk_min = np.where(valid, total, np.inf)
+        chunk_argmin = chunk_min.argmin(axis=0)
+        chunk_min = np.take_along_axis(chunk_min, chunk_argmin[None], axis=0)[0]
+        lower = chunk_min < min_inertia
+        min_inertia[lower] = chunk_min[lower]
+        worst_row[lower] = r0 + chunk_argmin[lower]
+
+    summary = pd.DataFrame(
+        {
+            "hours_below": hours_below.ravel(),
+            "share_below": n_below.ravel() / np.maximum(n_valid.ravel(), 1),
+            "min_inertia": np.where(np.isinf(min_inertia), np.nan, min_inertia).ravel(),
+            "worst_time": [index[i] if i >= 0 else None for i in worst_row.ravel()],
+        },
+        index=pd.MultiIndex.from_product(
+            [scenarios, constants, rates],
+            names=["scenario", "synthetic_constant", "adoption_rate"],
+        ),
+    )
+    return InertiaSweep(summary, cube, index, scenarios)
+
+
+def minimum_adoption_rate(summary, max_hours_below=0.0):
+    """Lowest adoption rate that keeps the hours below threshold within max_hours_below.
+
+    Args:
+        summary (pd.DataFrame): ``summary`` of synthetic_inertia_sweep
+        max_hours_below (float, optional): Hours allowed below the threshold. Defaults to 0.
+
+    Returns:
+        pd.Series: Adoption rate per scenario and synthetic constant (NaN if none of the
+            rates in the grid is enough)
+    """
+    ok = summary["hours_below"] <= max_hours_below
+    rates = pd.Series(summary.index.get_level_values("adoption_rate"), index=summary.index)
+    return rates.where(ok).groupby(level=["scenario", "synthetic_constant"]).min()
@@ -0,0 +1,340 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.constants import nominal_frequency
+from apagon_april28.inertia import compute_inertia
+
+# Frequencies shared with every worker, set once per process by _init_worker
+_worker_source = {}
+
+
+## Events
+def event_onsets(events, kinds=("generation_loss",), tolerance="2s"):
+    """Collapse per-PMU detections into one onset per event.
+
+    Detections (e.g. from events.detect_events) less than tolerance apart belong to the
+    same event; its onset is the earliest of them.
+
+    Args:
+        events (pd.DataFrame): Event table with 'kind' and 'time' columns
+        kinds (tuple, optional): Kinds to use. Defaults to generation losses.
+        tolerance (str or pd.Timedelta, optional): Defaults to '2s'.
+
+    Returns:
+        pd.Series: Onset times, one per event, sorted
+    """
+    times = events.loc[events["kind"].isin(kinds), "time"].sort_values()
+    if len(times) == 0:
+        return times.reset_index(drop=True)
+    new_event = times.diff() > pd.Timedelta(tolerance)
+    return times.groupby(new_event.cumsum().to_numpy()).min().reset_index(drop=True).rename("time")
+
+
+def islanded(events, onsets, zone="ES"):
+    """Whether the zone was separated from the synchronous area at each onset.
+
+    A zone counts as islanded when one of its PMUs (named '<zone>_...') is inside a
+    'separation' interval of the event table at the onset.
+
+    Args:
+        events (pd.DataFrame): Output of events.detect_events
+        onsets (pd.Series): Onset times, e.g. from event_onsets
+        zone (str, optional): Defaults to 'ES'.
+
+    Returns:
+        np.ndarray: Boolean per onset
+    """
+    separations = events[
+        (events["kind"] == "separation") & events["pmu"].str.startswith(f"{zone}_")
+    ]
+    onset_ns = pd.DatetimeIndex(onsets).as_unit("ns").asi8
+    start_ns = pd.DatetimeIndex(separations["time"]).as_unit("ns").asi8
+    end_ns = pd.DatetimeIndex(separations["end"]).as_unit("ns").asi8
+    return ((onset_ns[:, None] >= start_ns[None, :]) & (onset_ns[:, None] <= end_ns[None, :])).any(
+        axis=1
+    )
+
+
+## Power imbalance
+def net_import(flows, zone="ES"):
+    """Net physical import into a bidding zone [MW] from one or many flow exports.
+
+    Args:
+        flows (pd.DataFrame or list): Output(s) of loaders.load_entsoe_flows, with
+            'CTA|XX > CTA|YY' columns
+        zone (str, optional): Defaults to 'ES'.
+
+    Returns:
+        pd.Series: Imports minus exports [MW]
+    """
+    frames = [flows] if isinstance(flows, pd.DataFrame) else list(flows)
+    # Naive wall-clock indexes repeat the October hour; keep its first (CEST) copy
+    frames = [df[~df.index.duplicated()].sort_index() for df in frames]
+    index = frames[0].index
+    for df in frames[1:]:
+        index = index.union(df.index)
+
+    total = pd.Series(0.0, index=index, name="Net Import")
+    for df in frames:
+        # Hourly exports hold their value over the quarter-hours of a finer one
+        step = df.index.to_series().diff().median()
+        df = df.reindex(index, method="ffill", tolerance=step - pd.Timedelta(1, "ns"))
+        for column in df.columns:
+            source, _, sink = column.partition(" > ")
+            if sink.endswith(f"|{zone}"):
+                total += df[column].fillna(0.0)
+            elif source.endswith(f"|{zone}"):
+                total -= df[column].fillna(0.0)
+    return total
+
+
+def _wall_clock(times, index):
+    # Events are tz-aware; ENTSO-E frames default to naive CET/CEST wall-clock time
+    times = pd.DatetimeIndex(times)
+    if index.tz is None:
+        return times.tz_convert("Europe/Madrid").tz_localize(None)
+    return times.tz_convert(index.tz)
+
+
+def imbalance_estimates(onsets, generation, flows=None, zone="ES"):
+    """Size of the power imbalance behind each event from the MTU data around it.
+
+    The imbalance is the drop in total generation from the MTU before the event to the
+    MTU after it (the MTU containing the event mixes both states). With flow data, the
+    rise in net import over the same MTUs is a second estimate, and the imbalance is the
+    mean of the two.
+
+    Args:
+        onsets (array-like): Event onset times (tz-aware)
+        generation (pd.DataFrame): Generation [MW] per type, from loaders.load_entsoe_generation
+        flows (pd.DataFrame or list, optional): Cross-border flows (see net_import)
+        zone (str, optional): Bidding zone for the flows. Defaults to 'ES'.
+
+    Returns:
+        pd.DataFrame: 'mtu', 'total_generation', 'generation_drop', 'import_rise' and
+            'imbalance' [MW], one row per onset
+    """
+    index = generation.index
+    total_generation = generation.sum(axis=1, min_count=1).to_numpy(dtype=np.float64)
+    position = index.searchsorted(_wall_clock(onsets, index), side="right") - 1
+    inside = (position >= 1) & (position < len(index) - 1)
+    before = np.where(inside, position - 1, 0)
+    after = np.where(inside, position + 1, 0)
+
+    generation_drop = np.where(inside, total_generation[before] - total_generation[after], np.nan)
+    imbalance = generation_drop
+    import_rise = np.full(len(position), np.nan)
+    if flows is not None:
+        imports = net_import(flows, zone).reindex(index).to_numpy(dtype=np.float64)
+        import_rise = np.where(inside, imports[after] - imports[before], np.nan)
+        imbalance = np.nanmean(np.column_stack([generation_drop, import_rise]), axis=1)
+
+    return pd.DataFrame(
+        {
+            "mtu": index[np.clip(position, 0, len(index) - 1)],
+            "total_generation": np.where(
+                inside, total_generation[np.clip(position, 0, len(index) - 1)], np.nan
+            ),
+            "generation_drop": generation_drop,
+            "import_rise": import_rise,
+            "imbalance": imbalance,
+        }
+    )
+
+
+## Onset RoCoF
+def _init_worker(source):
+    global _worker_source
+    if "store_dir" in source:
+        from apagon_april28.pmu import PMUStore
+
+        store = PMUStore(source["store_dir"])
+        source = {"time": store.time, "columns": [store.column(c) for c in source["columns"]]}
+    _worker_source = source
+
+
+def _slopes(t, f, valid):
+    # Least-squares slope of f against t along axis 1, ignoring invalid samples
+    n = valid.sum(axis=1)
+    t = np.where(valid, t, 0.0)
+    f = np.where(valid, f, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_mean = t.sum(axis=1) / n
+        f_mean = f.sum(axis=1) / n
+        dt = np.where(valid, t - t_mean[:, None], 0.0)
+        return (dt * (f - f_mean[:, None])).sum(axis=1) / (dt * dt).sum(axis=1), n
+
+
+def _onset_rocof(onset_ns, fit_ns, pre_ns):
+    """RoCoF at the onset of every event in a batch; runs in a worker process.
+
+    Returns (rocof, rocof_spread, n_samples): centre-of-inertia RoCoF over the fit window
+    minus the pre-event trend [Hz/s], the standard deviation of the per-PMU RoCoF, and the
+    number of samples in the fit window.
+    """
+    time_ns = _worker_source["time"]
+    columns = _worker_source["columns"]
+    step_ns = int(np.median(np.diff(time_ns[:1000])))
+    n_pre = max(2, int(round(pre_ns / step_ns)))
+    n_fit = max(2, int(round(fit_ns / step_ns)) + 1)
+    # A detection marks the first sample after the drop began; start from the one before
+    onset_ns = onset_ns - step_ns
+
+    # (events, samples) row numbers of the pre-event and fit windows
+    first = np.searchsorted(time_ns, onset_ns, side="left")
+    rows = first[:, None] + np.arange(-n_pre, n_fit)[None, :]
+    in_range = (rows >= 0) & (rows < len(time_ns))
+    rows = np.clip(rows, 0, len(time_ns) - 1)
+    t = (time_ns[rows] - onset_ns[:, None]) / 1e9
+    # (events, samples, pmus) frequencies
+    f = np.stack(
+        [
+            np.asarray(column[rows.ravel()], dtype=np.float64).reshape(rows.shape)
+            for column in columns
+        ],
+        axis=2,
+    )
+    f[~in_range] = np.nan
+
+    pre_window = (t < 0) & (t >= -pre_ns / 1e9)
+    fit_window = (t >= 0) & (t <= fit_ns / 1e9)
+    with np.errstate(invalid="ignore"):
+        coi = np.nanmean(f, axis=2)
+    coi_valid = ~np.isnan(coi)
+    trend, _ = _slopes(t, coi, coi_valid & pre_window)
+    slope, n_samples = _slopes(t, coi, coi_valid & fit_window)
+
+    per_pmu = np.full((len(onset_ns), f.shape[2]), np.nan)
+    for j in range(f.shape[2]):
+        valid = ~np.isnan(f[:, :, j]) & fit_window
+        per_pmu[:, j], _ = _slopes(t, f[:, :, j], valid)
+    with np.errstate(invalid="ignore"):
+        spread = np.nanstd(per_pmu, axis=1)
+
+    return slope - np.nan_to_num(trend), spread, n_samples
+
+
+def _frequency_source(data, columns):
+    # A DataFrame (pmu_df) is shipped to every worker once; a pmu.PMUStore is re-opened
+    # (memory-mapped) in each worker from its directory
+    if isinstance(data, pd.DataFrame):
+        columns = list(data.columns) if columns is None else list(columns)
+        return {
+            "time": data.index.as_unit("ns").asi8,
+            "columns": [data[c].to_numpy(dtype=np.float64) for c in columns],
+        }
+    columns = list(data.columns) if columns is None else list(columns)
+    return {"store_dir": str(data.store_dir), "columns": columns}
+
+
+## Estimation
+def estimate_inertia(
+    events,
+    pmu_data,
+    generation,
+    flows=None,
+    inertia_constants=None,
+    columns=None,
+    kinds=("generation_loss",),
+    tolerance="2s",
+    fit_window="500ms",
+    pre_window="2s",
+    f0=nominal_frequency,
+    zone="ES",
+    batch_size=256,
+    max_workers=None,
+):
+    """Estimate the kinetic energy behind every detected event and, where the zone was
+    islanded, compare its inertia with the constant-based estimate for the same MTU.
+
+    From the swing equation at the onset of an imbalance dP [MW], before any reserve has
+    responded, RoCoF = -f0 * dP / (2 * E), so the kinetic energy E [MW s] is
+    f0 * dP / (2 * |RoCoF|). RoCoF is the least-squares slope of the centre-of-inertia
+    frequency (mean over PMUs) over fit_window after the onset, less the trend over
+    pre_window before it.
+
+    E is the kinetic energy of whatever synchronous area the imbalance acted on. While
+    the zone is connected to Continental Europe that is the whole area, far more than the
+    zone's own generation, so H = E / S (S the total generation of the MTU, the base of
+    inertia.compute_inertia) is only computed for events during which the zone was
+    islanded (see islanded). For those, pass the zone's PMUs as columns so the
+    centre-of-inertia frequency is the island's.
+
+    Events are split into batches handled by a process pool; within a batch the windows
+    of all events and PMUs are read as one array.
+
+    Args:
+        events (pd.DataFrame): Output of events.detect_events
+        pmu_data (pd.DataFrame or pmu.PMUStore): Frequencies [Hz], e.g. the store from
+            pmu.load_gridradar (preferred for multi-month archives)
+        generation (pd.DataFrame): Generation [MW] per type covering the events
+        flows (pd.DataFrame or list, optional): Cross-border flows (see imbalance_estimates)
+        inertia_constants (pd.DataFrame, optional): Output of inertia.load_inertia_constants
+        columns (list, optional): PMUs for the centre-of-inertia frequency. Defaults to all.
+        kinds (tuple, optional): Event kinds to estimate from. Defaults to generation losses.
+        tolerance (str, optional): Detections closer than this are one event. Defaults to '2s'.
+        fit_window (str, optional): RoCoF window after the onset. Defaults to '500ms'.
+        pre_window (str, optional): Window for the pre-event trend. Defaults to '2s'.
+        f0 (float, optional): Nominal frequency [Hz]. Defaults to 50.
+        zone (str, optional): Bidding zone of the generation and flows. Defaults to 'ES'.
+        batch_size (int, optional): Events per worker task. Defaults to 256.
+        max_workers (int, optional): Worker processes. Defaults to os.cpu_count(); 1 runs
+            in this process.
+
+    Returns:
+        pd.DataFrame: One row per event with 'time', 'rocof' [Hz/s], 'rocof_spread',
+            'n_samples', the imbalance_estimates columns, 'islanded',
+            'kinetic_energy_measured' [MW s], 'h_measured' [s] (NaN unless islanded),
+            'h_constants' [s] and 'h_ratio' (measured / constants)
+    """
+    onsets = event_onsets(events, kinds=kinds, tolerance=tolerance)
+    onset_ns = pd.DatetimeIndex(onsets).as_unit("ns").asi8
+    source = _frequency_source(pmu_data, columns)
+    fit_ns = pd.Timedelta(fit_window).value
+    pre_ns = pd.Timedelta(pre_window).value
+
+    batches = [onset_ns[i : i + batch_size] for i in range(0, len(onset_ns), batch_size)]
+    max_workers = min(max_workers or os.cpu_count() or 1, max(1, len(batches)))
+    if max_workers == 1:
+        _init_worker(source)
+        results = [_onset_rocof(batch, fit_ns, pre_ns) for batch in batches]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(source,)
+        ) as pool:
+            results = list(
+                pool.map(_onset_rocof, batches, [fit_ns] * len(batches), [pre_ns] * len(batches))
+            )
+
+    rocof, spread, n_samples = (
+        np.concatenate([r[k] for r in results]) if results else np.empty(0) for k in range(3)
+    )
+    table = pd.concat(
+        [
+            pd.DataFrame(
+                {"time": onsets, "rocof": rocof, "rocof_spread": spread, "n_samples": n_samples}
+            ),
+            imbalance_estimates(onsets, generation, flows=flows, zone=zone),
+        ],
+        axis=1,
+    )
+    table["islanded"] = islanded(events, onsets, zone=zone)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["kinetic_energy_measured"] = f0 * table["imbalance"] / (2.0 * table["rocof"].abs())
+        table["h_measured"] = table["kinetic_energy_measured"] / table["total_generation"]
+    constants_based = compute_inertia(generation, inertia_constants, contributions=False)[
+        "Total Inertia"
+    ]
+    table["h_constants"] = constants_based.reindex(table["mtu"]).to_numpy()
+    table["h_ratio"] = table["h_measured"] / table["h_constants"]
+
+    # A rising frequency or a negative imbalance cannot be read as a loss of generation
+    implausible = (table["rocof"] >= 0) | (table["imbalance"] <= 0)
+    table.loc[implausible, ["kinetic_energy_measured", "h_measured", "h_ratio"]] = np.nan
+    # Interconnected: E belongs to the synchronous area, not to the zone's generation
+    table.loc[~table["islanded"], ["h_measured", "h_ratio"]] = np.nan
+    return table
@@ -0,0 +1,425 @@
+import asyncio
+from collections import namedtuple
+import inspect
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.constants import (
+    entsoe_rocof_limit,
+    fcr_saturation,
+    nominal_frequency,
+)
+
+# One alarm transition; 'state' is 'raised' or 'cleared', 'latency' is seconds from the
+# sample reaching the monitor to the alarm being emitted
+Alarm = namedtuple("Alarm", ["kind", "pmu", "state", "time", "value", "latency"])
+
+# A GridRadar timestamp, 'YYYY/MM/DD HH:MM:SS' with an optional fraction
+_timestamp_pattern = re.compile(r"\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,9})?")
+
+
+## Ring buffer
+class RingBuffer:
+    """Fixed-capacity buffer of (int64 ns time, float64 value) samples, oldest overwritten."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full(capacity, np.nan)
+        self._end = 0  # total samples ever written
+
+    def __len__(self):
+        return min(self._end, self.capacity)
+
+    def extend(self, time_ns, values):
+        n = len(time_ns)
+        if n >= self.capacity:
+            time_ns, values = time_ns[-self.capacity :], values[-self.capacity :]
+            self._end += n - self.capacity
+            n = self.capacity
+        positions = (self._end + np.arange(n)) % self.capacity
+        self.time[positions] = time_ns
+        self.values[positions] = values
+        self._end += n
+
+    def last(self, n=None):
+        """The newest n samples (all if None) in time order, as copies."""
+        n = len(self) if n is None else min(n, len(self))
+        positions = (self._end - n + np.arange(n)) % self.capacity
+        return self.time[positions], self.values[positions]
+
+    def latest(self):
+        """(time, value) of the newest sample, or (None, nan) when empty."""
+        if self._end == 0:
+            return None, np.nan
+        i = (self._end - 1) % self.capacity
+        return int(self.time[i]), float(self.values[i])
+
+
+## Monitor
+class LiveMonitor:
+    """Asyncio monitor for many concurrent PMU frequency streams.
+
+    Producers call ``await monitor.submit(pmu, time_ns, frequency)``; samples go through one
+    bounded queue, so a slow monitor makes producers wait (backpressure) instead of growing
+    memory. A single consumer task drains the queue in batches, appends to per-PMU ring
+    buffers and evaluates the alarms with NumPy on each batch:
+
+    - ``rocof``: |RoCoF| over a ``rocof_window`` moving window above ``rocof_limit``
+    - ``fcr_saturation``: |f - 50 Hz| beyond ``fcr_band`` (FCR fully activated)
+    - ``divergence``: |f_reference - median f of the other PMUs| above ``divergence_limit``,
+      the islanding signature of ES_Malaga on April 28
+
+    Alarms are edge-triggered per (kind, pmu): one 'raised' alarm when the condition starts
+    and one 'cleared' alarm when it ends. They are appended to ``alarms`` and passed to
+    ``on_alarm`` (a function or coroutine function) if given. The sources below skip
+    lines they cannot parse and count them in ``n_bad_lines``.
+
+    Args:
+        reference (str, optional): PMU compared with the rest. Defaults to 'ES_Malaga'.
+        rocof_window (str or pd.Timedelta, optional): RoCoF window. Defaults to '500ms'.
+        rocof_limit (float, optional): Hz/s. Defaults to constants.entsoe_rocof_limit.
+        fcr_band (float, optional): Hz. Defaults to constants.fcr_saturation.
+        divergence_limit (float, optional): Hz. Defaults to 0.1.
+        stale_after (str or pd.Timedelta, optional): Ignore PMUs this far behind the
+            reference in the divergence check. Defaults to '1s'.
+        buffer_seconds (float, optional): History kept per PMU. Defaults to 60.
+        fs (float, optional): Nominal sampling rate, to size the buffers. Defaults to 10.
+        queue_size (int, optional): Bound of the sample queue. Defaults to 10,000.
+        batch_size (int, optional): Most samples processed per batch. Defaults to 5,000.
+        on_alarm (callable, optional): Called with each Alarm
+    """
+
+    def __init__(
+        self,
+        reference="ES_Malaga",
+        rocof_window="500ms",
+        rocof_limit=entsoe_rocof_limit,
+        fcr_band=fcr_saturation,
+        divergence_limit=0.1,
+        stale_after="1s",
+        buffer_seconds=60,
+        fs=10,
+        queue_size=10_000,
+        batch_size=5_000,
+        on_alarm=None,
+    ):
+        self.reference = reference
+        self.rocof_window_ns = pd.Timedelta(rocof_window).value
+        self.rocof_limit = rocof_limit
+        self.fcr_band = fcr_band
+        self.divergence_limit = divergence_limit
+        self.stale_after_ns = pd.Timedelta(stale_after).value
+        self.capacity = int(buffer_seconds * fs)
+        self.batch_size = batch_size
+        self.on_alarm = on_alarm
+
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.buffers = {}
+        self.active = set()  # (kind, pmu) pairs currently raised
+        self.alarms = []
+        self.n_samples = 0
+        self.n_bad_lines = 0
+        self._task = None
+
+    ## Ingestion
+    async def submit(self, pmu, time_ns, frequency):
+        """Queue one sample (or equal-length arrays of samples) from a PMU; waits when full."""
+        await self.queue.put((pmu, time_ns, frequency, time.perf_counter()))
+
+    def start(self):
+        """Start the consumer task on the running loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._consume())
+        return self._task
+
+    async def stop(self):
+        """Process everything already queued, then stop the consumer."""
+        await self.queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _consume(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._process(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    ## Processing
+    def _buffer(self, pmu):
+        if pmu not in self.buffers:
+            self.buffers[pmu] = RingBuffer(self.capacity)
+        return self.buffers[pmu]
+
+    async def _process(self, batch):
+        # Group the batch by PMU, keeping arrival order within each PMU
+        grouped = {}
+        for pmu, time_ns, frequency, arrived in batch:
+            times, values, arrivals = grouped.setdefault(pmu, ([], [], []))
+            time_ns, frequency = np.atleast_1d(time_ns), np.atleast_1d(frequency)
+            times.append(time_ns)
+            values.append(frequency)
+            arrivals.append(np.full(len(time_ns), arrived))
+
+        alarms = []
+        for pmu, (times, values, arrivals) in grouped.items():
+            time_ns = np.concatenate(times).astype(np.int64)
+            frequency = np.concatenate(values).astype(np.float64)
+            arrived = np.concatenate(arrivals)
+            buffer = self._buffer(pmu)
+            n_history = len(buffer)
+            buffer.extend(time_ns, frequency)
+            self.n_samples += len(time_ns)
+
+            # RoCoF over the window ending at each new sample: difference quotient to the
+            # newest buffered sample at least one window older
+            history_time, history_values = buffer.last(n_history + len(time_ns))
+            j = np.searchsorted(history_time, time_ns - self.rocof_window_ns, side="right") - 1
+            has_window = j >= 0
+            dt = (time_ns - history_time[np.maximum(j, 0)]) / 1e9
+            with np.errstate(invalid="ignore", divide="ignore"):
+                rocof = np.where(
+                    has_window, (frequency - history_values[np.maximum(j, 0)]) / dt, np.nan
+                )
+            alarms += self._edges(
+                "rocof", pmu, np.abs(rocof) > self.rocof_limit, time_ns, rocof, arrived
+            )
+
+            deviation = frequency - nominal_frequency
+            alarms += self._edges(
+                "fcr_saturation",
+                pmu,
+                np.abs(deviation) > self.fcr_band,
+                time_ns,
+                frequency,
+                arrived,
+            )
+
+        if self.reference in self.buffers:
+            alarms += self._check_divergence(min(item[3] for item in batch))
+
+        for alarm in alarms:
+            self.alarms.append(alarm)
+            if self.on_alarm is not None:
+                result = self.on_alarm(alarm)
+                if inspect.isawaitable(result):
+                    await result
+
+    def _check_divergence(self, arrived):
+        ref_time, ref_value = self._buffer(self.reference).latest()
+        if ref_time is None:
+            return []
+        others = []
+        for pmu, buffer in self.buffers.items():
+            if pmu == self.reference:
+                continue
+            t, value = buffer.latest()
+            if ref_time - t <= self.stale_after_ns and np.isfinite(value):
+                others.append(value)
+        if not others or not np.isfinite(ref_value):
+            return []
+        divergence = ref_value - float(np.median(others))
+        return self._edges(
+            "divergence",
+            self.reference,
+            np.array([abs(divergence) > self.divergence_limit]),
+            np.array([ref_time]),
+            np.array([divergence]),
+            np.array([arrived]),
+        )
+
+    def _edges(self, kind, pmu, condition, time_ns, values, arrived):
+        # Emit an alarm wherever the condition switches on or off, relative to the stored state
+        key = (kind, pmu)
+        was_active = key in self.active
+        previous = np.r_[was_active, condition[:-1]]
+        changes = np.flatnonzero(condition != previous)
+        if len(changes) == 0:
+            return []
+        now = time.perf_counter()
+        alarms = [
+            Alarm(
+                kind,
+                pmu,
+                "raised" if condition[i] else "cleared",
+                pd.Timestamp(int(time_ns[i]), tz="UTC"),
+                float(values[i]),
+                now - float(arrived[i]),
+            )
+            for i in changes
+        ]
+        if condition[-1]:
+            self.active.add(key)
+        else:
+            self.active.discard(key)
+        return alarms
+
+    def latest(self):
+        """Newest frequency per PMU as a pd.Series."""
+        return pd.Series(
+            {pmu: buffer.latest()[1] for pmu, buffer in self.buffers.items()}, dtype=float
+        )
+
+    def active_alarms(self):
+        """(kind, pmu) pairs currently raised."""
+        return sorted(self.active)
+
+
+## Stand-in sources
+async def replay(monitor, pmu_df, speed=1.0, batch="100ms", pmus=None):
+    """Feed a recorded pmu_df into the monitor as one concurrent stream per PMU.
+
+    Each stream sleeps until its samples are "due" at ``speed`` times real time, so the
+    replay exercises the monitor as a live feed would. Use speed=float('inf') for as fast
+    as possible.
+
+    Args:
+        monitor (LiveMonitor): Monitor to feed (started by the caller)
+        pmu_df (pd.DataFrame): Frequencies with a DatetimeIndex, one column per PMU
+        speed (float, optional): Replay speed relative to real time. Defaults to 1.0.
+        batch (str or pd.Timedelta, optional): Samples sent together per stream. Defaults
+            to '100ms' (one 10 Hz sample).
+        pmus (list, optional): Columns to stream. Defaults to all.
+    """
+    pmus = list(pmu_df.columns) if pmus is None else pmus
+    time_ns = pmu_df.index.as_unit("ns").asi8
+    batch_ns = pd.Timedelta(batch).value
+    bounds = np.searchsorted(time_ns, np.arange(time_ns[0], time_ns[-1] + batch_ns, batch_ns))
+    loop = asyncio.get_running_loop()
+    t_start = loop.time()
+
+    async def stream(pmu):
+        values = pmu_df[pmu].to_numpy(dtype=np.float64)
+        for i0, i1 in zip(bounds[:-1], bounds[1:]):
+            if i1 == i0:
+                continue
+            delay = (time_ns[i1 - 1] - time_ns[0]) / 1e9 / speed - (loop.time() - t_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await monitor.submit(pmu, time_ns[i0:i1], values[i0:i1])
+
+    await asyncio.gather(*(stream(pmu) for pmu in pmus))
+
+
+async def tail_csv(
+    monitor,
+    path,
+    pmu_columns=None,
+    timestamp_column="Timestamp",
+    poll_interval=0.05,
+    read_size=1 << 20,
+):
+    """Follow a growing GridRadar-style CSV (like ``tail -f``) and submit new rows.
+
+    Reads run in a worker thread, at most read_size bytes at a time, so a slow disk or a
+    large backlog does not block the event loop. Rows with the wrong number of fields, a
+    malformed timestamp or a non-numeric frequency are skipped and counted in
+    ``monitor.n_bad_lines``; empty frequencies are NaN.
+
+    Args:
+        monitor (LiveMonitor): Monitor to feed
+        path (str or Path): CSV being appended to, with a header line
+        pmu_columns (dict, optional): CSV column -> PMU name. Defaults to every non-timestamp
+            column with ':Frequency' stripped.
+        timestamp_column (str, optional): Defaults to 'Timestamp'.
+        poll_interval (float, optional): Seconds between checks for new data. Defaults to 0.05.
+        read_size (int, optional): Most bytes read per call. Defaults to 1 MiB.
+    """
+    from apagon_april28.timestamps import parse_gridradar
+
+    with open(path) as f:
+        header = f.readline().rstrip("\n").split(",")
+        if pmu_columns is None:
+            pmu_columns = {c: c.replace(":Frequency", "") for c in header if c != timestamp_column}
+        t_col = header.index(timestamp_column)
+        columns = [(header.index(c), pmu) for c, pmu in pmu_columns.items()]
+        partial = ""
+        while True:
+            chunk = await asyncio.to_thread(f.read, read_size)
+            if not chunk:
+                await asyncio.sleep(poll_interval)
+                continue
+            lines = (partial + chunk).split("\n")
+            partial = lines.pop()  # an incomplete last line waits for the next read
+
+            timestamps, samples = [], []
+            for line in lines:
+                if not line.strip():
+                    continue
+                row = line.rstrip("\r").split(",")
+                try:
+                    if len(row) != len(header) or not _timestamp_pattern.fullmatch(row[t_col]):
+                        raise ValueError(line)
+                    samples.append([float(row[i]) if row[i] else np.nan for i, _ in columns])
+                except ValueError:
+                    monitor.n_bad_lines += 1
+                    continue
+                timestamps.append(row[t_col])
+            if not samples:
+                continue
+            time_ns = parse_gridradar(timestamps)
+            samples = np.array(samples, dtype=np.float64)
+            for j, (_, pmu) in enumerate(columns):
+                await monitor.submit(pmu, time_ns, samples[:, j])
+
+
+async def serve_tcp(monitor, host="127.0.0.1", port=8765):
+    """Accept line-based TCP streams of ``pmu,YYYY/MM/DD HH:MM:SS.fff,frequency`` samples.
+
+    Each connection is read independently; a full monitor queue stops reading from the
+    socket, which pushes back on the sender through TCP flow control. Blank lines are
+    ignored; malformed ones (wrong field count, bad timestamp or frequency, or longer than
+    the stream limit) are skipped and counted in ``monitor.n_bad_lines``, so one bad
+    sample does not drop the connection.
+
+    Returns:
+        asyncio.Server: The running server (use ``async with`` or ``server.close()``)
+    """
+    from apagon_april28.timestamps import parse_gridradar
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # longer than the stream limit; the rest is discarded
+                    monitor.n_bad_lines += 1
+                    continue
+                if not line:
+                    break
+                text = line.decode(errors="replace").strip()
+                if not text:
+                    continue
+                try:
+                    pmu, timestamp, frequency = text.split(",")
+                    if not pmu or not _timestamp_pattern.fullmatch(timestamp):
+                        raise ValueError(text)
+                    frequency = float(frequency)
+                except ValueError:
+                    monitor.n_bad_lines += 1
+                    continue
+                await monitor.submit(pmu, parse_gridradar([timestamp])[0], frequency)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
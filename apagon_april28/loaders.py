@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28 import paths
+from apagon_april28.constants import generation_type_column_order
+from apagon_april28.timestamps import cet_to_utc, parse_entsoe_mtu, utc_to_cet
+
+# Bump when the on-disk layout or the parsing rules change, so stale bundles are rebuilt
+CACHE_VERSION = 2
+
+# Columns in ENTSO-E exports that carry no measurements
+ENTSOE_TIME_COLUMNS = ["MTU", "Time (CET/CEST)"]
+ENTSOE_DROP_COLUMNS = ["Area"]
+
+
+## Source hashing
+def file_hash(path, block_size=1 << 20):
+    """Hash the contents of a file so cached bundles follow the data, not the file name.
+
+    Args:
+        path (str or Path): File to hash
+        block_size (int, optional): Bytes read per block. Defaults to 1 MiB.
+
+    Returns:
+        str: First 16 hex characters of the SHA-1 digest
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+## Parsing
+def _clean_entsoe_column_name(column):
+    column = column.replace(" - Actual Aggregated [MW]", "")
+    column = column.replace(" [MW]", "")
+    return column
+
+
+def parse_entsoe_csv(path):
+    """Parse a raw ENTSO-E transparency export into a timestamp array and a value matrix.
+
+    Works for both "Actual Generation per Production Type" (``MTU`` column) and
+    "Cross-Border Physical Flow" (``Time (CET/CEST)`` column) exports. The start of each
+    interval is used as the timestamp, localized from CET/CEST to UTC with
+    timestamps.parse_entsoe_mtu, so the repeated October hour gets distinct instants.
+    The placeholder rows ENTSO-E lists for the skipped March hour are dropped.
+    Non-numeric entries such as ``n/e`` or ``-`` become NaN.
+
+    Args:
+        path (str or Path): Path to the CSV export
+
+    Returns:
+        tuple: (index, values, columns) where index is an int64 array of UTC nanoseconds,
+            values is a float64 array of shape (n_rows, n_columns) and columns is a list
+            of cleaned column names
+    """
+    raw_df = pd.read_csv(path, dtype=str)
+    time_column = next(c for c in ENTSOE_TIME_COLUMNS if c in raw_df.columns)
+
+    index = parse_entsoe_mtu(raw_df[time_column].to_numpy())
+    exists = index != np.iinfo(np.int64).min
+    raw_df, index = raw_df[exists], index[exists]
+
+    value_df = raw_df.drop(columns=[time_column] + [c for c in ENTSOE_DROP_COLUMNS if c in raw_df])
+    value_df = value_df.apply(pd.to_numeric, errors="coerce")
+    columns = [_clean_entsoe_column_name(c) for c in value_df.columns]
+
+    return index, value_df.to_numpy(dtype=np.float64), columns
+
+
+## Columnar cache
+def _bundle_dir(path, cache_root):
+    path = Path(path)
+    return Path(cache_root) / f"{path.stem}-{file_hash(path)}"
+
+
+def _write_bundle(bundle_dir, index, values, columns, source):
+    # Write into a scratch directory and rename, so an interrupted run never leaves a
+    # half-written bundle that later loads would trust
+    tmp_dir = bundle_dir.with_name(bundle_dir.name + f".tmp{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(tmp_dir / "index.npy", index)
+    for i in range(values.shape[1]):
+        np.save(tmp_dir / f"col_{i}.npy", np.ascontiguousarray(values[:, i]))
+
+    meta = {
+        "version": CACHE_VERSION,
+        "source": Path(source).name,
+        "columns": columns,
+        "n_rows": int(len(index)),
+        "sorted": bool(np.all(np.diff(index) >= 0)),
+    }
+    with open(tmp_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if bundle_dir.exists():
+        shutil.rmtree(bundle_dir)
+    tmp_dir.rename(bundle_dir)
+
+
+def _read_meta(bundle_dir):
+    try:
+        with open(bundle_dir / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    return meta
+
+
+def build_cache(path, cache_root=None, force=False):
+    """Convert a raw ENTSO-E export into a columnar ``.npy`` bundle, unless one exists.
+
+    The bundle directory is keyed by a hash of the source file, so edited or re-downloaded
+    exports get a fresh bundle automatically.
+
+    Args:
+        path (str or Path): Path to the CSV export
+        cache_root (str or Path, optional): Where bundles live. Defaults to paths.cache_dir.
+        force (bool, optional): Rebuild even if a valid bundle exists. Defaults to False.
+
+    Returns:
+        Path: The bundle directory
+    """
+    cache_root = paths.cache_dir if cache_root is None else cache_root
+    bundle_dir = _bundle_dir(path, cache_root)
+    if force or _read_meta(bundle_dir) is None:
+        index, values, columns = parse_entsoe_csv(path)
+        _write_bundle(bundle_dir, index, values, columns, source=path)
+    return bundle_dir
+
+
+def _bound_ns(bound):
+    # Naive bounds are CET/CEST wall-clock time, like the default index; aware ones are instants
+    bound = pd.Timestamp(bound).as_unit("ns")
+    if bound.tz is not None:
+        return bound.value
+    return int(cet_to_utc(np.array([bound.value]), nonexistent="shift")[0])
+
+
+def _to_frame(utc_ns, data, tz):
+    utc_ns = np.asarray(utc_ns)
+    if tz is not None:
+        utc_index = pd.DatetimeIndex(utc_ns.astype("datetime64[ns]"), name="datetime")
+        return pd.DataFrame(data, index=utc_index.tz_localize("UTC").tz_convert(tz))
+
+    # Naive wall-clock time repeats the October DST hour and would run backwards there;
+    # keep its first (CEST) pass so the index is unique and sorted
+    wall_ns, keep = np.unique(utc_to_cet(utc_ns), return_index=True)
+    index = pd.DatetimeIndex(wall_ns.astype("datetime64[ns]"), name="datetime")
+    return pd.DataFrame({c: v[keep] for c, v in data.items()}, index=index)
+
+
+def _row_slice(index, start, end, is_sorted):
+    start_ns = None if start is None else _bound_ns(start)
+    end_ns = None if end is None else _bound_ns(end)
+
+    if is_sorted:
+        i0 = 0 if start_ns is None else int(np.searchsorted(index, start_ns, side="left"))
+        i1 = len(index) if end_ns is None else int(np.searchsorted(index, end_ns, side="right"))
+        return slice(i0, i1)
+
+    # Unsorted exports (e.g. concatenated files) fall back to a mask
+    mask = np.ones(len(index), dtype=bool)
+    if start_ns is not None:
+        mask &= index >= start_ns
+    if end_ns is not None:
+        mask &= index <= end_ns
+    return mask
+
+
+def load_entsoe_csv(
+    path, columns=None, start=None, end=None, use_cache=True, cache_root=None, tz=None
+):
+    """Load an ENTSO-E export, serving it from the columnar cache when possible.
+
+    The first call parses the CSV and writes the bundle; later calls memory-map only the
+    requested columns and rows.
+
+    Args:
+        path (str or Path): Path to the CSV export
+        columns (list, optional): Cleaned column names to load. Defaults to all columns.
+        start (datetime-like, optional): First timestamp to keep (inclusive). Naive values
+            are read as CET/CEST wall-clock time.
+        end (datetime-like, optional): Last timestamp to keep (inclusive)
+        use_cache (bool, optional): Read and write the cache. Defaults to True.
+        cache_root (str or Path, optional): Where bundles live. Defaults to paths.cache_dir.
+        tz (str, optional): Time zone of the returned index, e.g. 'Europe/Madrid' or 'UTC'.
+            Defaults to None: naive CET/CEST wall-clock time, which keeps only the first
+            (CEST) pass of the repeated October DST hour. Pass a time zone to keep every row.
+
+    Returns:
+        pd.DataFrame: Values with a ``datetime`` index
+    """
+    if not use_cache:
+        index, values, all_columns = parse_entsoe_csv(path)
+        if columns is None:
+            columns = all_columns
+        missing = [c for c in columns if c not in all_columns]
+        if missing:
+            raise KeyError(f"Columns not found in {path}: {missing}")
+        rows = _row_slice(index, start, end, bool(np.all(np.diff(index) >= 0)))
+        data = {c: values[rows, all_columns.index(c)] for c in columns}
+        return _to_frame(index[rows], data, tz)
+
+    bundle_dir = build_cache(path, cache_root=cache_root)
+    meta = _read_meta(bundle_dir)
+    all_columns = meta["columns"]
+    if columns is None:
+        columns = all_columns
+    missing = [c for c in columns if c not in all_columns]
+    if missing:
+        raise KeyError(f"Columns not found in {meta['source']}: {missing}")
+
+    index = np.load(bundle_dir / "index.npy", mmap_mode="r")
+    rows = _row_slice(index, start, end, meta["sorted"])
+
+    data = {}
+    for column in columns:
+        values = np.load(bundle_dir / f"col_{all_columns.index(column)}.npy", mmap_mode="r")
+        data[column] = np.array(values[rows])
+
+    return _to_frame(index[rows], data, tz)
+
+
+## ENTSO-E datasets
+def load_entsoe_generation(
+    path, columns=None, start=None, end=None, use_cache=True, cache_root=None, tz=None
+):
+    """Load an "Actual Generation per Production Type" export.
+
+    Consumption columns are dropped and generation types are ordered by
+    constants.generation_type_column_order.
+
+    Args:
+        path (str or Path): Path to the CSV export
+        columns (list, optional): Generation types to load. Defaults to all types present.
+        start (datetime-like, optional): First timestamp to keep (inclusive)
+        end (datetime-like, optional): Last timestamp to keep (inclusive)
+        use_cache (bool, optional): Read and write the cache. Defaults to True.
+        cache_root (str or Path, optional): Where bundles live. Defaults to paths.cache_dir.
+        tz (str, optional): Time zone of the index. Defaults to naive CET/CEST wall-clock
+            time, see load_entsoe_csv.
+
+    Returns:
+        pd.DataFrame: Generation [MW] per production type with a ``datetime`` index
+    """
+    if columns is None:
+        if use_cache:
+            available = _read_meta(build_cache(path, cache_root=cache_root))["columns"]
+        else:
+            available = parse_entsoe_csv(path)[2]
+        columns = [c for c in generation_type_column_order if c in available]
+
+    return load_entsoe_csv(
+        path,
+        columns=columns,
+        start=start,
+        end=end,
+        use_cache=use_cache,
+        cache_root=cache_root,
+        tz=tz,
+    )
+
+
+def load_entsoe_flows(
+    path, columns=None, start=None, end=None, use_cache=True, cache_root=None, tz=None
+):
+    """Load a "Cross-Border Physical Flow" export.
+
+    Args:
+        path (str or Path): Path to the CSV export
+        columns (list, optional): Flow directions to load, e.g. ``'CTA|ES > CTA|FR'``.
+            Defaults to both directions.
+        start (datetime-like, optional): First timestamp to keep (inclusive)
+        end (datetime-like, optional): Last timestamp to keep (inclusive)
+        use_cache (bool, optional): Read and write the cache. Defaults to True.
+        cache_root (str or Path, optional): Where bundles live. Defaults to paths.cache_dir.
+        tz (str, optional): Time zone of the index. Defaults to naive CET/CEST wall-clock
+            time, see load_entsoe_csv.
+
+    Returns:
+        pd.DataFrame: Physical flows [MW] with a ``datetime`` index
+    """
+    return load_entsoe_csv(
+        path,
+        columns=columns,
+        start=start,
+        end=end,
+        use_cache=use_cache,
+        cache_root=cache_root,
+        tz=tz,
+    )
@@ -0,0 +1,282 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import pandas as pd
+
+
+## Pre-processing
+def _fill_gaps(values):
+    # Linear interpolation over NaNs so the decimation filter can run; windows that contained
+    # gaps are masked out again afterwards
+    filled = values.copy()
+    rows = np.arange(len(values))
+    for j in range(values.shape[1]):
+        missing = np.isnan(values[:, j])
+        if missing.all():
+            filled[:, j] = 0.0
+        elif missing.any():
+            filled[missing, j] = np.interp(rows[missing], rows[~missing], values[~missing, j])
+    return filled
+
+
+def _windows(values, window, step):
+    # (n_windows, n_channels, window) view without copying
+    return sliding_window_view(values, window, axis=0)[::step]
+
+
+def _decimated_windows(pmu_df, columns, window, step, fs_decimated):
+    # Decimate all PMUs at once and cut them into (n_windows, n_channels, window) views, with
+    # a mask of windows that contained missing samples and the window-centre timestamps
+    from scipy import signal
+
+    time_ns = pmu_df.index.as_unit("ns").asi8
+    values = pmu_df[columns].to_numpy(dtype=np.float64)
+
+    fs = 1e9 / np.median(np.diff(time_ns))
+    q = max(1, int(round(fs / fs_decimated)))
+    fs_d = fs / q
+    window_d = int(round(pd.Timedelta(window).total_seconds() * fs_d))
+    step_d = max(1, int(round(pd.Timedelta(step).total_seconds() * fs_d)))
+
+    missing = np.isnan(values)
+    decimated = _fill_gaps(values)
+    if q > 1:
+        decimated = signal.decimate(decimated, q, ftype="iir", axis=0, zero_phase=True)
+    missing_d = np.add.reduceat(missing, np.arange(0, len(values), q), axis=0) > 0
+
+    segments = _windows(decimated, window_d, step_d)
+    bad = _windows(missing_d, window_d, step_d).any(axis=-1)
+
+    centres = np.arange(segments.shape[0]) * step_d * q + (window_d * q) // 2
+    index = pmu_df.index[np.minimum(centres, len(pmu_df) - 1)]
+    return segments, bad, index, fs_d
+
+
+## Matrix pencil
+def matrix_pencil(segments, fs, order=8, pencil=None):
+    """Estimate damped sinusoidal modes for a batch of segments with the matrix pencil method.
+
+    All segments are processed together with batched eigendecomposition and least-squares
+    calls; there is no Python loop over windows or channels.
+
+    Args:
+        segments (np.ndarray): Real array of shape (..., n_samples), mean already removed
+        fs (float): Sampling frequency of the segments [Hz]
+        order (int, optional): Number of poles (model order) kept. Defaults to 8.
+        pencil (int, optional): Pencil parameter L. Defaults to n_samples // 3.
+
+    Returns:
+        tuple: (frequency [Hz], damping_ratio, amplitude) arrays of shape (..., order)
+    """
+    batch_shape = segments.shape[:-1]
+    n = segments.shape[-1]
+    pencil = n // 3 if pencil is None else pencil
+    y = segments.reshape(-1, n)
+
+    # Hankel matrices (batch, n - L, L + 1) as strided views. The dominant right singular
+    # vectors are taken from the (L + 1) x (L + 1) Gram matrix, which is much cheaper to
+    # decompose in batch than the Hankel matrix itself
+    hankel = sliding_window_view(y, pencil + 1, axis=1)
+    _, v = np.linalg.eigh(np.swapaxes(hankel, 1, 2) @ hankel)
+    v = v[:, :, -order:]
+    v1, v2 = v[:, :-1, :], v[:, 1:, :]
+    z = np.linalg.eigvals(np.linalg.pinv(v1) @ v2)
+
+    # Residues by least squares on the Vandermonde matrix z^k (normal equations, batched)
+    log_z = np.log(z)
+    vandermonde = np.exp(log_z[:, None, :] * np.arange(n)[None, :, None])
+    vandermonde_h = np.conj(np.swapaxes(vandermonde, 1, 2))
+    residues = np.linalg.solve(vandermonde_h @ vandermonde, vandermonde_h @ y[:, :, None])[:, :, 0]
+
+    s = log_z * fs
+    frequency = s.imag / (2 * np.pi)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        damping_ratio = -s.real / np.abs(s)
+    amplitude = 2 * np.abs(residues)
+
+    out_shape = batch_shape + (z.shape[-1],)
+    return (
+        frequency.reshape(out_shape),
+        damping_ratio.reshape(out_shape),
+        amplitude.reshape(out_shape),
+    )
+
+
+def _dominant_modes(segments, fs, order, freq_band):
+    frequency, damping_ratio, amplitude = matrix_pencil(segments, fs, order=order)
+    in_band = (frequency >= freq_band[0]) & (frequency <= freq_band[1])
+    amplitude = np.where(in_band, amplitude, -1.0)
+    best = np.argmax(amplitude, axis=-1)[..., None]
+    found = np.take_along_axis(amplitude, best, axis=-1)[..., 0] >= 0
+
+    def pick(a):
+        return np.where(found, np.take_along_axis(a, best, axis=-1)[..., 0], np.nan)
+
+    return pick(frequency), pick(amplitude), pick(damping_ratio)
+
+
+## Sliding-window tracker
+def track_oscillation_modes(
+    pmu_df,
+    window="60s",
+    step="30s",
+    columns=None,
+    freq_band=(0.1, 1.0),
+    fs_decimated=2.0,
+    order=8,
+    processes=None,
+    batch_windows=2000,
+):
+    """Track the dominant oscillation mode of every PMU over sliding windows.
+
+    Each PMU signal is decimated to ``fs_decimated`` (inter-area modes are well below 1 Hz),
+    cut into overlapping windows, and every (window, PMU) segment is fitted at once with the
+    matrix pencil method. The in-band pole with the largest amplitude is reported. Windows
+    containing missing samples are NaN. Sampling is assumed to be (nearly) uniform, as for
+    GridRadar 10 Hz exports.
+
+    Args:
+        pmu_df (pd.DataFrame): Frequencies [Hz] with a DatetimeIndex, one column per PMU
+        window (str or pd.Timedelta, optional): Window length. Defaults to '60s'.
+        step (str or pd.Timedelta, optional): Hop between windows. Defaults to '30s'.
+        columns (list, optional): PMUs to include. Defaults to all columns.
+        freq_band (tuple, optional): Mode frequencies to consider [Hz]. Defaults to (0.1, 1.0).
+        fs_decimated (float, optional): Sampling rate after decimation [Hz]. Defaults to 2.
+        order (int, optional): Matrix pencil model order. Defaults to 8.
+        processes (int, optional): Worker processes for long spans. Defaults to None (in-process).
+        batch_windows (int, optional): Windows per batch (and per worker task). Defaults to 2000.
+
+    Returns:
+        pd.DataFrame: Indexed by window centre, with two column levels ``pmu`` and
+            ``quantity`` ('frequency' [Hz], 'amplitude' [Hz], 'damping_ratio')
+    """
+    columns = list(pmu_df.columns) if columns is None else list(columns)
+    segments, bad, index, fs_d = _decimated_windows(pmu_df, columns, window, step, fs_decimated)
+    n_windows = segments.shape[0]
+
+    batches = [
+        slice(i, min(i + batch_windows, n_windows)) for i in range(0, n_windows, batch_windows)
+    ]
+    tasks = [segments[b] - segments[b].mean(axis=-1, keepdims=True) for b in batches]
+    if processes and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(
+                pool.map(
+                    _dominant_modes,
+                    tasks,
+                    [fs_d] * len(tasks),
+                    [order] * len(tasks),
+                    [freq_band] * len(tasks),
+                )
+            )
+    else:
+        results = [_dominant_modes(t, fs_d, order, freq_band) for t in tasks]
+
+    if results:
+        frequency, amplitude, damping_ratio = (np.concatenate(r, axis=0) for r in zip(*results))
+    else:
+        frequency = amplitude = damping_ratio = np.empty((0, len(columns)))
+    for a in (frequency, amplitude, damping_ratio):
+        a[bad] = np.nan
+
+    data = np.stack([frequency, amplitude, damping_ratio], axis=-1).reshape(n_windows, -1)
+    column_index = pd.MultiIndex.from_product(
+        [columns, ["frequency", "amplitude", "damping_ratio"]], names=["pmu", "quantity"]
+    )
+    return pd.DataFrame(data, index=index, columns=column_index)
+
+
+## Mode shapes
+def mode_shapes(
+    pmu_df,
+    window="60s",
+    step="30s",
+    columns=None,
+    reference="ES_Malaga",
+    freq_band=(0.1, 1.0),
+    segment="20s",
+    fs_decimated=2.0,
+):
+    """Inter-area mode shape over time from the cross-spectral density of all PMU pairs.
+
+    For every window, all PMUs are Welch-averaged with one batched FFT and the full
+    cross-spectral matrix S[f, i, j] is formed with a single einsum, instead of calling
+    scipy.signal.csd once per pair. At the dominant frequency (largest total power within
+    freq_band) the mode shape is the principal eigenvector of S, phase-referenced to
+    ``reference``. PMUs with a phase near 0 deg swing with the reference and PMUs near
+    180 deg swing against it.
+
+    Args:
+        pmu_df (pd.DataFrame): Frequencies [Hz] with a DatetimeIndex, one column per PMU
+        window (str or pd.Timedelta, optional): Window length. Defaults to '60s'.
+        step (str or pd.Timedelta, optional): Hop between windows. Defaults to '30s'.
+        columns (list, optional): PMUs to include. Defaults to all columns.
+        reference (str, optional): PMU used as phase reference. Defaults to 'ES_Malaga'.
+        freq_band (tuple, optional): Band searched for the dominant mode [Hz]. Defaults to (0.1, 1.0).
+        segment (str or pd.Timedelta, optional): Welch sub-segment length inside each
+            window (50% overlap). Defaults to '20s'.
+        fs_decimated (float, optional): Sampling rate after decimation [Hz]. Defaults to 2.
+
+    Returns:
+        dict: 'frequency' (pd.Series, dominant mode frequency per window [Hz]), 'shape'
+            (pd.DataFrame with column levels ``pmu`` and ``quantity``: 'magnitude' (normalized
+            to the largest participant), 'phase' [deg] relative to the reference, 'coherence'
+            with the reference and 'group' (+1 with, -1 against the reference)), plus
+            'coherence' and 'phase' arrays of shape (n_windows, n_pmus, n_pmus) at the
+            dominant frequency
+    """
+    from scipy import signal
+
+    columns = list(pmu_df.columns) if columns is None else list(columns)
+    ref = columns.index(reference)
+    segments, bad, index, fs_d = _decimated_windows(pmu_df, columns, window, step, fs_decimated)
+    n_windows, n_pmus, _ = segments.shape
+
+    # Welch sub-segments of every window, every PMU: (n_windows, n_sub, n_pmus, n_seg)
+    n_seg = int(round(pd.Timedelta(segment).total_seconds() * fs_d))
+    sub = sliding_window_view(segments, n_seg, axis=-1)[:, :, :: max(1, n_seg // 2)]
+    sub = np.swapaxes(sub, 1, 2)
+    sub = sub - sub.mean(axis=-1, keepdims=True)
+    spectra = np.fft.rfft(sub * signal.get_window("hann", n_seg), axis=-1)
+    frequencies = np.fft.rfftfreq(n_seg, d=1 / fs_d)
+
+    # Cross-spectral matrices for all pairs at once: (n_windows, n_freqs, n_pmus, n_pmus)
+    csd = np.einsum("wsif,wsjf->wfij", spectra, np.conj(spectra)) / spectra.shape[1]
+
+    total_power = np.einsum("wfii->wf", csd).real
+    in_band = (frequencies >= freq_band[0]) & (frequencies <= freq_band[1])
+    total_power[:, ~in_band] = -np.inf
+    dominant = np.argmax(total_power, axis=1)
+    s = csd[np.arange(n_windows), dominant]  # (n_windows, n_pmus, n_pmus)
+
+    auto = np.einsum("wii->wi", s).real
+    with np.errstate(invalid="ignore", divide="ignore"):
+        coherence = np.abs(s) ** 2 / (auto[:, :, None] * auto[:, None, :])
+    phase = np.degrees(np.angle(s))
+
+    # Principal eigenvector, rotated so the reference component is real and positive
+    _, vectors = np.linalg.eigh(s)
+    shape = vectors[:, :, -1]
+    shape = shape * np.exp(-1j * np.angle(shape[:, ref]))[:, None]
+    magnitude = np.abs(shape) / np.abs(shape).max(axis=1, keepdims=True)
+    relative_phase = np.degrees(np.angle(shape))
+    group = np.where(np.cos(np.angle(shape)) >= 0, 1.0, -1.0)
+
+    frequency = frequencies[dominant].astype(float)
+    window_bad = bad.any(axis=1)
+    frequency[window_bad] = np.nan
+    data = np.stack([magnitude, relative_phase, coherence[:, :, ref], group], axis=-1)
+    data[window_bad] = np.nan
+    coherence[window_bad] = np.nan
+    phase[window_bad] = np.nan
+
+    column_index = pd.MultiIndex.from_product(
+        [columns, ["magnitude", "phase", "coherence", "group"]], names=["pmu", "quantity"]
+    )
+    return {
+        "frequency": pd.Series(frequency, index=index, name="frequency"),
+        "shape": pd.DataFrame(data.reshape(n_windows, -1), index=index, columns=column_index),
+        "coherence": coherence,
+        "phase": phase,
+    }
@@ -1,9 +1,41 @@
-from pyprojroot import here
+from functools import lru_cache
+import os
+from pathlib import Path
 
-root = here()
-notebooks_dir = root / "notebooks"
-data_dir = root / "data"
-shareable_dir = root / "data_shareable"
-figures_dir = root / "reports" / "figures"
+# Set APAGON_ROOT to skip the pyprojroot filesystem walk (batch jobs, installed copies)
+root_env_var = "APAGON_ROOT"
 
-#print(f"Paths root: {root}")
\ No newline at end of file
+# Project directories, resolved relative to root on first access (see __getattr__)
+_project_dirs = {
+    "notebooks_dir": ("notebooks",),
+    "data_dir": ("data",),
+    "shareable_dir": ("data_shareable",),
+    "figures_dir": ("reports", "figures"),
+    "cache_dir": ("data", "interim", "cache"),
+}
+
+
+@lru_cache(maxsize=None)
+def get_root():
+    """Project root: $APAGON_ROOT if set, else located with pyprojroot. Resolved once, on first use."""
+    env_root = os.environ.get(root_env_var)
+    if env_root:
+        return Path(env_root).expanduser().resolve()
+    from pyprojroot import here
+
+    return here()
+
+
+def __getattr__(name):
+    # `from apagon_april28.paths import figures_dir` still works; nothing is resolved at import
+    if name == "root":
+        return get_root()
+    if name in _project_dirs:
+        return get_root().joinpath(*_project_dirs[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + ["root"] + list(_project_dirs))
+
+#print(f"Paths root: {get_root()}")
@@ -1,152 +1,107 @@
 # set up
+# plotly, matplotlib and scipy are imported inside the functions that use them, so that
+# importing this module (e.g. for line_trace or the constants) stays cheap
 import pandas as pd
-import matplotlib.pyplot as plt
-import plotly
-import plotly.graph_objects as go
-from PIL import Image 
 import numpy as np
-from datetime import datetime
-import pytz
-from scipy.io import loadmat
-from scipy import signal
-import matplotlib.gridspec as gridspec
-# relative paths using pyprojroot (see pvwatts_sandbox/paths.py)
-from apagon_april28.paths import root, data_dir, shareable_dir, notebooks_dir, figures_dir
 from apagon_april28.constants import generation_type_colors, generation_type_column_order # from entsoe
 from apagon_april28.constants import pmu_colors, pmu_aliases # from gridradar
+from apagon_april28.spectral import StreamingSpectrogram, band_spectrogram
+from apagon_april28.downsample import downsample_indices, webgl_point_threshold
+from apagon_april28.timeindex import rounded_limits
+from apagon_april28.templates import new_figure, add_branding, add_frequency_bands
+
+# Traces
+def line_trace(x, y, decimate=None, width=1600, webgl_threshold=webgl_point_threshold, **kwargs):
+    """Line trace that can be decimated to the figure width and switches to WebGL when large.
+
+    Args:
+        x (pd.Index or array-like): Sorted timestamps
+        y (pd.Series or array-like): Values
+        decimate (str, optional): None (all samples), 'minmax' (min and max per pixel column,
+            keeps every extremum) or 'lttb'. Defaults to None.
+        width (int, optional): Figure width in pixels, i.e. the number of buckets. Defaults to 1600.
+        webgl_threshold (int, optional): Use go.Scattergl above this many points. Defaults to
+            downsample.webgl_point_threshold.
+        **kwargs: Passed on to go.Scatter / go.Scattergl
+
+    Returns:
+        go.Scatter or go.Scattergl
+    """
+    import plotly.graph_objects as go
+
+    if decimate is not None and len(x) > 2 * width:
+        keep = downsample_indices(x, y, width, method=decimate)
+        x = x[keep]
+        y = y.iloc[keep] if isinstance(y, pd.Series) else np.asarray(y)[keep]
+    trace_type = go.Scattergl if webgl_threshold is not None and len(x) > webgl_threshold else go.Scatter
+    return trace_type(x=x, y=y, **kwargs)
 
 # Basic Frequency Plots
 ## Frequency Plot
-def create_frequency_plot(pmu_df, start_time, end_time, pmu_aliases, title_text, ymin=None, ymax=None, events=None, lemur_x = 0.02, lemur_y = 0.02):
+def create_frequency_plot(pmu_df, start_time, end_time, pmu_aliases, title_text, ymin=None, ymax=None, events=None, lemur_x = 0.02, lemur_y = 0.02, decimate=None, webgl_threshold=webgl_point_threshold, ts_index=None):
     
-    df_to_plot = pmu_df.loc[start_time:end_time]
+    # A timeindex.TimeSeriesIndex over pmu_df makes slicing and autoscaling O(log n)
+    if ts_index is not None:
+        df_to_plot = ts_index.window(start_time, end_time)
+        auto_ymin, auto_ymax = ts_index.autoscale(start_time, end_time)
+    else:
+        df_to_plot = pmu_df.loc[start_time:end_time]
+        auto_ymin, auto_ymax = rounded_limits(df_to_plot.min().min(), df_to_plot.max().max())
     
-    fig = go.Figure()
+    fig = new_figure()
 
+    # meta holds the column name so templates.update_frequency_window can swap data in place
     for pmu, name in pmu_aliases.items():
-        fig.add_trace(go.Scatter(
+        fig.add_trace(line_trace(
             x=df_to_plot.index,
             y=df_to_plot[pmu],
+            decimate=decimate,
+            webgl_threshold=webgl_threshold,
             mode='lines',
             name=name,
+            meta=pmu,
             line=dict(color=pmu_colors[pmu])
         ))
 
     # Mark +/- 200mHz and +/- 800mHz
     if ymin is None:
-        try:
-            ymin = round(df_to_plot.min().min() * 10 - 1) / 10
-        except:
-            ymin = 49.1
+        ymin = auto_ymin
     if ymax is None:
-        try:
-            ymax = round(df_to_plot.max().max() * 10 + 1) / 10
-        except:
-            ymax = 50.9
-    fig.add_hrect(y0=ymin, y1=49.2, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=ymin, y1=49.8, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=50.2, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=50.8, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0)
-
-    # Note FCR saturation at +/- 200mhz
-    fig.add_annotation(
-        x=df_to_plot.index[0] + pd.Timedelta(seconds=0.2),
-        y=49.78,
-        text="<i>FCR Saturation</i>",
-        showarrow=False,
-        font=dict(size=12)
-    )
-    # fig.add_annotation(
-    #     x=df_to_plot.index[0] + pd.Timedelta(seconds=0.2),
-    #     y=50.22,
-    #     text="<i>FCR Saturation</i>",
-    #     showarrow=False,
-    #     font=dict(size=12)
-    # )
+        ymax = auto_ymax
+    add_frequency_bands(fig, ymin, ymax, df_to_plot.index[0])
 
+    # events: a list of times or the table from events.detect_events
     if events is not None:
+        if isinstance(events, pd.DataFrame):
+            events = events['time'][(events['time'] >= start_time) & (events['time'] <= end_time)].unique()
         for event in events:
             fig.add_vline(x=event, line_dash="dash", line_color="gray")
 
-
     # Update layout
     fig.update_layout(
         title=title_text,
-        title_font=dict(size=24),
         xaxis_title=None,
         yaxis_title='Frequency [Hz]',
-        yaxis_title_font=dict(size=20),
         yaxis_range=[ymin, ymax],
-        showlegend=True,
-        legend=dict(
-            font=dict(size=24),
-            orientation='h',
-            yanchor='bottom',
-            y=1.0,
-            xanchor='right',
-            x=1
-        ),
-        xaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
-        yaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
-        height = 800,
-        width = 1600,
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        margin=dict(l=50, r=50, t=90, b=60)
+        showlegend=True
     )
     
-    # Add Lemur logo
-    fig.add_layout_image(
-        dict(
-            source=Image.open(figures_dir / "lemur_logo_yellow.png"),
-            xref="paper",
-            yref="paper",
-            x=lemur_x,
-            y=lemur_y,
-            sizex=0.2,
-            sizey=0.2,
-            xanchor="left",
-            yanchor="bottom"
-        )
-    )
-    
-    fig.add_annotation(
-        text="analysis: lemur, uniovi | data: gridradar",
-        xref="paper",
-        yref="paper",
-        x=1,
-        y=1,
-        xanchor="right",
-        yanchor="top",
-        showarrow=False,
-        font=dict(
-            size=12,
-            color="gray"
-        ),
-        bgcolor="white"
-    )
+    add_branding(fig, lemur_x, lemur_y)
     
     return fig
 
-def generic_frequency_plot(series, start_time, end_time, title_text, ymin=None, ymax=None, lemur_x = 0.02, lemur_y = 0.02):
+def generic_frequency_plot(series, start_time, end_time, title_text, ymin=None, ymax=None, lemur_x = 0.02, lemur_y = 0.02, decimate=None, webgl_threshold=webgl_point_threshold):
     
     df_to_plot = series.loc[start_time:end_time]
+    auto_ymin, auto_ymax = rounded_limits(df_to_plot.min(), df_to_plot.max())
     
-    fig = go.Figure()
+    fig = new_figure()
 
-    fig.add_trace(go.Scatter(
+    fig.add_trace(line_trace(
         x=df_to_plot.index,
         y=df_to_plot,
+        decimate=decimate,
+        webgl_threshold=webgl_threshold,
         mode='lines',
         name=title_text,
         line=dict(color='black')
@@ -154,35 +109,10 @@ def generic_frequency_plot(series, start_time, end_time, title_text, ymin=None,
 
     # Mark +/- 200mHz and +/- 800mHz
     if ymin is None:
-        try:
-            ymin = round(df_to_plot.min().min() * 10 - 1) / 10
-        except:
-            ymin = 49.1
+        ymin = auto_ymin
     if ymax is None:
-        try:
-            ymax = round(df_to_plot.max().max() * 10 + 1) / 10
-        except:
-            ymax = 50.9
-    fig.add_hrect(y0=ymin, y1=49.2, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=ymin, y1=49.8, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=50.2, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=50.8, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0)
-
-    # Note FCR saturation at +/- 200mhz
-    fig.add_annotation(
-        x=df_to_plot.index[0] + pd.Timedelta(seconds=0.2),
-        y=49.78,
-        text="<i>FCR Saturation</i>",
-        showarrow=False,
-        font=dict(size=12)
-    )
-    # fig.add_annotation(
-    #     x=df_to_plot.index[0] + pd.Timedelta(seconds=0.2),
-    #     y=50.22,
-    #     text="<i>FCR Saturation</i>",
-    #     showarrow=False,
-    #     font=dict(size=12)
-    # )
+        ymax = auto_ymax
+    add_frequency_bands(fig, ymin, ymax, df_to_plot.index[0])
 
     # Add a vertical line at 12:33:16.5
     # t_first_event = pd.to_datetime('2025-04-28 12:33:16.5').tz_localize('Europe/Madrid')
@@ -197,80 +127,26 @@ def generic_frequency_plot(series, start_time, end_time, title_text, ymin=None,
     # Update layout
     fig.update_layout(
         title=title_text,
-        title_font=dict(size=24),
         xaxis_title=None,
         yaxis_title='Frequency [Hz]',
-        yaxis_title_font=dict(size=20),
         yaxis_range=[ymin, ymax],
         showlegend=True,
-        legend=dict(
-            font=dict(size=24),
-            orientation='h',
-            yanchor='bottom',
-            y=1.0,
-            xanchor='right',
-            x=1
-        ),
-        xaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray',
-            dtick='900000' # 15 minutes in milliseconds
-        ),
-        yaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
-        height = 800,
-        width = 1600,
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        margin=dict(l=50, r=50, t=90, b=60)
+        xaxis_dtick='900000' # 15 minutes in milliseconds
     )
     
-    # Add Lemur logo
-    fig.add_layout_image(
-        dict(
-            source=Image.open(figures_dir / "lemur_logo_yellow.png"),
-            xref="paper",
-            yref="paper",
-            x=lemur_x,
-            y=lemur_y,
-            sizex=0.2,
-            sizey=0.2,
-            xanchor="left",
-            yanchor="bottom"
-        )
-    )
-    
-    fig.add_annotation(
-        text="analysis: lemur, uniovi | data: gridradar",
-        xref="paper",
-        yref="paper",
-        x=1,
-        y=1,
-        xanchor="right",
-        yanchor="top",
-        showarrow=False,
-        font=dict(
-            size=12,
-            color="gray"
-        ),
-        bgcolor="white"
-    )
+    add_branding(fig, lemur_x, lemur_y)
     
     return fig
 
-def plot_N_frequency_comparison(series_to_plot, t_comparison_start=None, t_comparison_end=None, lemur_x = 0.02, lemur_y = 0.02):
+def plot_N_frequency_comparison(series_to_plot, t_comparison_start=None, t_comparison_end=None, lemur_x = 0.02, lemur_y = 0.02, decimate=None, webgl_threshold=webgl_point_threshold):
     """Creates a frequency comparison plot for multiple time series.
     
     Args:
         series_to_plot (dict): Dictionary mapping series names to pandas Series objects
         t_comparison_start (pd.Timestamp, optional): Start time for comparison. Defaults to earliest timestamp.
         t_comparison_end (pd.Timestamp, optional): End time for comparison. Defaults to latest timestamp.
+        decimate (str, optional): 'minmax' or 'lttb' to reduce each trace to the figure width. Defaults to None.
+        webgl_threshold (int, optional): Points per trace above which Scattergl is used.
     
     Returns:
         plotly.graph_objects.Figure: The comparison plot figure
@@ -282,12 +158,14 @@ def plot_N_frequency_comparison(series_to_plot, t_comparison_start=None, t_compa
     if t_comparison_end is None:
         t_comparison_end = max([t_max for t_max in [series.index.max() for series in series_to_plot.values()] if t_max is not None])
 
-    fig = go.Figure()
+    fig = new_figure()
 
     for series_name, series in series_to_plot.items():
-        fig.add_trace(go.Scatter(
+        fig.add_trace(line_trace(
             x=series.loc[t_comparison_start:t_comparison_end].index,
             y=series.loc[t_comparison_start:t_comparison_end],
+            decimate=decimate,
+            webgl_threshold=webgl_threshold,
             mode='lines',
             name=series_name,
         ))
@@ -295,93 +173,25 @@ def plot_N_frequency_comparison(series_to_plot, t_comparison_start=None, t_compa
     # Add standard frequency bands
     ymin = 49.75
     ymax = 50.25
-    fig.add_hrect(y0=ymin, y1=49.2, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=ymin, y1=49.8, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=50.2, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0)
-    fig.add_hrect(y0=50.8, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0)
-
-    # Note FCR saturation
-    fig.add_annotation(
-        x=list(series_to_plot.values())[0].loc[t_comparison_start:t_comparison_end].index[0] + pd.Timedelta(seconds=0.2),
-        y=49.78,
-        text="<i>FCR Saturation</i>",
-        showarrow=False,
-        font=dict(size=12)
-    )
+    add_frequency_bands(fig, ymin, ymax, list(series_to_plot.values())[0].loc[t_comparison_start:t_comparison_end].index[0])
 
     # Update layout
     fig.update_layout(
         title='Frequency Comparison: Toledo vs Malaga',
-        title_font=dict(size=24),
         xaxis_title=None,
         yaxis_title='Frequency [Hz]',
-        yaxis_title_font=dict(size=20),
         yaxis_range=[ymin, ymax],
         showlegend=True,
-        legend=dict(
-            font=dict(size=24),
-            orientation='h',
-            yanchor='bottom',
-            y=1.0,
-            xanchor='right',
-            x=1
-        ),
-        xaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray',
-            dtick='900000'  # 15 minutes in milliseconds
-        ),
-        yaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
-        height=800,
-        width=1600,
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        margin=dict(l=50, r=50, t=90, b=60)
+        xaxis_dtick='900000'  # 15 minutes in milliseconds
     )
     
-    # Add Lemur logo
-    fig.add_layout_image(
-        dict(
-            source=Image.open(figures_dir / "lemur_logo_yellow.png"),
-            xref="paper",
-            yref="paper",
-            x=lemur_x,
-            y=lemur_y,
-            sizex=0.2,
-            sizey=0.2,
-            xanchor="left",
-            yanchor="bottom"
-        )
-    )
-
-    fig.add_annotation(
-        text="analysis: lemur, uniovi | data: gridradar",
-        xref="paper",
-        yref="paper",
-        x=1,
-        y=1,
-        xanchor="right",
-        yanchor="top",
-        showarrow=False,
-        font=dict(
-            size=12,
-            color="gray"
-        ),
-        bgcolor="white"
-    )
+    add_branding(fig, lemur_x, lemur_y)
 
     return fig
 
 ## RoCoF Plots
 ### Comparison Plot
-def create_rocof_comparison_plot(pmu_df, start_time, end_time, pmu_aliases, title_text, ymin=None, ymax=None, lemur_x = 0.02, lemur_y = 0.02):
+def create_rocof_comparison_plot(pmu_df, start_time, end_time, pmu_aliases, title_text, ymin=None, ymax=None, lemur_x = 0.02, lemur_y = 0.02, decimate=None, webgl_threshold=webgl_point_threshold, unreliable_after=pd.Timestamp('2025-04-28 12:33:23', tz='Europe/Madrid')):
     """Creates a plot comparing Rate of Change of Frequency (RoCoF) measurements from multiple PMUs.
     
     Args:
@@ -392,6 +202,10 @@ def create_rocof_comparison_plot(pmu_df, start_time, end_time, pmu_aliases, titl
         title_text (str): Title text for the plot
         ymin (float, optional): Minimum y-axis value. Defaults to -1.5 Hz/s if None
         ymax (float, optional): Maximum y-axis value. Defaults to 1.5 Hz/s if None
+        decimate (str, optional): 'minmax' or 'lttb' to reduce each trace to the figure width. Defaults to None.
+        webgl_threshold (int, optional): Points per trace above which Scattergl is used.
+        unreliable_after (pd.Timestamp, optional): Start of the gray "unreliable" region, e.g.
+            events.unreliable_after(events_df). None leaves it out. Defaults to 12:33:23.
         
     Returns:
         plotly.graph_objects.Figure: Figure object containing the RoCoF comparison plot with:
@@ -403,11 +217,13 @@ def create_rocof_comparison_plot(pmu_df, start_time, end_time, pmu_aliases, titl
     
     df_to_plot = pmu_df.loc[start_time:end_time]
     
-    fig = go.Figure()
+    fig = new_figure()
     for pmu, name in pmu_aliases.items():
-        fig.add_trace(go.Scatter(
+        fig.add_trace(line_trace(
             x=df_to_plot.index,
             y=df_to_plot[pmu],
+            decimate=decimate,
+            webgl_threshold=webgl_threshold,
             mode='lines',
             name=name,
             line=dict(color=pmu_colors[pmu])
@@ -418,17 +234,18 @@ def create_rocof_comparison_plot(pmu_df, start_time, end_time, pmu_aliases, titl
     ymax = 1.5
 
 
-    # Note unreliable data after 12:33:16.5
-    fig.add_vrect(x0=pd.to_datetime('2025-04-28 12:33:23').tz_localize('Europe/Madrid'), x1=end_time, fillcolor="gray", opacity=0.7, line_width=0)
-    fig.add_annotation(
-        x = end_time,
-        y=1.3,
-        text="<i>ES_Malaga PMU data<br>is unreliable after blackout</i>",
-        showarrow=False,
-        font=dict(size=12),
-        xanchor='right',
-        yanchor='top'
-    )
+    # Note unreliable data after the blackout
+    if unreliable_after is not None:
+        fig.add_vrect(x0=unreliable_after, x1=end_time, fillcolor="gray", opacity=0.7, line_width=0)
+        fig.add_annotation(
+            x = end_time,
+            y=1.3,
+            text="<i>ES_Malaga PMU data<br>is unreliable after blackout</i>",
+            showarrow=False,
+            font=dict(size=12),
+            xanchor='right',
+            yanchor='top'
+        )
 
     # Note entso-e RoCoF limit
     fig.add_hrect(y0=ymin, y1=-1.25, fillcolor="gray", opacity=0.1, line_width=0)
@@ -452,77 +269,19 @@ def create_rocof_comparison_plot(pmu_df, start_time, end_time, pmu_aliases, titl
     # Update layout
     fig.update_layout(
         title=title_text,
-        title_font=dict(size=24),
         xaxis_title=None,
         yaxis_title='Rate of Change of Frequency [Hz/s]',
-        yaxis_title_font=dict(size=20),
         yaxis_range=[ymin, ymax],
-        showlegend=True,
-        legend=dict(
-            font=dict(size=24),
-            orientation='h',
-            yanchor='bottom',
-            y=1.0,
-            xanchor='right',
-            x=1
-        ),
-        xaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
-        yaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
-        height = 800,
-        width = 1600,
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        margin=dict(l=50, r=50, t=90, b=60)
+        showlegend=True
     )
-    
 
-    # Add Lemur logo
-    fig.add_layout_image(
-        dict(
-            source=Image.open(figures_dir / "lemur_logo_yellow.png"),
-            xref="paper",
-            yref="paper",
-            x=lemur_x,
-            y=lemur_y,
-            sizex=0.2,
-            sizey=0.2,
-            xanchor="left",
-            yanchor="bottom"
-        )
-    )
-    
-    fig.add_annotation(
-        text="analysis: lemur, uniovi | data: gridradar",
-        xref="paper",
-        yref="paper",
-        x=1,
-        y=1,
-        xanchor="right",
-        yanchor="top",
-        showarrow=False,
-        font=dict(
-            size=12,
-            color="gray"
-        ),
-        bgcolor="white"
-    )
-    
-    
+    add_branding(fig, lemur_x, lemur_y)
+
     return fig
 
 
 ### Closeup Plot
-def create_rocof_closeup_plot(rocof_df, start_time, end_time, title_text, ymin=-1.5, ymax=1.5, lemur_x = 0.02, lemur_y = 0.02):
+def create_rocof_closeup_plot(rocof_df, start_time, end_time, title_text, ymin=-1.5, ymax=1.5, lemur_x = 0.02, lemur_y = 0.02, unreliable_after=pd.Timestamp('2025-04-28 12:33:20.4', tz='Europe/Madrid')):
     """
     Create a plot comparing different ROCOF calculation window sizes for a given time period.
 
@@ -541,6 +300,9 @@ def create_rocof_closeup_plot(rocof_df, start_time, end_time, title_text, ymin=-
         Minimum y-axis value, defaults to -1.5 Hz/s
     ymax : float, optional
         Maximum y-axis value, defaults to 1.5 Hz/s
+    unreliable_after : pd.Timestamp, optional
+        Start of the gray "unreliable" region, e.g. events.unreliable_after(events_df);
+        None leaves it out. Defaults to 12:33:20.4
 
     Returns
     -------
@@ -551,7 +313,9 @@ def create_rocof_closeup_plot(rocof_df, start_time, end_time, title_text, ymin=-
         - Horizontal bands indicating ENTSO-E ROCOF limits
         - Annotations for data reliability and ROCOF limits
     """
-    fig = go.Figure()   
+    import plotly.graph_objects as go
+
+    fig = new_figure()
 
     rocof_colors = {
         'rocof_instantaneous': '#ff3333',  # bright red
@@ -573,17 +337,18 @@ def create_rocof_closeup_plot(rocof_df, start_time, end_time, title_text, ymin=-
             )
         )
 
-    # Note unreliable data after 12:33:16.5
-    fig.add_vrect(x0=pd.to_datetime('2025-04-28 12:33:20.4').tz_localize('Europe/Madrid'), x1=end_time, fillcolor="gray", opacity=0.7, line_width=0)
-    fig.add_annotation(
-        x = end_time,
-        y=max(-1.3,ymin),
-        text="<i>ES_Malaga PMU data<br>is unreliable after blackout</i>",
-        showarrow=False,
-        font=dict(size=12),
-        xanchor='right',
-        yanchor='top'
-    )
+    # Note unreliable data after the blackout
+    if unreliable_after is not None:
+        fig.add_vrect(x0=unreliable_after, x1=end_time, fillcolor="gray", opacity=0.7, line_width=0)
+        fig.add_annotation(
+            x = end_time,
+            y=max(-1.3,ymin),
+            text="<i>ES_Malaga PMU data<br>is unreliable after blackout</i>",
+            showarrow=False,
+            font=dict(size=12),
+            xanchor='right',
+            yanchor='top'
+        )
 
     # Note entso-e RoCoF limit
     fig.add_hrect(y0=ymin, y1=max(ymin, -1.25), fillcolor="gray", opacity=0.1, line_width=0)
@@ -613,76 +378,110 @@ def create_rocof_closeup_plot(rocof_df, start_time, end_time, title_text, ymin=-
         ),
         xaxis_title=None,
         yaxis_title='Rate of Change of Frequency [Hz/s]',
-        yaxis_title_font=dict(size=20),
         yaxis_range=[ymin, ymax],
-        xaxis=dict(
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray'
-        ),
         yaxis=dict(
             title="ROCOF (Hz/s)",
-            tickfont=dict(size=20),
-            showgrid=True,
-            gridwidth=1,
-            gridcolor='lightgray',
             range=[ymin, ymax]
         ),
-        height=800,
-        width=1600,
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        margin=dict(l=50, r=50, t=120, b=60),
+        margin=dict(t=120),
         showlegend=True,
-        legend=dict(
-            font=dict(size=20),
-            orientation='h',
-            yanchor='bottom',
-            y=1.0,
-            xanchor='right',
-            x=1
-        )
+        legend_font=dict(size=20)
     )
     
-    # Add Lemur logo
-    fig.add_layout_image(
-        dict(
-            source=Image.open(figures_dir / "lemur_logo_yellow.png"),
-            xref="paper",
-            yref="paper",
-            x=lemur_x,
-            y=lemur_y,
-            sizex=0.2,
-            sizey=0.2,
-            xanchor="left",
-            yanchor="bottom"
-        )
-    )
+    add_branding(fig, lemur_x, lemur_y)
 
-    fig.add_annotation(
-        text="analysis: lemur, uniovi | data: gridradar",
-        xref="paper",
-        yref="paper",
-        x=1,
-        y=1,
-        xanchor="right",
-        yanchor="top",
-        showarrow=False,
-        font=dict(
-            size=12,
-            color="gray"
+    return fig
+
+
+### Daily Profiles
+def create_daily_profile_plot(profiles, title_text, highlight=None, mode='lines', yaxis_title=None, percentiles=(5, 25, 50, 75, 95), color='grey', highlight_color='red', highlight_name=None, lemur_x = 0.02, lemur_y = 0.02, data_source='entso-e'):
+    """Plot many daily profiles ("spaghetti") with one day highlighted.
+
+    Args:
+        profiles (pd.DataFrame): Days x time-of-day matrix from profiles.day_matrix
+        title_text (str): Title for the plot
+        highlight (datetime-like, optional): Day drawn on top in highlight_color and
+            left out of the background
+        mode (str, optional): 'lines' draws the background days as one NaN-separated
+            trace, 'bands' as percentile bands with the median. Defaults to 'lines'.
+        yaxis_title (str, optional): Y-axis title
+        percentiles (tuple, optional): For mode='bands', symmetric pairs around the
+            median. Defaults to (5, 25, 50, 75, 95).
+        color (str, optional): Background color. Defaults to 'grey'.
+        highlight_color (str, optional): Defaults to 'red'.
+        highlight_name (str, optional): Legend name of the highlighted day. Defaults to its date.
+
+    Returns:
+        plotly.graph_objects.Figure: Figure with the background trace(s) and the highlighted day
+    """
+    import plotly.graph_objects as go
+    from apagon_april28.profiles import nan_separated, profile_percentiles
+
+    highlight = None if highlight is None else pd.Timestamp(highlight).normalize()
+    background = profiles.drop(index=highlight, errors='ignore') if highlight is not None else profiles
+    time_of_day = profiles.columns.to_numpy(dtype=float)
+
+    fig = new_figure()
+    if mode == 'lines':
+        x, y = nan_separated(background)
+        fig.add_trace(line_trace(
+            x,
+            y,
+            mode='lines',
+            name=f'{len(background)} days',
+            line=dict(width=1, color=color),
+            connectgaps=False
+        ))
+    elif mode == 'bands':
+        bands = profile_percentiles(background, percentiles)
+        n_pairs = len(percentiles) // 2
+        for k in range(n_pairs):
+            lower, upper = percentiles[k], percentiles[-1 - k]
+            fig.add_trace(go.Scatter(x=time_of_day, y=bands.loc[upper], mode='lines', line=dict(width=0, color=color), showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(
+                x=time_of_day,
+                y=bands.loc[lower],
+                mode='lines',
+                line=dict(width=0, color=color),
+                fill='tonexty',
+                opacity=0.25,
+                name=f'P{lower}-P{upper}'
+            ))
+        if len(percentiles) % 2:
+            median = percentiles[n_pairs]
+            fig.add_trace(go.Scatter(x=time_of_day, y=bands.loc[median], mode='lines', line=dict(width=2, color=color, dash='dash'), name=f'P{median}'))
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    if highlight is not None and highlight in profiles.index:
+        fig.add_trace(go.Scatter(
+            x=time_of_day,
+            y=profiles.loc[highlight],
+            mode='lines',
+            name=highlight_name or f'{highlight:%Y-%m-%d}',
+            line=dict(width=3, color=highlight_color)
+        ))
+
+    fig.update_layout(
+        title=title_text,
+        xaxis_title=None,
+        yaxis_title=yaxis_title,
+        xaxis=dict(
+            tickvals=[0, 3, 6, 9, 12, 15, 18, 21, 24],
+            ticktext=[f'{h:02d}:00' for h in [0, 3, 6, 9, 12, 15, 18, 21, 24]]
         ),
-        bgcolor="white"
+        showlegend=True
     )
 
+    add_branding(fig, lemur_x, lemur_y, data_source=data_source)
+
     return fig
 
 ## Spectrogram
-def create_grid_frequency_spectrogram(data, pmu_name, fs=10, window_size=600, overlap=0.75, plot=True):
+def compute_grid_frequency_spectrogram(data, fs=10, window_size=600, overlap=0.75, freq_band=None, resolution=None):
     """
-    Create a spectrogram from grid frequency measurements, focusing on sub-synchronous oscillations.
-    
+    Compute a spectrogram from grid frequency measurements, without plotting.
+
     Parameters:
     -----------
     data : pandas Series or numpy array
@@ -693,87 +492,119 @@ def create_grid_frequency_spectrogram(data, pmu_name, fs=10, window_size=600, ov
         Number of samples in each FFT window (60 seconds at 10 Hz)
     overlap : float, default=0.75
         Overlap between consecutive windows (75% overlap)
-    plot : bool, default=True
-        Whether to plot the results
-        
+    freq_band : tuple, optional
+        (f_min, f_max) in Hz to keep; defaults to the full spectrum
+    resolution : float, optional
+        Frequency spacing in Hz inside freq_band. When given, the band is computed with
+        spectral.band_spectrogram (decimation + zoom DFT) instead of full-rate FFTs
+
     Returns:
     --------
     dict : Dictionary containing spectrogram data
     """
-    # Ensure data is a numpy array
-    y = np.array(data)
-    
-    # Use just frequency error (remove 50 Hz)
-    y = y - 50
-    
-    # Calculate parameters for spectrogram
-    nperseg = window_size
-    noverlap = int(nperseg * overlap)
-    
-    # Create spectrogram
-    f, t, Sxx = signal.spectrogram(
-        y, 
-        fs=fs, 
-        window='hann',
-        nperseg=nperseg, 
-        noverlap=noverlap, 
-        detrend='constant',
-        scaling='density'
-    )
-    
-    # Calculate total duration in hours:minutes:seconds
-    total_duration_sec = len(y) / fs
-    hours = int(total_duration_sec // 3600)
-    minutes = int((total_duration_sec % 3600) // 60)
-    seconds = int(total_duration_sec % 60)
-    date = data.index[0].strftime('%Y-%m-%d')
-    
-    if plot:
-        # Create the plot
-        fig = plt.figure(figsize=(14, 10))
-        gs = gridspec.GridSpec(2, 2, width_ratios=[20, 1], height_ratios=[1, 1], wspace=0.05)
-        
-        # Plot 1: Original time series
-        ax1 = plt.subplot(gs[0, 0])
-        time = np.arange(len(y)) / fs   # Time in seconds
-        t_datetime = [data.index[0] + pd.Timedelta(seconds=t) for t in time]
-
-        ax1.plot(time, y+50)
-        ax1.grid(True)
-        #ax1.set_xlabel('Time (minutes)')
-        ax1.set_xlim([0, 20.5])
-        ax1.set_xticks(time[::len(time)//6])  # Show 6 ticks
-        ax1.set_xticklabels([t.strftime('%H:%M') for t in t_datetime[::len(time)//6]])
-        ax1.set_ylabel('Frequency (Hz)')
-        ax1.set_title(f'Grid Frequency Measurements | {pmu_name} | {date}')
-        
-        # Plot 2: Spectrogram, focusing on the range of interest
-        ax2 = plt.subplot(gs[1, 0])
-        mask = (f >= 0.05) & (f <= 0.3)
-        pcm = ax2.pcolormesh(t, f[mask], 10 * np.log10(Sxx[mask]), 
-                             shading='gouraud', cmap='viridis')
-        ax2.set_ylabel('Frequency (Hz)')
-        # ax2.set_xlabel('Time (minutes)')
-        # ax2.set_xlim([0, 20.33333333333])
-        # ax2.set_xticks(time[::len(time)//6])  # Show 6 ticks
-        ax2.set_xticklabels([t.strftime('%H:%M') for t in t_datetime[::len(time)//6]])
-        ax2.set_title(f'Spectrogram: Sub-synchronous Oscillations (window size: {window_size/(fs)} seconds)')
-        
-        # Colorbar in its own axes
-        cax = plt.subplot(gs[1, 1])
-        plt.colorbar(pcm, cax=cax, label='Power/Frequency (dB/Hz)')
-        
-        plt.tight_layout()
-        #plt.show()
-    
+    if resolution is not None:
+        return band_spectrogram(data, fs=fs, window_size=window_size, overlap=overlap,
+                                freq_band=freq_band or (0.05, 0.3), resolution=resolution)
+
+    stft = StreamingSpectrogram(fs=fs, window_size=window_size, overlap=overlap, freq_band=freq_band)
+    stft.append(np.asarray(data, dtype=float))
+
     return {
-        'fig': fig,
-        'frequencies': f,
-        'times': t,
-        'power': Sxx,
+        'frequencies': stft.frequencies,
+        'times': stft.times,
+        'power': stft.power,
         'fs': fs,
         'window_size': window_size,
         'overlap': overlap
     }
 
+def plot_grid_frequency_spectrogram(data, spec_data, pmu_name, f_min=0.05, f_max=0.3):
+    """
+    Plot grid frequency measurements above their spectrogram, focusing on sub-synchronous oscillations.
+
+    Parameters:
+    -----------
+    data : pandas Series
+        Grid frequency measurements with a DatetimeIndex
+    spec_data : dict
+        Output of compute_grid_frequency_spectrogram (or the matching StreamingSpectrogram fields)
+    pmu_name : str
+        PMU name for the title
+    f_min, f_max : float, default=0.05, 0.3
+        Frequency range of the spectrogram to show, in Hz
+
+    Returns:
+    --------
+    matplotlib.figure.Figure
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
+
+    y = np.array(data)
+    f, t, Sxx = spec_data['frequencies'], spec_data['times'], spec_data['power']
+    fs, window_size = spec_data['fs'], spec_data['window_size']
+    date = data.index[0].strftime('%Y-%m-%d')
+
+    # Create the plot
+    fig = plt.figure(figsize=(14, 10))
+    gs = gridspec.GridSpec(2, 2, width_ratios=[20, 1], height_ratios=[1, 1], wspace=0.05)
+
+    # Plot 1: Original time series
+    ax1 = plt.subplot(gs[0, 0])
+    time = np.arange(len(y)) / fs   # Time in seconds
+    t_datetime = [data.index[0] + pd.Timedelta(seconds=t) for t in time]
+
+    ax1.plot(time, y)
+    ax1.grid(True)
+    #ax1.set_xlabel('Time (minutes)')
+    ax1.set_xlim([0, 20.5])
+    ax1.set_xticks(time[::len(time)//6])  # Show 6 ticks
+    ax1.set_xticklabels([t.strftime('%H:%M') for t in t_datetime[::len(time)//6]])
+    ax1.set_ylabel('Frequency (Hz)')
+    ax1.set_title(f'Grid Frequency Measurements | {pmu_name} | {date}')
+
+    # Plot 2: Spectrogram, focusing on the range of interest
+    ax2 = plt.subplot(gs[1, 0])
+    mask = (f >= f_min) & (f <= f_max)
+    pcm = ax2.pcolormesh(t, f[mask], 10 * np.log10(Sxx[mask]),
+                         shading='gouraud', cmap='viridis')
+    ax2.set_ylabel('Frequency (Hz)')
+    # ax2.set_xlabel('Time (minutes)')
+    # ax2.set_xlim([0, 20.33333333333])
+    # ax2.set_xticks(time[::len(time)//6])  # Show 6 ticks
+    ax2.set_xticklabels([t.strftime('%H:%M') for t in t_datetime[::len(time)//6]])
+    ax2.set_title(f'Spectrogram: Sub-synchronous Oscillations (window size: {window_size/(fs)} seconds)')
+
+    # Colorbar in its own axes
+    cax = plt.subplot(gs[1, 1])
+    plt.colorbar(pcm, cax=cax, label='Power/Frequency (dB/Hz)')
+
+    plt.tight_layout()
+    #plt.show()
+
+    return fig
 
+def create_grid_frequency_spectrogram(data, pmu_name, fs=10, window_size=600, overlap=0.75, plot=True):
+    """
+    Create a spectrogram from grid frequency measurements, focusing on sub-synchronous oscillations.
+    
+    Parameters:
+    -----------
+    data : pandas Series or numpy array
+        Grid frequency measurements
+    fs : float, default=10
+        Sampling frequency in Hz
+    window_size : int, default=600
+        Number of samples in each FFT window (60 seconds at 10 Hz)
+    overlap : float, default=0.75
+        Overlap between consecutive windows (75% overlap)
+    plot : bool, default=True
+        Whether to plot the results
+        
+    Returns:
+    --------
+    dict : Dictionary containing spectrogram data ('fig' is None when plot=False)
+    """
+    spec_data = compute_grid_frequency_spectrogram(data, fs=fs, window_size=window_size, overlap=overlap)
+    spec_data['fig'] = plot_grid_frequency_spectrogram(data, spec_data, pmu_name) if plot else None
+    return spec_data
@@ -0,0 +1,254 @@
+import json
+from pathlib import Path
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28 import paths
+from apagon_april28.loaders import file_hash
+from apagon_april28.timestamps import bound_ns, parse_gridradar
+
+# Bump when the store layout or the timestamp parsing changes
+STORE_VERSION = 1
+
+
+## Store
+def _clean_pmu_column_name(column):
+    return column.replace(":Frequency", "")
+
+
+def _source_stat(path):
+    stat = Path(path).stat()
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def _read_store_meta(store_dir):
+    try:
+        with open(Path(store_dir) / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != STORE_VERSION:
+        return None
+    return meta
+
+
+def _matches_stat(meta, stat):
+    return meta is not None and all(meta.get(key) == value for key, value in stat.items())
+
+
+def _write_store_meta(store_dir, meta):
+    with open(Path(store_dir) / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def convert_gridradar_csv(path, store_dir, chunksize=1_000_000, timestamp_column="Timestamp"):
+    """Stream a GridRadar PMU export into a memory-mapped array store.
+
+    The CSV is read ``chunksize`` rows at a time; each chunk's timestamps are parsed to
+    int64 nanoseconds and its frequencies cast to float32 and appended to one flat binary
+    file per column. Peak memory therefore scales with the chunk size, not the file size.
+
+    Args:
+        path (str or Path): GridRadar CSV export
+        store_dir (str or Path): Directory to write the store to (replaced if it exists)
+        chunksize (int, optional): Rows per chunk. Defaults to 1,000,000.
+        timestamp_column (str, optional): Name of the timestamp column. Defaults to 'Timestamp'.
+
+    Returns:
+        PMUStore: The new store
+    """
+    store_dir = Path(store_dir)
+    tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    reader = pd.read_csv(path, chunksize=chunksize, dtype={timestamp_column: str})
+    columns, files = None, None
+    n_rows, last_time, is_sorted = 0, None, True
+    try:
+        for chunk in reader:
+            if columns is None:
+                raw_columns = [c for c in chunk.columns if c != timestamp_column]
+                columns = [_clean_pmu_column_name(c) for c in raw_columns]
+                files = [open(tmp_dir / "time.i64", "wb")]
+                files += [open(tmp_dir / f"col_{i}.f32", "wb") for i in range(len(columns))]
+
+            time = parse_gridradar(chunk[timestamp_column].to_numpy())
+            if len(time):
+                if (last_time is not None and time[0] < last_time) or np.any(np.diff(time) < 0):
+                    is_sorted = False
+                last_time = time[-1]
+            files[0].write(time.tobytes())
+            for f, column in zip(files[1:], raw_columns):
+                f.write(chunk[column].to_numpy(dtype=np.float32).tobytes())
+            n_rows += len(chunk)
+    finally:
+        for f in files or []:
+            f.close()
+
+    meta = {
+        "version": STORE_VERSION,
+        "source": Path(path).name,
+        "source_hash": file_hash(path),
+        **_source_stat(path),
+        "columns": columns or [],
+        "n_rows": n_rows,
+        "sorted": is_sorted,
+    }
+    _write_store_meta(tmp_dir, meta)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    tmp_dir.rename(store_dir)
+    return PMUStore(store_dir)
+
+
+def load_gridradar(path, store_dir=None, chunksize=1_000_000):
+    """Open the array store for a GridRadar export, converting the CSV on first use.
+
+    A store whose recorded source size and mtime match the CSV is opened without reading
+    the CSV. Only when they differ is the CSV hashed: if the contents are unchanged the
+    recorded size and mtime are refreshed, otherwise the store is rebuilt.
+
+    Args:
+        path (str or Path): GridRadar CSV export
+        store_dir (str or Path, optional): Store location. Defaults to a directory in
+            paths.cache_dir keyed by a hash of the source file.
+        chunksize (int, optional): Rows per chunk when converting. Defaults to 1,000,000.
+
+    Returns:
+        PMUStore: Memory-mapped store
+    """
+    path = Path(path)
+    stat = _source_stat(path)
+
+    if store_dir is None:
+        for candidate in sorted(paths.cache_dir.glob(f"{path.stem}-*")):
+            meta = _read_store_meta(candidate)
+            if _matches_stat(meta, stat) and meta["source"] == path.name:
+                return PMUStore(candidate)
+        source_hash = file_hash(path)
+        store_dir = paths.cache_dir / f"{path.stem}-{source_hash}"
+    else:
+        if _matches_stat(_read_store_meta(store_dir), stat):
+            return PMUStore(store_dir)
+        source_hash = file_hash(path)
+
+    meta = _read_store_meta(store_dir)
+    if meta is not None and meta.get("source_hash") == source_hash:
+        _write_store_meta(store_dir, {**meta, **stat})
+        return PMUStore(store_dir)
+    return convert_gridradar_csv(path, store_dir, chunksize=chunksize)
+
+
+class PMUStore:
+    """Memory-mapped PMU frequency store written by convert_gridradar_csv.
+
+    Timestamps are int64 UTC nanoseconds and frequencies are float32, one flat file per
+    column. Nothing is read from disk until a slice of a column is requested.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / "meta.json") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported PMU store version in {self.store_dir}")
+        self.columns = meta["columns"]
+        self.source = meta["source"]
+        self.is_sorted = meta["sorted"]
+        self.n_rows = meta["n_rows"]
+        self.time = self._map("time.i64", np.int64)
+
+    def _map(self, name, dtype):
+        if self.n_rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.store_dir / name, dtype=dtype, mode="r", shape=(self.n_rows,))
+
+    def __len__(self):
+        return self.n_rows
+
+    def column(self, name):
+        """Memory-mapped float32 frequencies [Hz] for one PMU."""
+        return self._map(f"col_{self.columns.index(name)}.f32", np.float32)
+
+    def row_slice(self, start=None, end=None, tz="Europe/Madrid"):
+        """Rows between start and end (inclusive) as a slice, via binary search.
+
+        Naive bounds are wall-clock times in tz (the timezone to_frame returns by default).
+        """
+        if not self.is_sorted:
+            raise ValueError("Time-range queries need a store with sorted timestamps")
+        tz = "UTC" if tz is None else tz
+        i0 = (
+            0
+            if start is None
+            else int(np.searchsorted(self.time, bound_ns(start, tz), side="left"))
+        )
+        i1 = (
+            self.n_rows
+            if end is None
+            else int(np.searchsorted(self.time, bound_ns(end, tz), side="right"))
+        )
+        return slice(i0, i1)
+
+    def iter_chunks(
+        self, chunksize=1_000_000, columns=None, start=None, end=None, tz="Europe/Madrid"
+    ):
+        """Yield (time, values) blocks so downstream code can stream the store.
+
+        Args:
+            chunksize (int, optional): Rows per block. Defaults to 1,000,000.
+            columns (list, optional): PMUs to include. Defaults to all.
+            start (datetime-like, optional): First timestamp (inclusive)
+            end (datetime-like, optional): Last timestamp (inclusive)
+            tz (str, optional): Timezone of naive start/end. Defaults to 'Europe/Madrid'.
+
+        Yields:
+            tuple: int64 nanosecond array and float32 array of shape (rows, columns)
+        """
+        columns = self.columns if columns is None else columns
+        rows = (
+            self.row_slice(start, end, tz)
+            if (start is not None or end is not None)
+            else slice(0, self.n_rows)
+        )
+        maps = [self.column(c) for c in columns]
+        for i0 in range(rows.start, rows.stop, chunksize):
+            i1 = min(i0 + chunksize, rows.stop)
+            values = np.empty((i1 - i0, len(columns)), dtype=np.float32)
+            for j, m in enumerate(maps):
+                values[:, j] = m[i0:i1]
+            yield np.array(self.time[i0:i1]), values
+
+    def to_frame(self, start=None, end=None, columns=None, tz="Europe/Madrid", dropna=None):
+        """Materialize a time window as a DataFrame for the plotting and RoCoF code.
+
+        Args:
+            start (datetime-like, optional): First timestamp (inclusive). Defaults to the start of the store.
+            end (datetime-like, optional): Last timestamp (inclusive). Defaults to the end of the store.
+            columns (list, optional): PMUs to include. Defaults to all.
+            tz (str, optional): Timezone for the index, and of naive start/end. Defaults to
+                'Europe/Madrid'.
+            dropna (str or list, optional): Drop rows where these PMUs are NaN, e.g. 'ES_Malaga'
+
+        Returns:
+            pd.DataFrame: float32 frequencies [Hz] with a tz-aware ``time`` index
+        """
+        columns = self.columns if columns is None else columns
+        rows = (
+            self.row_slice(start, end, tz)
+            if (start is not None or end is not None)
+            else slice(0, self.n_rows)
+        )
+
+        index = pd.DatetimeIndex(np.array(self.time[rows]).view("datetime64[ns]"), name="time")
+        index = index.tz_localize("UTC").tz_convert(tz)
+        df = pd.DataFrame({c: np.array(self.column(c)[rows]) for c in columns}, index=index)
+
+        if dropna is not None:
+            df = df.dropna(subset=[dropna] if isinstance(dropna, str) else dropna)
+        return df
@@ -0,0 +1,113 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.timestamps import NS_PER_DAY, NS_PER_HOUR, cet_to_utc
+
+
+## Day x time-of-day matrices
+def _wall_and_utc(index, tz):
+    # Naive indexes are CET/CEST wall-clock time (the loaders' default); aware ones are
+    # converted to tz for the wall clock
+    if index.tz is None:
+        wall_ns = index.as_unit("ns").asi8
+        return wall_ns, cet_to_utc(wall_ns, nonexistent="shift")
+    utc_ns = index.as_unit("ns").asi8
+    return index.tz_convert(tz).tz_localize(None).as_unit("ns").asi8, utc_ns
+
+
+def day_matrix(series, freq=None, align="wall", tz="Europe/Madrid"):
+    """Reshape an MTU-indexed series into a dense days x time-of-day matrix in one step.
+
+    Each row is a calendar day, each column a time slot. Samples falling in the same
+    cell are averaged and empty cells are NaN, so the matrix is dense however many days
+    are missing. Daylight saving time is handled by align:
+
+    - ``'wall'``: slots are wall-clock times (0:00 to 24:00). The skipped March hour is
+      NaN and the repeated October hour is the mean of its two occurrences.
+    - ``'elapsed'``: slots are the time elapsed since local midnight over 25 hours, so a
+      25-hour October day keeps all its samples and a 23-hour March day ends early.
+
+    Args:
+        series (pd.Series): Values with a DatetimeIndex (naive CET/CEST wall-clock time or
+            tz-aware)
+        freq (str or pd.Timedelta, optional): Slot width. Defaults to the median spacing.
+        align (str, optional): 'wall' or 'elapsed'. Defaults to 'wall'.
+        tz (str, optional): Time zone of the wall clock for tz-aware indexes. Defaults to
+            'Europe/Madrid'.
+
+    Returns:
+        pd.DataFrame: One row per day (``date`` index, midnight timestamps) and one column
+            per slot, labelled by the time of day in hours (0, 0.25, ...)
+    """
+    index = pd.DatetimeIndex(series.index)
+    values = series.to_numpy(dtype=np.float64)
+    if freq is None:
+        freq = pd.Series(index).diff().abs().median() if len(index) > 1 else pd.Timedelta("1h")
+    step_ns = pd.Timedelta(freq).value
+
+    wall_ns, utc_ns = _wall_and_utc(index, tz)
+    days, row = np.unique(np.floor_divide(wall_ns, NS_PER_DAY) * NS_PER_DAY, return_inverse=True)
+    if align == "wall":
+        offset_ns = wall_ns - days[row]
+        n_slots = NS_PER_DAY // step_ns
+    elif align == "elapsed":
+        # Local midnight always exists, so its UTC instant is unambiguous
+        if index.tz is None:
+            midnight_ns = cet_to_utc(days)
+        else:
+            midnight_ns = (
+                pd.DatetimeIndex(days.view("datetime64[ns]")).tz_localize(tz).as_unit("ns").asi8
+            )
+        offset_ns = utc_ns - midnight_ns[row]
+        n_slots = (NS_PER_DAY + NS_PER_HOUR) // step_ns
+    else:
+        raise ValueError(f"Unknown align option: {align}")
+
+    cell = row * n_slots + np.clip(offset_ns // step_ns, 0, n_slots - 1)
+    valid = ~np.isnan(values)
+    sums = np.bincount(cell[valid], weights=values[valid], minlength=len(days) * n_slots)
+    counts = np.bincount(cell[valid], minlength=len(days) * n_slots)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = (sums / counts).reshape(len(days), n_slots)
+
+    return pd.DataFrame(
+        matrix,
+        index=pd.DatetimeIndex(days.view("datetime64[ns]"), name="date"),
+        columns=pd.Index(np.arange(n_slots) * step_ns / NS_PER_HOUR, name="time_of_day"),
+    )
+
+
+def nan_separated(matrix):
+    """Flatten a day matrix into (x, y) arrays for one trace, with NaN between days.
+
+    Args:
+        matrix (pd.DataFrame): Output of day_matrix
+
+    Returns:
+        tuple: (x, y) float arrays of length days x (slots + 1)
+    """
+    n_days, n_slots = matrix.shape
+    x = np.tile(np.append(matrix.columns.to_numpy(dtype=np.float64), np.nan), n_days)
+    y = np.hstack([matrix.to_numpy(dtype=np.float64), np.full((n_days, 1), np.nan)]).ravel()
+    return x, y
+
+
+def profile_percentiles(matrix, percentiles=(5, 25, 50, 75, 95)):
+    """Percentiles across days for every slot (NaN days ignored).
+
+    Args:
+        matrix (pd.DataFrame): Output of day_matrix
+        percentiles (tuple, optional): Defaults to (5, 25, 50, 75, 95).
+
+    Returns:
+        pd.DataFrame: One row per percentile, one column per slot
+    """
+    with warnings.catch_warnings():
+        # Slots with no data in any day stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        values = np.nanpercentile(matrix.to_numpy(dtype=np.float64), percentiles, axis=0)
+    return pd.DataFrame(
+        values, index=pd.Index(percentiles, name="percentile"), columns=matrix.columns
+    )
@@ -0,0 +1,355 @@
+import json
+from pathlib import Path
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from apagon_april28.timestamps import bound_ns
+
+# Bump when the on-disk layout changes
+PYRAMID_VERSION = 1
+
+# Per-bucket statistics kept at every level (count is the number of non-NaN samples)
+PYRAMID_STATS = {"min": np.float32, "max": np.float32, "mean": np.float32, "count": np.int32}
+
+
+## Chunk sources
+def _index_ns(index, tz):
+    # int64 UTC ns of a DataFrame index; a naive index is wall-clock time in tz (None: UTC)
+    index = pd.DatetimeIndex(index)
+    if index.tz is None and tz is not None:
+        index = index.tz_localize(tz, ambiguous="infer")
+    return index.as_unit("ns").asi8
+
+
+def _frame_chunks(df, columns, chunksize, tz):
+    # DataFrames (e.g. Toledo data or pmu_df) -> int64 UTC ns and float32 values
+    time = _index_ns(df.index, tz)
+    values = df[columns].to_numpy(dtype=np.float32)
+    for i0 in range(0, len(df), chunksize):
+        yield time[i0 : i0 + chunksize], values[i0 : i0 + chunksize]
+
+
+def _source_chunks(source, columns, chunksize, tz):
+    if isinstance(source, pd.Series):
+        source = source.to_frame()
+    if isinstance(source, pd.DataFrame):
+        columns = list(source.columns) if columns is None else list(columns)
+        return columns, _frame_chunks(source, columns, chunksize, tz)
+    # pmu.PMUStore, or anything else with columns and iter_chunks
+    columns = list(source.columns) if columns is None else list(columns)
+    return columns, source.iter_chunks(chunksize=chunksize, columns=columns)
+
+
+def _time_span(source, tz):
+    if isinstance(source, (pd.Series, pd.DataFrame)):
+        time = _index_ns(source.index, tz)
+    else:
+        time = source.time
+    return (int(time[0]), int(time[-1])) if len(time) else (0, 0)
+
+
+def _time_index(utc_ns, tz):
+    index = pd.DatetimeIndex(
+        np.asarray(utc_ns, dtype=np.int64).view("datetime64[ns]"), name="time"
+    )
+    index = index.tz_localize("UTC")
+    return index if tz is None else index.tz_convert(tz)
+
+
+## Aggregation
+def _aggregate(ids, low, high, total, count):
+    # Merge consecutive rows that share a bucket id (ids must be sorted)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    return (
+        ids[starts],
+        np.fmin.reduceat(low, starts, axis=0),
+        np.fmax.reduceat(high, starts, axis=0),
+        np.add.reduceat(total, starts, axis=0),
+        np.add.reduceat(count, starts, axis=0),
+    )
+
+
+class _LevelWriter:
+    """Appends one level's buckets, holding back the last bucket until it is complete."""
+
+    def __init__(self, level_dir):
+        level_dir.mkdir(parents=True)
+        self.files = {
+            name: open(level_dir / f"{name}.bin", "wb") for name in ["ids", *PYRAMID_STATS]
+        }
+        self.pending = None
+        self.n_buckets = 0
+
+    def append(self, ids, low, high, total, count):
+        if len(ids) == 0:
+            return
+        if self.pending is not None:
+            if self.pending[0][0] == ids[0]:
+                # The previous chunk ended inside this bucket: merge the two partial buckets
+                p_ids, p_low, p_high, p_total, p_count = self.pending
+                low, high, total, count = low.copy(), high.copy(), total.copy(), count.copy()
+                low[0] = np.fmin(low[0], p_low[0])
+                high[0] = np.fmax(high[0], p_high[0])
+                total[0] += p_total[0]
+                count[0] += p_count[0]
+            else:
+                self._write(*self.pending)
+        self._write(ids[:-1], low[:-1], high[:-1], total[:-1], count[:-1])
+        self.pending = (ids[-1:], low[-1:], high[-1:], total[-1:], count[-1:])
+
+    def _write(self, ids, low, high, total, count):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, np.nan)
+        self.files["ids"].write(np.asarray(ids, dtype=np.int64).tobytes())
+        self.files["min"].write(np.asarray(low, dtype=np.float32).tobytes())
+        self.files["max"].write(np.asarray(high, dtype=np.float32).tobytes())
+        self.files["mean"].write(np.asarray(mean, dtype=np.float32).tobytes())
+        self.files["count"].write(np.asarray(count, dtype=np.int32).tobytes())
+        self.n_buckets += len(ids)
+
+    def close(self):
+        if self.pending is not None:
+            self._write(*self.pending)
+            self.pending = None
+        for f in self.files.values():
+            f.close()
+
+
+## Build
+def build_pyramid(
+    source,
+    store_dir=None,
+    base="100ms",
+    n_levels=None,
+    columns=None,
+    chunksize=1_000_000,
+    tz="Europe/Madrid",
+):
+    """Precompute per-bucket min/max/mean for every channel at power-of-two resolutions.
+
+    Level 0 buckets are ``base`` wide (aligned to the Unix epoch) and level k buckets are
+    ``base * 2**k`` wide. The source is read once, chunk by chunk: each chunk is reduced to
+    level-0 buckets, and every coarser level is reduced from the level below it, so the
+    total work is about twice the level-0 pass and memory scales with the chunk size.
+    Only non-empty buckets are stored, so gaps in the data cost nothing.
+
+    Args:
+        source (pmu.PMUStore, pd.DataFrame or pd.Series): Sorted time series, e.g. the
+            store from pmu.load_gridradar, pmu_df, or toledo_data['AnalyzerL1Frequency']
+        store_dir (str or Path, optional): Directory to write to (replaced if it exists).
+            Defaults to a 'pyramid' directory inside a PMUStore; required for DataFrames.
+        base (str or pd.Timedelta, optional): Level-0 bucket width. Defaults to '100ms'
+            (one 10 Hz GridRadar sample).
+        n_levels (int, optional): Number of levels. Defaults to enough levels for the
+            coarsest one to hold at most a few buckets over the whole span.
+        columns (list, optional): Channels to include. Defaults to all.
+        chunksize (int, optional): Rows per chunk. Defaults to 1,000,000.
+        tz (str, optional): Timezone of a naive DataFrame index (None for UTC). Defaults
+            to 'Europe/Madrid'.
+
+    Returns:
+        Pyramid: The new store
+    """
+    if store_dir is None:
+        if not hasattr(source, "store_dir"):
+            raise ValueError("store_dir is required unless source is a PMUStore")
+        store_dir = Path(source.store_dir) / "pyramid"
+    store_dir = Path(store_dir)
+    base_ns = pd.Timedelta(base).value
+    if n_levels is None:
+        t_first, t_last = _time_span(source, tz)
+        n_levels = max(1, int(np.ceil(np.log2(max((t_last - t_first) / base_ns, 1)))) + 1)
+
+    tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    columns, chunks = _source_chunks(source, columns, chunksize, tz)
+    writers = [_LevelWriter(tmp_dir / f"level_{k}") for k in range(n_levels)]
+    t_first, t_last, last_time = None, None, None
+    try:
+        for time, values in chunks:
+            if len(time) == 0:
+                continue
+            if (last_time is not None and time[0] < last_time) or np.any(np.diff(time) < 0):
+                raise ValueError("build_pyramid needs a source with sorted timestamps")
+            t_first = time[0] if t_first is None else t_first
+            last_time = t_last = time[-1]
+
+            values = np.asarray(values, dtype=np.float64)
+            is_valid = ~np.isnan(values)
+            level = _aggregate(
+                np.floor_divide(time, base_ns),
+                values,
+                values,
+                np.where(is_valid, values, 0.0),
+                is_valid.astype(np.int64),
+            )
+            writers[0].append(*level)
+            for writer in writers[1:]:
+                level = _aggregate(level[0] >> 1, *level[1:])
+                writer.append(*level)
+    finally:
+        for writer in writers:
+            writer.close()
+
+    meta = {
+        "version": PYRAMID_VERSION,
+        "columns": columns,
+        "base_ns": int(base_ns),
+        "n_levels": n_levels,
+        "n_buckets": [writer.n_buckets for writer in writers],
+        "start": None if t_first is None else int(t_first),
+        "end": None if t_last is None else int(t_last),
+    }
+    with open(tmp_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    tmp_dir.rename(store_dir)
+    return Pyramid(store_dir)
+
+
+def load_pyramid(store, store_dir=None, base="100ms"):
+    """Open the pyramid for a PMUStore, building it on first use (see build_pyramid)."""
+    store_dir = Path(store.store_dir) / "pyramid" if store_dir is None else Path(store_dir)
+    try:
+        pyramid = Pyramid(store_dir)
+        if pyramid.base_ns == pd.Timedelta(base).value:
+            return pyramid
+    except (OSError, ValueError):
+        pass
+    return build_pyramid(store, store_dir, base=base)
+
+
+## Store
+class Pyramid:
+    """Memory-mapped multi-resolution store written by build_pyramid.
+
+    Each level holds sorted bucket ids (bucket start = id * width, in UTC nanoseconds) and
+    per-channel min, max, mean and non-NaN count arrays of shape (n_buckets, n_channels).
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / "meta.json") as f:
+            meta = json.load(f)
+        if meta.get("version") != PYRAMID_VERSION:
+            raise ValueError(f"Unsupported pyramid version in {self.store_dir}")
+        self.columns = meta["columns"]
+        self.base_ns = meta["base_ns"]
+        self.n_levels = meta["n_levels"]
+        self.n_buckets = meta["n_buckets"]
+        self.start, self.end = meta["start"], meta["end"]
+        self._levels = {}
+
+    def bucket_width(self, level):
+        """Bucket width of a level as a pd.Timedelta."""
+        return pd.Timedelta(self.base_ns << level, unit="ns")
+
+    def level(self, k):
+        """Memory-mapped arrays of level k: 'ids' and one (n_buckets, n_channels) array per stat."""
+        if k not in self._levels:
+            n = self.n_buckets[k]
+            level_dir = self.store_dir / f"level_{k}"
+            arrays = {"ids": self._map(level_dir / "ids.bin", np.int64, (n,))}
+            for name, dtype in PYRAMID_STATS.items():
+                arrays[name] = self._map(level_dir / f"{name}.bin", dtype, (n, len(self.columns)))
+            self._levels[k] = arrays
+        return self._levels[k]
+
+    def _map(self, path, dtype, shape):
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def _bucket_rows(self, k, t0_ns, t1_ns):
+        ids = self.level(k)["ids"]
+        width = self.base_ns << k
+        i0 = 0 if t0_ns is None else int(np.searchsorted(ids, t0_ns // width, side="left"))
+        i1 = len(ids) if t1_ns is None else int(np.searchsorted(ids, t1_ns // width, side="right"))
+        return i0, max(i0, i1)
+
+    def _bounds_ns(self, t0, t1, tz):
+        # Naive bounds are wall-clock times in tz, as in PMUStore and TimeSeriesIndex
+        t0_ns = None if t0 is None else bound_ns(t0, tz)
+        t1_ns = None if t1 is None else bound_ns(t1, tz)
+        return t0_ns, t1_ns
+
+    def choose_level(self, t0=None, t1=None, max_points=2000, tz="Europe/Madrid"):
+        """Finest level with at most max_points non-empty buckets between t0 and t1.
+
+        Naive t0/t1 are wall-clock times in tz (None for UTC).
+        """
+        t0_ns, t1_ns = self._bounds_ns(t0, t1, tz)
+        span = (self.end if t1_ns is None else t1_ns) - (self.start if t0_ns is None else t0_ns)
+        # Start from the level whose bucket count for a gap-free span would just fit
+        k = int(
+            np.clip(
+                np.floor(np.log2(max(span / (self.base_ns * max_points), 1))), 0, self.n_levels - 1
+            )
+        )
+        while k > 0:
+            i0, i1 = self._bucket_rows(k - 1, t0_ns, t1_ns)
+            if i1 - i0 > max_points:
+                break
+            k -= 1
+        while k < self.n_levels - 1:
+            i0, i1 = self._bucket_rows(k, t0_ns, t1_ns)
+            if i1 - i0 <= max_points:
+                break
+            k += 1
+        return k
+
+    def query(self, channel, t0=None, t1=None, max_points=2000, tz="Europe/Madrid"):
+        """Per-bucket min/max/mean of one channel between t0 and t1, at most max_points rows.
+
+        Picks the finest level that fits, so the cost depends on max_points, not on how
+        much raw data lies underneath. Buckets overlapping the window edges are included.
+
+        Args:
+            channel (str): Channel name, e.g. 'ES_Malaga'
+            t0 (datetime-like, optional): Window start. Defaults to the start of the data.
+            t1 (datetime-like, optional): Window end. Defaults to the end of the data.
+            max_points (int, optional): Maximum number of buckets returned. Defaults to 2000.
+            tz (str, optional): Timezone of the returned index and of naive t0/t1 (None for
+                UTC). Defaults to 'Europe/Madrid'.
+
+        Returns:
+            pd.DataFrame: 'min', 'max', 'mean' and 'count' indexed by bucket start; the
+                level and bucket width are in ``df.attrs``
+        """
+        t0_ns, t1_ns = self._bounds_ns(t0, t1, tz)
+        k = self.choose_level(t0_ns, t1_ns, max_points, tz=None)
+        i0, i1 = self._bucket_rows(k, t0_ns, t1_ns)
+        j = self.columns.index(channel)
+
+        arrays = self.level(k)
+        index = _time_index(np.array(arrays["ids"][i0:i1]) * (self.base_ns << k), tz)
+        df = pd.DataFrame(
+            {name: np.array(arrays[name][i0:i1, j]) for name in PYRAMID_STATS}, index=index
+        )
+        df.attrs.update(level=k, bucket_width=self.bucket_width(k))
+        return df
+
+    def envelope(self, channel, t0=None, t1=None, max_points=2000, tz="Europe/Madrid"):
+        """A min/max line for plotting: each bucket's min and max in time order.
+
+        The minimum is placed at the bucket start and the maximum at its midpoint, which at
+        screen resolution draws the same band as the raw samples. Arguments as in query.
+
+        Returns:
+            pd.Series: Values indexed by time (2 points per bucket, at most max_points)
+        """
+        t0_ns, t1_ns = self._bounds_ns(t0, t1, tz)
+        df = self.query(channel, t0_ns, t1_ns, max_points=max(max_points // 2, 1), tz=None)
+        start = df.index.as_unit("ns").asi8
+        times = np.empty(2 * len(df), dtype=np.int64)
+        times[0::2], times[1::2] = start, start + (self.base_ns << df.attrs["level"]) // 2
+        values = np.empty(2 * len(df), dtype=np.float64)
+        values[0::2], values[1::2] = df["min"].to_numpy(), df["max"].to_numpy()
+        return pd.Series(values, index=_time_index(times, tz), name=channel)
@@ -0,0 +1,274 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import importlib
+import json
+import os
+from pathlib import Path
+import time
+
+from apagon_april28 import paths, templates
+
+# Data shared with every worker, set once per process by _init_worker
+_worker_data = {}
+
+
+## Spec helpers
+def _resolve_plot(plot):
+    # Specs may name a function in apagon_april28.plots ('create_frequency_plot') or give a
+    # dotted path ('my_module.my_plot'); callables must be importable top-level functions
+    if callable(plot):
+        return plot
+    module_name, _, function_name = plot.rpartition(".")
+    module = importlib.import_module(module_name or "apagon_april28.plots")
+    return getattr(module, function_name)
+
+
+def _plot_source(plot):
+    plot = _resolve_plot(plot)
+    module = importlib.import_module(plot.__module__)
+    return getattr(module, "__file__", None)
+
+
+def output_paths(spec, output_dir=None, formats=("png",)):
+    """Files a spec writes: one per format, named after spec['name']."""
+    output_dir = Path(spec.get("output_dir", output_dir or paths.figures_dir))
+    return [output_dir / f"{spec['name']}.{fmt}" for fmt in spec.get("formats", formats)]
+
+
+def spec_hash(spec):
+    """Hash of what a spec draws: the plot function, data keys and (write) kwargs."""
+    plot = spec["plot"]
+    if callable(plot):
+        plot = f"{plot.__module__}.{plot.__qualname__}"
+    content = [plot, _as_list(spec.get("data")), spec.get("kwargs", {})]
+    content.append(spec.get("write_kwargs", {}))
+    # Timestamps and other non-JSON values hash by their repr
+    text = json.dumps(content, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _hash_path(spec, output_dir=None):
+    output_dir = Path(spec.get("output_dir", output_dir or paths.figures_dir))
+    return output_dir / f"{spec['name']}.spec.sha256"
+
+
+def is_stale(spec, output_dir=None, formats=("png",)):
+    """True if any output is missing or older than its inputs, or the spec has changed.
+
+    Inputs are the spec's ``inputs`` files, the plot function's source and the templates
+    module. The spec's arguments are compared through spec_hash with the hash stored next
+    to the outputs when they were rendered.
+
+    Args:
+        spec (dict): Figure spec (see render_figures)
+        output_dir (str or Path, optional): Default output directory
+        formats (tuple, optional): Default formats
+
+    Returns:
+        bool
+    """
+    outputs = output_paths(spec, output_dir, formats)
+    if not all(p.exists() for p in outputs):
+        return True
+    hash_path = _hash_path(spec, output_dir)
+    if not hash_path.exists() or hash_path.read_text().strip() != spec_hash(spec):
+        return True
+    inputs = [Path(p) for p in spec.get("inputs", [])]
+    inputs.append(Path(templates.__file__))
+    source = _plot_source(spec["plot"])
+    if source is not None:
+        inputs.append(Path(source))
+    newest_input = max((p.stat().st_mtime for p in inputs if p.exists()), default=0.0)
+    oldest_output = min(p.stat().st_mtime for p in outputs)
+    return oldest_output <= newest_input
+
+
+## Workers
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+    # Pay the plotly/kaleido import cost once per worker instead of once per figure
+    import plotly.io  # noqa: F401
+
+    try:
+        import kaleido
+    except ImportError:
+        return
+    # Kaleido 1.x launches a Chromium per write_image unless a sync server is running;
+    # keep one per worker and stop it when the worker exits (pool workers skip atexit)
+    if hasattr(kaleido, "start_sync_server") and _chrome_available():
+        from multiprocessing.util import Finalize
+
+        kaleido.start_sync_server(silence_warnings=True)
+        Finalize(
+            None, kaleido.stop_sync_server, kwargs={"silence_warnings": True}, exitpriority=10
+        )
+
+
+def _chrome_available():
+    # Without a browser the sync server thread dies and its callers wait forever; leave
+    # write_image to raise its own "Chrome not found" error instead
+    if os.environ.get("BROWSER_PATH"):
+        return True
+    try:
+        from choreographer.browsers.chromium import Chromium
+    except ImportError:
+        return False
+    return Chromium.find_browser(skip_local=False) is not None
+
+
+def _write_figure(fig, paths, write_kwargs):
+    for path in paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fmt = path.suffix.lstrip(".")
+        if hasattr(fig, "savefig"):  # matplotlib
+            if fmt == "html":
+                raise ValueError(f"Cannot write a matplotlib figure as HTML: {path.name}")
+            fig.savefig(path, **write_kwargs)
+        elif fmt == "html":
+            fig.write_html(path, include_plotlyjs="cdn")
+        else:
+            templates.svg_figure(fig).write_image(path, **write_kwargs)
+
+
+def _render_one(spec, paths, hash_path):
+    start = time.perf_counter()
+    plot = _resolve_plot(spec["plot"])
+    args = [_worker_data[key] for key in _as_list(spec.get("data"))]
+    fig = plot(*args, **spec.get("kwargs", {}))
+    if isinstance(fig, dict):  # e.g. create_grid_frequency_spectrogram
+        fig = fig["fig"]
+    _write_figure(fig, paths, spec.get("write_kwargs", {}))
+    hash_path.write_text(spec_hash(spec))
+    if hasattr(fig, "savefig"):
+        import matplotlib.pyplot as plt
+
+        plt.close(fig)
+    return time.perf_counter() - start
+
+
+def _as_list(keys):
+    if keys is None:
+        return []
+    return [keys] if isinstance(keys, str) else list(keys)
+
+
+## Renderer
+class FigureRenderer:
+    """Persistent pool of figure-rendering worker processes.
+
+    Each worker receives the shared ``data`` once when it starts, keeps plotly (or
+    matplotlib) loaded and, with Kaleido 1.x, runs one Kaleido sync server (a single
+    Chromium) for all its figures, so a batch pays the start-up cost once per worker
+    rather than once per figure. Use as a context manager, or call close().
+
+    Args:
+        data (dict, optional): Named inputs the specs refer to, e.g. {'pmu_df': pmu_df}
+        max_workers (int, optional): Worker processes. Defaults to os.cpu_count().
+        output_dir (str or Path, optional): Default output directory. Defaults to paths.figures_dir.
+        formats (tuple, optional): Default output formats. Defaults to ('png',).
+    """
+
+    def __init__(self, data=None, max_workers=None, output_dir=None, formats=("png",)):
+        self.data = data or {}
+        self.output_dir = Path(output_dir or paths.figures_dir)
+        self.formats = tuple(formats)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker, initargs=(self.data,)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def render(self, specs, force=False):
+        """Render every stale spec in parallel.
+
+        Args:
+            specs (list): Figure specs (see render_figures)
+            force (bool, optional): Render even if outputs are up to date. Defaults to False.
+
+        Returns:
+            list: One dict per spec with 'name', 'status' ('rendered', 'skipped' or 'failed'),
+                'paths', 'seconds' and 'error'
+        """
+        results, futures = [], []
+        for spec in specs:
+            paths = output_paths(spec, self.output_dir, self.formats)
+            result = {"name": spec["name"], "paths": paths, "seconds": 0.0, "error": None}
+            results.append(result)
+            if not force and not is_stale(spec, self.output_dir, self.formats):
+                result["status"] = "skipped"
+                continue
+            hash_path = _hash_path(spec, self.output_dir)
+            futures.append((result, self._pool.submit(_render_one, spec, paths, hash_path)))
+
+        for result, future in futures:
+            try:
+                result["seconds"] = future.result()
+                result["status"] = "rendered"
+            except Exception as error:
+                result["status"] = "failed"
+                result["error"] = repr(error)
+        return results
+
+
+def render_figures(
+    specs, data=None, max_workers=None, output_dir=None, formats=("png",), force=False
+):
+    """Render a declarative list of figure specs in parallel, skipping up-to-date outputs.
+
+    A spec is a dict:
+
+    - ``name``: output file stem, e.g. 'frequency_overview'
+    - ``plot``: function name in apagon_april28.plots, a dotted path, or a top-level callable
+    - ``data``: key (or list of keys) into ``data`` passed as leading positional arguments
+    - ``kwargs``: keyword arguments for the plot function (window, title, ...)
+    - ``inputs``: optional files the figure depends on; outputs older than any of them
+      (or than the plot function's or templates module's source) are re-rendered, as
+      are outputs whose spec arguments changed since they were drawn
+    - ``formats``, ``output_dir``, ``write_kwargs``: optional per-spec overrides
+
+    Example:
+        specs = [
+            {'name': 'frequency_overview', 'plot': 'create_frequency_plot', 'data': 'pmu_df',
+             'kwargs': dict(start_time=t0, end_time=t1, pmu_aliases=pmu_aliases,
+                            title_text='Grid Frequency Measurements Across Europe')},
+        ]
+        render_figures(specs, data={'pmu_df': pmu_df}, formats=('png', 'html'))
+
+    Args:
+        specs (list): Figure specs
+        data (dict, optional): Named inputs shared with all workers
+        max_workers (int, optional): Worker processes. Defaults to os.cpu_count().
+        output_dir (str or Path, optional): Default output directory. Defaults to paths.figures_dir.
+        formats (tuple, optional): Default output formats ('png', 'svg', 'pdf', 'html').
+            Defaults to ('png',).
+        force (bool, optional): Render even if outputs are up to date. Defaults to False.
+
+    Returns:
+        list: Per-spec results (see FigureRenderer.render)
+    """
+    stale = specs if force else [s for s in specs if is_stale(s, output_dir, formats)]
+    if not stale:
+        return [
+            {
+                "name": s["name"],
+                "status": "skipped",
+                "paths": output_paths(s, output_dir, formats),
+                "seconds": 0.0,
+                "error": None,
+            }
+            for s in specs
+        ]
+    workers = min(max_workers or os.cpu_count() or 1, len(stale))
+    with FigureRenderer(
+        data, max_workers=workers, output_dir=output_dir, formats=formats
+    ) as renderer:
+        return renderer.render(specs, force=force)
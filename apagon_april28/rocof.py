@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+from apagon_april28.constants import entsoe_rocof_limit
+
+# Moving-average windows used in the report (ENTSO-E limit is defined on 500ms)
+default_rocof_windows = {
+    "rocof_500ms": pd.Timedelta("500ms"),
+    "rocof_1000ms": pd.Timedelta("1000ms"),
+    "rocof_2000ms": pd.Timedelta("2000ms"),
+}
+
+
+## RoCoF
+def _index_ns(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit("ns").asi8
+    return np.asarray(index, dtype=np.int64)
+
+
+def window_samples(index, duration):
+    """Number of samples covering a duration, based on the median sample interval."""
+    time_ns = _index_ns(index)
+    median_step = np.median(np.diff(time_ns))
+    return max(1, int(round(pd.Timedelta(duration).value / median_step)))
+
+
+def compute_rocof(pmu_df, windows=None, columns=None):
+    """Compute instantaneous and moving-average RoCoF for every PMU in one pass.
+
+    The instantaneous RoCoF divides each frequency step by the real time between samples,
+    so gaps and jitter in the PMU clock are honoured. Every moving average is then read off
+    a single cumulative sum of the instantaneous values. As with ``rolling(n).mean()``, a
+    window containing a NaN is NaN.
+
+    Args:
+        pmu_df (pd.DataFrame): Frequencies [Hz] with a DatetimeIndex, one column per PMU
+        windows (dict, optional): Output name -> window duration. Defaults to
+            default_rocof_windows (500ms, 1000ms, 2000ms).
+        columns (list, optional): PMUs to include. Defaults to all columns.
+
+    Returns:
+        pd.DataFrame: RoCoF [Hz/s] with two column levels, ``window`` ('rocof_instantaneous',
+            'rocof_500ms', ...) and ``pmu``. Use rocof['rocof_instantaneous'] for all PMUs or
+            rocof.xs('ES_Malaga', axis=1, level='pmu') for all windows of one PMU.
+    """
+    windows = default_rocof_windows if windows is None else windows
+    columns = list(pmu_df.columns) if columns is None else list(columns)
+
+    time_ns = _index_ns(pmu_df.index)
+    frequency = pmu_df[columns].to_numpy(dtype=np.float64)
+    n_rows, n_pmus = frequency.shape
+    names = ["rocof_instantaneous"] + list(windows)
+
+    # One contiguous output block; every window writes into its own slab
+    out = np.full((n_rows, len(names), n_pmus), np.nan)
+
+    dt = np.diff(time_ns) / 1e9
+    instantaneous = out[1:, 0, :]
+    np.subtract(frequency[1:], frequency[:-1], out=instantaneous)
+    instantaneous /= dt[:, None]
+
+    if windows:
+        # Running sum of RoCoF and running count of NaNs, one leading zero row each
+        is_nan = np.isnan(instantaneous)
+        nan_count = np.zeros((n_rows, n_pmus), dtype=np.int64)
+        np.cumsum(is_nan, axis=0, out=nan_count[1:])
+        running_sum = np.zeros((n_rows, n_pmus))
+        np.cumsum(np.where(is_nan, 0.0, instantaneous), axis=0, out=running_sum[1:])
+
+        for k, duration in enumerate(windows.values(), start=1):
+            n = window_samples(time_ns, duration)
+            if n >= n_rows:
+                continue
+            # rows i >= n average instantaneous RoCoF over rows i-n+1 .. i
+            mean = out[n:, k, :]
+            np.subtract(running_sum[n:], running_sum[:-n], out=mean)
+            mean /= n
+            mean[(nan_count[n:] - nan_count[:-n]) > 0] = np.nan
+
+    column_index = pd.MultiIndex.from_product([names, columns], names=["window", "pmu"])
+    return pd.DataFrame(out.reshape(n_rows, -1), index=pmu_df.index, columns=column_index)
+
+
+## Limit breaches
+def rocof_limit_breaches(rocof, limit=entsoe_rocof_limit):
+    """Find the intervals where RoCoF exceeds +/- limit, for every window and PMU at once.
+
+    Args:
+        rocof (pd.DataFrame): Output of compute_rocof (two column levels) or any frame of
+            RoCoF values [Hz/s] with a DatetimeIndex
+        limit (float, optional): Limit [Hz/s]. Defaults to constants.entsoe_rocof_limit.
+
+    Returns:
+        pd.DataFrame: One row per breach with the column key(s), 'start', 'end' (last sample
+            above the limit), 'duration', 'n_samples' and 'peak' (signed RoCoF of largest magnitude)
+    """
+    values = rocof.to_numpy(dtype=np.float64)
+    n_rows, n_cols = values.shape
+
+    # Column-major so that nonzero() returns intervals grouped by column, in time order
+    above = np.zeros((n_cols, n_rows + 2), dtype=np.int8)
+    above[:, 1:-1] = (np.abs(values) > limit).T
+    edges = np.diff(above, axis=1)
+    start_col, start_row = np.nonzero(edges == 1)
+    _, stop_row = np.nonzero(edges == -1)
+
+    peaks = np.empty(len(start_row))
+    if len(start_row):
+        # Segment-wise max and min via reduceat; a trailing sentinel keeps the last stop in range
+        flat = np.append(values.T.ravel(), 0.0)
+        offsets = start_col * n_rows
+        bounds = np.column_stack([offsets + start_row, offsets + stop_row]).ravel()
+        highest = np.maximum.reduceat(flat, bounds)[::2]
+        lowest = np.minimum.reduceat(flat, bounds)[::2]
+        peaks = np.where(-lowest > highest, lowest, highest)
+
+    index = rocof.index
+    starts = index[start_row]
+    ends = index[stop_row - 1]
+    if isinstance(rocof.columns, pd.MultiIndex):
+        keys = pd.DataFrame(list(rocof.columns[start_col]), columns=rocof.columns.names)
+    else:
+        keys = pd.DataFrame({rocof.columns.name or "column": rocof.columns[start_col]})
+
+    breaches = keys.assign(
+        start=starts,
+        end=ends,
+        duration=ends - starts,
+        n_samples=stop_row - start_row,
+        peak=peaks,
+    )
+    return breaches.sort_values("start", kind="stable").reset_index(drop=True)
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+from apagon_april28.constants import (
+    entsoe_rocof_limit,
+    fcr_saturation,
+    nominal_frequency,
+)
+
+# Contingency sizes screened by default [MW]
+default_contingencies = [500, 1000, 1500, 2000, 2500, 3000]
+
+simulation_metrics = ["rocof_500ms", "nadir", "time_to_nadir"]
+
+
+## Swing equation
+def _simulate_chunk(kinetic_energy, generation, contingencies, fcr_capacity, params):
+    """Integrate one block of MTUs x contingencies; returns (rocof_500ms, nadir, time_to_nadir)."""
+    dt = params["dt"]
+    shape = (len(kinetic_energy), len(contingencies))
+
+    # One flat array per quantity with an entry per (mtu, contingency) case
+    def per_case(values):
+        return np.broadcast_to(np.asarray(values, dtype=np.float64), shape).ravel()
+
+    inverse_inertia = per_case((params["f0"] / (2.0 * kinetic_energy))[:, None])
+    damping = per_case((params["load_damping"] * generation)[:, None])
+    loss = per_case(np.asarray(contingencies, dtype=np.float64)[None, :])
+    capacity = per_case(fcr_capacity[:, None])
+    ramp = capacity / params["fcr_activation_time"] * dt
+    gain = capacity / (params["fcr_full_activation"] - params["fcr_deadband"])
+
+    n_cases = shape[0] * shape[1]
+    nadir = np.zeros(n_cases)
+    time_to_nadir = np.zeros(n_cases)
+    rocof_500ms = np.full(n_cases, np.nan)
+    n_rocof = max(1, int(round(0.5 / dt)))
+
+    # State of the cases still falling; a case freezes at its nadir (the first minimum)
+    # once the frequency turns, and frozen cases are dropped every compact_every steps
+    active = np.arange(n_cases)
+    deviation = np.zeros(n_cases)
+    fcr = np.zeros(n_cases)
+    falling = np.ones(n_cases, dtype=bool)
+    falling_steps = np.zeros(n_cases, dtype=np.int64)
+    for step in range(1, int(round(params["duration"] / dt)) + 1):
+        # FCR: proportional to the deviation beyond the deadband, capped and ramp-limited
+        target = np.clip((-deviation - params["fcr_deadband"]) * gain, 0.0, capacity)
+        fcr += np.clip(target - fcr, -ramp, ramp)
+
+        # Aggregated swing equation [Hz/s] with load self-regulation, semi-implicit Euler
+        slope = inverse_inertia * (fcr - loss - damping * deviation)
+        falling &= slope < 0
+        deviation += slope * (dt * falling)
+        falling_steps += falling
+
+        if step == n_rocof:
+            rocof_500ms[active] = deviation / (step * dt)
+        if step % params["compact_every"] == 0:
+            done = ~falling
+            nadir[active[done]] = deviation[done]
+            time_to_nadir[active[done]] = falling_steps[done] * dt
+            keep = falling
+            active, deviation, fcr, falling, falling_steps = (
+                active[keep],
+                deviation[keep],
+                fcr[keep],
+                falling[keep],
+                falling_steps[keep],
+            )
+            inverse_inertia, damping, loss = inverse_inertia[keep], damping[keep], loss[keep]
+            capacity, ramp, gain = capacity[keep], ramp[keep], gain[keep]
+            if len(active) == 0:
+                break
+
+    # Cases still falling (or frozen since the last compaction) at the end
+    nadir[active] = deviation
+    time_to_nadir[active] = falling_steps * dt
+
+    return (
+        rocof_500ms.reshape(shape),
+        params["f0"] + nadir.reshape(shape),
+        time_to_nadir.reshape(shape),
+    )
+
+
+def simulate_contingencies(
+    inertia_df,
+    fcr_capacity,
+    contingencies=None,
+    h_column="Total Inertia",
+    generation_column="Total Generation",
+    f0=nominal_frequency,
+    load_damping=0.01,
+    fcr_full_activation=fcr_saturation,
+    fcr_deadband=0.0,
+    fcr_activation_time=30.0,
+    duration=30.0,
+    dt=0.05,
+    chunk_size=50_000,
+):
+    """Simulate the loss of each contingency size in every MTU of an inertia time series.
+
+    An aggregated swing equation, with the system treated as one machine (the Iberian
+    system after separation), is integrated for all MTU x contingency pairs at once:
+
+        d(delta_f)/dt = f0 / (2 * H * S) * (P_fcr - P_loss - D * S * delta_f)
+
+    where H * S is the kinetic energy [MW s], S the total generation [MW] and D the load
+    self-regulation [1/Hz]. FCR is proportional to the frequency deviation, reaches
+    fcr_capacity at fcr_full_activation and ramps up over fcr_activation_time. The only
+    Python loop is over time steps; cases leave the integration once they have passed
+    their nadir, so the cost follows the time to nadir rather than the full duration.
+
+    Args:
+        inertia_df (pd.DataFrame): Output of inertia.compute_inertia (H [s] and total
+            generation [MW] per MTU)
+        fcr_capacity (float or array-like): FCR held in the simulated system [MW], scalar
+            or one value per MTU. The 3 GW Continental Europe FCR
+            (constants.fcr_continental_europe) is shared between TSOs by net generation,
+            so an islanded Iberia keeps only its own share of it.
+        contingencies (list, optional): Generation losses [MW]. Defaults to
+            default_contingencies (0.5 to 3 GW).
+        h_column (str, optional): Defaults to 'Total Inertia'.
+        generation_column (str, optional): Defaults to 'Total Generation'.
+        f0 (float, optional): Nominal frequency [Hz]. Defaults to 50.
+        load_damping (float, optional): Load self-regulation [fraction of load per Hz].
+            Defaults to 0.01.
+        fcr_full_activation (float, optional): Deviation for full FCR [Hz]. Defaults to 0.2.
+        fcr_deadband (float, optional): FCR deadband [Hz]. Defaults to 0.
+        fcr_activation_time (float, optional): Time to ramp to full FCR [s]. Defaults to 30.
+        duration (float, optional): Longest simulated time [s]. Defaults to 30.
+        dt (float, optional): Time step [s]. Defaults to 0.05 (within
+            about 0.015 Hz of a 2 ms step).
+        chunk_size (int, optional): MTUs integrated together, bounds memory. Defaults to 50,000.
+
+    Returns:
+        pd.DataFrame: Indexed like inertia_df, with two column levels, ``metric``
+            ('rocof_500ms' [Hz/s], 'nadir' [Hz], 'time_to_nadir' [s]) and ``contingency``
+            [MW]. Use result['nadir'] for an MTU x contingency frame. MTUs without inertia
+            are NaN.
+    """
+    contingencies = default_contingencies if contingencies is None else list(contingencies)
+    generation = inertia_df[generation_column].to_numpy(dtype=np.float64)
+    kinetic_energy = inertia_df[h_column].to_numpy(dtype=np.float64) * generation
+    fcr_capacity = np.broadcast_to(np.asarray(fcr_capacity, dtype=np.float64), generation.shape)
+    params = {
+        "f0": f0,
+        "load_damping": load_damping,
+        "fcr_full_activation": fcr_full_activation,
+        "fcr_deadband": fcr_deadband,
+        "fcr_activation_time": fcr_activation_time,
+        "duration": duration,
+        "dt": dt,
+        "compact_every": max(1, int(round(0.5 / dt))),
+    }
+
+    n_rows, n_cases = len(generation), len(contingencies)
+    out = np.full((n_rows, len(simulation_metrics), n_cases), np.nan)
+    valid = np.flatnonzero(np.isfinite(kinetic_energy) & (kinetic_energy > 0))
+    for i in range(0, len(valid), chunk_size):
+        rows = valid[i : i + chunk_size]
+        results = _simulate_chunk(
+            kinetic_energy[rows], generation[rows], contingencies, fcr_capacity[rows], params
+        )
+        for k, values in enumerate(results):
+            out[rows, k, :] = values
+
+    column_index = pd.MultiIndex.from_product(
+        [simulation_metrics, contingencies], names=["metric", "contingency"]
+    )
+    return pd.DataFrame(out.reshape(n_rows, -1), index=inertia_df.index, columns=column_index)
+
+
+## Screening
+def rocof_exceedances(simulation, limit=entsoe_rocof_limit, by=None):
+    """Count the MTUs in which each contingency would breach the RoCoF limit.
+
+    Args:
+        simulation (pd.DataFrame): Output of simulate_contingencies
+        limit (float, optional): Limit [Hz/s] on the 500ms RoCoF. Defaults to
+            constants.entsoe_rocof_limit.
+        by (str or list, optional): Index level(s) or a grouper (e.g. index.year) to count
+            per group. Defaults to a single total.
+
+    Returns:
+        pd.DataFrame or pd.Series: Number of MTUs above the limit per contingency
+    """
+    rocof_500ms = simulation["rocof_500ms"]
+    above = rocof_500ms.abs() > limit
+    if by is None:
+        return above.sum()
+    return above.groupby(by).sum()
@@ -0,0 +1,216 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+## Streaming spectrogram
+class StreamingSpectrogram:
+    """Short-time Fourier transform that only computes windows completed by new samples.
+
+    Matches ``scipy.signal.spectrogram(..., window='hann', detrend='constant',
+    scaling='density')`` on the same data, but keeps the tail of the previous call so that
+    appending a few seconds of 10 Hz data costs only the few FFTs it completes. The power
+    matrix lives in a ring buffer that grows by doubling up to ``max_windows`` and then
+    overwrites the oldest columns.
+
+    Args:
+        fs (float, optional): Sampling frequency [Hz]. Defaults to 10.
+        window_size (int, optional): Samples per FFT window. Defaults to 600 (60 s at 10 Hz).
+        overlap (float, optional): Overlap between consecutive windows. Defaults to 0.75.
+        freq_band (tuple, optional): (f_min, f_max) [Hz] rows to keep, e.g. (0.05, 0.3) for
+            sub-synchronous oscillations. Defaults to the full one-sided spectrum.
+        max_windows (int, optional): Most recent windows to keep. Defaults to unbounded.
+    """
+
+    def __init__(self, fs=10, window_size=600, overlap=0.75, freq_band=None, max_windows=None):
+        self.fs = fs
+        self.window_size = window_size
+        self.overlap = overlap
+        self.step = window_size - int(window_size * overlap)
+        self.max_windows = max_windows
+
+        from scipy import signal
+
+        self.window = signal.get_window("hann", window_size)
+        frequencies = np.fft.rfftfreq(window_size, d=1 / fs)
+
+        # One-sided PSD: double everything but DC (and Nyquist for even windows)
+        self.scale = np.full(len(frequencies), 2.0 / (fs * np.sum(self.window**2)))
+        self.scale[0] /= 2
+        if window_size % 2 == 0:
+            self.scale[-1] /= 2
+
+        if freq_band is None:
+            self.rows = slice(None)
+        else:
+            self.rows = (frequencies >= freq_band[0]) & (frequencies <= freq_band[1])
+        self.frequencies = frequencies[self.rows]
+
+        self._tail = np.empty(0)
+        self._n_windows = 0  # windows computed since the start of the stream
+        self._buffer = np.empty((len(self.frequencies), 0))
+        self._start = 0  # buffer column of the oldest retained window
+        self._count = 0  # retained windows
+
+    def __len__(self):
+        """Number of windows currently held in the buffer."""
+        return self._count
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * self._buffer.shape[1], 16)
+        if self.max_windows is not None:
+            capacity = min(capacity, self.max_windows)
+        grown = np.empty((len(self.frequencies), capacity))
+        grown[:, : self._count] = self.power
+        self._buffer = grown
+        self._start = 0
+
+    def _store(self, power):
+        n_new = power.shape[1]
+        if self._count + n_new > self._buffer.shape[1]:
+            if self.max_windows is None or self._buffer.shape[1] < self.max_windows:
+                self._grow(self._count + n_new)
+
+        capacity = self._buffer.shape[1]
+        if n_new > capacity:
+            power = power[:, -capacity:]
+            n_new = capacity
+
+        positions = (self._start + self._count + np.arange(n_new)) % capacity
+        self._buffer[:, positions] = power
+
+        overflow = max(0, self._count + n_new - capacity)
+        self._start = (self._start + overflow) % capacity
+        self._count = min(self._count + n_new, capacity)
+
+    def append(self, samples):
+        """Feed new samples and compute the windows they complete.
+
+        Args:
+            samples (array-like): New frequency samples [Hz], in time order
+
+        Returns:
+            np.ndarray: Power spectral density of the new windows, shape (n_freqs, n_new)
+        """
+        data = np.concatenate([self._tail, np.asarray(samples, dtype=np.float64)])
+        n_segments = (
+            0 if len(data) < self.window_size else (len(data) - self.window_size) // self.step + 1
+        )
+
+        if n_segments:
+            segments = sliding_window_view(data, self.window_size)[:: self.step][:n_segments]
+            segments = segments - segments.mean(axis=1, keepdims=True)
+            spectrum = np.fft.rfft(segments * self.window, axis=1)
+            power = (np.abs(spectrum) ** 2 * self.scale)[:, self.rows].T
+            self._store(power)
+            self._n_windows += n_segments
+        else:
+            power = np.empty((len(self.frequencies), 0))
+
+        consumed = n_segments * self.step
+        self._tail = data[consumed:]
+        return power
+
+    @property
+    def power(self):
+        """Power spectral density [Hz^2/Hz] of the retained windows, oldest first.
+
+        A view into the ring buffer unless it has wrapped around.
+        """
+        capacity = self._buffer.shape[1]
+        end = self._start + self._count
+        if end <= capacity:
+            return self._buffer[:, self._start : end]
+        return np.concatenate(
+            [self._buffer[:, self._start :], self._buffer[:, : end - capacity]], axis=1
+        )
+
+    @property
+    def times(self):
+        """Window centres [s] since the first sample, matching scipy's ``t`` output."""
+        first = self._n_windows - self._count
+        return (np.arange(first, self._n_windows) * self.step + self.window_size / 2) / self.fs
+
+
+## Band-limited spectrogram
+def _decimation_factor(fs, f_max, window_size, step, margin=1.25, max_factor=13):
+    # Largest factor that keeps f_max * margin below the new Nyquist frequency and divides both
+    # the window and the hop, so windows start on the same instants as at full rate
+    limit = min(int(fs / (2 * f_max * margin)), max_factor)
+    common = np.gcd(window_size, step)
+    for q in range(max(limit, 1), 0, -1):
+        if common % q == 0:
+            return q
+    return 1
+
+
+def band_spectrogram(
+    data,
+    fs=10,
+    window_size=600,
+    overlap=0.75,
+    freq_band=(0.05, 0.3),
+    resolution=None,
+    decimate=True,
+):
+    """Spectrogram of one frequency band via anti-alias decimation and a zoom DFT.
+
+    Instead of a full-rate FFT whose bins are mostly thrown away, the signal is low-pass
+    filtered and decimated so that the band of interest sits just below the new Nyquist
+    frequency, and the DFT is evaluated only at the requested frequencies (a zoom FFT on
+    the unit circle), as one matrix product over all windows. The frequency grid inside the
+    band can be finer than ``fs / window_size``.
+
+    Args:
+        data (array-like): Grid frequency measurements [Hz]
+        fs (float, optional): Sampling frequency [Hz]. Defaults to 10.
+        window_size (int, optional): Samples per window at the original rate. Defaults to 600.
+        overlap (float, optional): Overlap between consecutive windows. Defaults to 0.75.
+        freq_band (tuple, optional): (f_min, f_max) [Hz]. Defaults to (0.05, 0.3).
+        resolution (float, optional): Frequency grid spacing [Hz]. Defaults to
+            fs / window_size, the same bins as the full FFT.
+        decimate (bool, optional): Decimate before the DFT. Defaults to True.
+
+    Returns:
+        dict: 'frequencies', 'times' (window centres [s], as scipy.signal.spectrogram),
+            'power' (PSD [Hz^2/Hz], shape (n_freqs, n_windows)), 'fs', 'window_size',
+            'overlap' and 'decimation'
+    """
+    from scipy import signal
+
+    f_min, f_max = freq_band
+    step = window_size - int(window_size * overlap)
+    resolution = fs / window_size if resolution is None else resolution
+
+    y = np.asarray(data, dtype=np.float64)
+    y = y - np.mean(y)
+    q = _decimation_factor(fs, f_max, window_size, step) if decimate else 1
+    if q > 1:
+        y = signal.decimate(y, q, ftype="iir", zero_phase=True)
+    fs_d, window_d, step_d = fs / q, window_size // q, step // q
+
+    # Snap to the full-rate FFT grid when the default resolution is used
+    first = np.ceil(f_min / resolution - 1e-9) * resolution
+    frequencies = np.arange(first, f_max + resolution / 2, resolution)
+    frequencies = frequencies[frequencies <= f_max + 1e-12]
+
+    n_segments = 0 if len(y) < window_d else (len(y) - window_d) // step_d + 1
+    segments = sliding_window_view(y, window_d)[::step_d][:n_segments]
+    segments = segments - segments.mean(axis=1, keepdims=True)
+
+    window = signal.get_window("hann", window_d)
+    kernel = window * np.exp(-2j * np.pi * np.outer(frequencies, np.arange(window_d)) / fs_d)
+    spectrum = segments @ kernel.T
+
+    scale = 2.0 / (fs_d * np.sum(window**2))
+    power = (np.abs(spectrum) ** 2 * scale).T
+    times = (np.arange(n_segments) * step + window_size / 2) / fs
+
+    return {
+        "frequencies": frequencies,
+        "times": times,
+        "power": power,
+        "fs": fs,
+        "window_size": window_size,
+        "overlap": overlap,
+        "decimation": q,
+    }
@@ -0,0 +1,200 @@
+import base64
+from functools import lru_cache
+
+import pandas as pd
+
+from apagon_april28 import paths
+from apagon_april28.downsample import downsample_indices
+from apagon_april28.timeindex import rounded_limits
+
+template_name = "lemur"
+
+
+## Branding assets
+@lru_cache(maxsize=None)
+def lemur_logo(path=None):
+    """The Lemur logo as a base64 data URI, read and encoded once per process.
+
+    Plotly accepts the URI directly as a layout image ``source``; passing a PIL image instead
+    re-encodes the PNG for every figure.
+    """
+    path = paths.figures_dir / "lemur_logo_yellow.png" if path is None else path
+    with open(path, "rb") as f:
+        return "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+## Plotly template
+@lru_cache(maxsize=None)
+def lemur_template():
+    """Register and return the 'lemur' plotly template shared by the report figures.
+
+    Built on top of the default 'plotly' template so colorway and zero lines are unchanged,
+    with the report's fonts, grid, white background and 1600x800 size.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    template = go.layout.Template(pio.templates["plotly"])
+    template.layout.update(
+        title_font=dict(size=24),
+        yaxis_title_font=dict(size=20),
+        legend=dict(
+            font=dict(size=24), orientation="h", yanchor="bottom", y=1.0, xanchor="right", x=1
+        ),
+        xaxis=dict(tickfont=dict(size=20), showgrid=True, gridwidth=1, gridcolor="lightgray"),
+        yaxis=dict(tickfont=dict(size=20), showgrid=True, gridwidth=1, gridcolor="lightgray"),
+        height=800,
+        width=1600,
+        plot_bgcolor="white",
+        paper_bgcolor="white",
+        margin=dict(l=50, r=50, t=90, b=60),
+    )
+    pio.templates[template_name] = template
+    return template
+
+
+def new_figure(**layout):
+    """An empty figure using the 'lemur' template, with optional layout overrides."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(layout=dict(template=lemur_template()))
+    if layout:
+        fig.update_layout(**layout)
+    return fig
+
+
+def svg_figure(fig):
+    """The figure with its WebGL (Scattergl) traces redrawn as SVG Scatter, for static exports.
+
+    Scattergl only pays off for interactive panning; in a written image its traces are
+    rasterized by the headless browser's software WebGL (and embedded as bitmaps in SVG and
+    PDF), while SVG traces come out exact at any scale. Returns fig itself if it has none.
+    """
+    import plotly.graph_objects as go
+
+    if not any(trace.type == "scattergl" for trace in fig.data):
+        return fig
+    spec = fig.to_dict()
+    for trace in spec["data"]:
+        if trace["type"] == "scattergl":
+            trace["type"] = "scatter"
+    return go.Figure(spec)
+
+
+def add_branding(fig, lemur_x=0.02, lemur_y=0.02, size=0.2, data_source="gridradar"):
+    """Add the Lemur logo and the 'analysis: lemur, uniovi | data: ...' attribution."""
+    fig.add_layout_image(
+        dict(
+            source=lemur_logo(),
+            xref="paper",
+            yref="paper",
+            x=lemur_x,
+            y=lemur_y,
+            sizex=size,
+            sizey=size,
+            xanchor="left",
+            yanchor="bottom",
+        )
+    )
+    fig.add_annotation(
+        text=f"analysis: lemur, uniovi | data: {data_source}",
+        xref="paper",
+        yref="paper",
+        x=1,
+        y=1,
+        xanchor="right",
+        yanchor="top",
+        showarrow=False,
+        font=dict(size=12, color="gray"),
+        bgcolor="white",
+    )
+    return fig
+
+
+## Frequency bands
+def add_frequency_bands(fig, ymin, ymax, t_label):
+    """Shade beyond +/- 200mHz and +/- 800mHz and label FCR saturation.
+
+    Shapes and the label are named so update_frequency_window can move them in place.
+    """
+    fig.add_hrect(y0=ymin, y1=49.2, fillcolor="gray", opacity=0.1, line_width=0, name="below_49.2")
+    fig.add_hrect(y0=ymin, y1=49.8, fillcolor="gray", opacity=0.1, line_width=0, name="below_49.8")
+    fig.add_hrect(y0=50.2, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0, name="above_50.2")
+    fig.add_hrect(y0=50.8, y1=ymax, fillcolor="gray", opacity=0.1, line_width=0, name="above_50.8")
+
+    # Note FCR saturation at +/- 200mhz
+    fig.add_annotation(
+        x=t_label + pd.Timedelta(seconds=0.2),
+        y=49.78,
+        text="<i>FCR Saturation</i>",
+        showarrow=False,
+        font=dict(size=12),
+        name="fcr_saturation",
+    )
+    return fig
+
+
+## In-place updates
+def update_frequency_window(
+    fig, data, start_time, end_time, ymin=None, ymax=None, ts_index=None, decimate=None
+):
+    """Reuse a built frequency figure for another time window by swapping data in place.
+
+    Traces are matched to columns through their ``meta`` (set by plots.create_frequency_plot);
+    for a Series, the single trace is updated. The y-range, the +/- 200/800mHz bands and the
+    FCR label follow the new window. Layout, logo and fonts are left untouched, so a sweep
+    over many event windows skips all figure construction after the first.
+
+    Args:
+        fig (go.Figure): Figure from plots.create_frequency_plot or plots.generic_frequency_plot
+        data (pd.DataFrame or pd.Series): Same data the figure was built from (or a new day)
+        start_time (datetime-like): Window start
+        end_time (datetime-like): Window end
+        ymin (float, optional): Minimum y-axis value. Defaults to autoscaling.
+        ymax (float, optional): Maximum y-axis value. Defaults to autoscaling.
+        ts_index (timeindex.TimeSeriesIndex, optional): Index over ``data`` for fast slicing
+        decimate (str, optional): 'minmax' or 'lttb' to reduce each trace to the figure width,
+            as in plots.line_trace. Defaults to None.
+
+    Returns:
+        go.Figure: The same figure object
+    """
+    if ts_index is not None:
+        window = ts_index.window(start_time, end_time)
+        auto_ymin, auto_ymax = ts_index.autoscale(start_time, end_time)
+    else:
+        window = data.loc[start_time:end_time]
+        if isinstance(window, pd.Series):
+            auto_ymin, auto_ymax = rounded_limits(window.min(), window.max())
+        else:
+            auto_ymin, auto_ymax = rounded_limits(window.min().min(), window.max().max())
+    ymin = auto_ymin if ymin is None else ymin
+    ymax = auto_ymax if ymax is None else ymax
+
+    width = fig.layout.width or lemur_template().layout.width
+    with fig.batch_update():
+        for trace in fig.data:
+            if isinstance(window, pd.Series):
+                column = window
+            elif trace.meta in window.columns:
+                column = window[trace.meta]
+            else:
+                continue
+            x, y = column.index, column.to_numpy()
+            if decimate is not None and len(x) > 2 * width:
+                keep = downsample_indices(x, y, width, method=decimate)
+                x, y = x[keep], y[keep]
+            trace.x = x
+            trace.y = y
+
+        fig.layout.yaxis.range = [ymin, ymax]
+        for shape in fig.layout.shapes:
+            if shape.name in ("below_49.2", "below_49.8"):
+                shape.y0 = ymin
+            elif shape.name in ("above_50.2", "above_50.8"):
+                shape.y1 = ymax
+        for annotation in fig.layout.annotations:
+            if annotation.name == "fcr_saturation" and len(window):
+                annotation.x = window.index[0] + pd.Timedelta(seconds=0.2)
+
+    return fig
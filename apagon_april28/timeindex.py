@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+from apagon_april28.timestamps import bound_ns
+
+
+## Axis limits
+def rounded_limits(low, high, step=0.1, default=(49.1, 50.9)):
+    """Round data extrema outwards to the plot grid, with one extra step of headroom.
+
+    Matches the autoscaling in plots.create_frequency_plot: ``round(min * 10 - 1) / 10``.
+    Falls back to ``default`` when the window holds no data.
+
+    Args:
+        low (float): Smallest value in the window (NaN if empty)
+        high (float): Largest value in the window (NaN if empty)
+        step (float, optional): Grid step. Defaults to 0.1 (Hz).
+        default (tuple, optional): Limits used for missing extrema. Defaults to (49.1, 50.9).
+
+    Returns:
+        tuple: (ymin, ymax)
+    """
+    scale = 1 / step
+    ymin = default[0] if not np.isfinite(low) else round(low * scale - 1) / scale
+    ymax = default[1] if not np.isfinite(high) else round(high * scale + 1) / scale
+    return ymin, ymax
+
+
+## Index
+class TimeSeriesIndex:
+    """Sorted-time index with precomputed block extrema for fast window queries.
+
+    Holds the timestamps as int64 nanoseconds for ``searchsorted`` slicing and, per column,
+    the min/max of fixed-size blocks plus a sparse table over those blocks. A window's
+    extrema then cost two partial-block scans and an O(1) sparse-table lookup instead of a
+    scan (and copy) of the whole window. Memory is O(n / block_size * log n) per column.
+
+    Args:
+        df (pd.DataFrame): Numeric data with a sorted DatetimeIndex, e.g. pmu_df
+        block_size (int, optional): Rows per block. Defaults to 256.
+    """
+
+    def __init__(self, df, block_size=256):
+        if not df.index.is_monotonic_increasing:
+            raise ValueError("TimeSeriesIndex needs a sorted index")
+        self.frame = df
+        self.columns = list(df.columns)
+        self.block_size = block_size
+        if isinstance(df.index, pd.DatetimeIndex):
+            self.time = df.index.as_unit("ns").asi8
+            self.tz = df.index.tz
+        else:
+            self.time = np.asarray(df.index, dtype=np.int64)
+            self.tz = None
+        self.values = np.ascontiguousarray(df.to_numpy(dtype=np.float64))
+
+        n, n_cols = self.values.shape
+        n_blocks = -(-n // block_size)
+        padded = np.full((n_blocks * block_size, n_cols), np.nan)
+        padded[:n] = self.values
+        padded = padded.reshape(n_blocks, block_size, n_cols)
+
+        # fmin/fmax ignore NaN unless a whole block is NaN
+        self._min_table = [np.fmin.reduce(padded, axis=1)]
+        self._max_table = [np.fmax.reduce(padded, axis=1)]
+        width = 1
+        while 2 * width <= n_blocks:
+            lo, hi = self._min_table[-1], self._max_table[-1]
+            self._min_table.append(np.fmin(lo[:-width], lo[width:]))
+            self._max_table.append(np.fmax(hi[:-width], hi[width:]))
+            width *= 2
+
+    def __len__(self):
+        return len(self.time)
+
+    def rows(self, start=None, end=None):
+        """Row slice for [start, end] (both inclusive), by binary search.
+
+        Naive bounds are wall-clock times in the timezone of the index, and a partial string
+        end such as '12:33:20' covers its whole second, as with ``df.loc``.
+        """
+        i0 = (
+            0
+            if start is None
+            else int(np.searchsorted(self.time, bound_ns(start, self.tz), side="left"))
+        )
+        i1 = (
+            len(self.time)
+            if end is None
+            else int(np.searchsorted(self.time, bound_ns(end, self.tz, end=True), side="right"))
+        )
+        return slice(i0, max(i0, i1))
+
+    def window(self, start=None, end=None, columns=None):
+        """The rows of the original frame between start and end, like ``df.loc[start:end]``."""
+        df = self.frame.iloc[self.rows(start, end)]
+        return df if columns is None else df[columns]
+
+    def _column_positions(self, columns):
+        if columns is None:
+            return slice(None)
+        if isinstance(columns, str):
+            columns = [columns]
+        return [self.columns.index(c) for c in columns]
+
+    def extrema(self, start=None, end=None, columns=None):
+        """Per-column (min, max) over [start, end], ignoring NaN.
+
+        Args:
+            start (datetime-like, optional): Window start (inclusive)
+            end (datetime-like, optional): Window end (inclusive)
+            columns (list, optional): Columns to query. Defaults to all.
+
+        Returns:
+            tuple: (minima, maxima) as pd.Series indexed by column (NaN for empty windows)
+        """
+        positions = self._column_positions(columns)
+        names = np.array(self.columns)[positions].tolist()
+        rows = self.rows(start, end)
+        i0, i1 = rows.start, rows.stop
+        b = self.block_size
+        b0, b1 = -(-i0 // b), i1 // b  # first and one-past-last fully covered block
+
+        low = np.full(len(names), np.nan)
+        high = np.full(len(names), np.nan)
+        if b0 < b1:
+            k = int(np.log2(b1 - b0))
+            width = 1 << k
+            low = np.fmin(
+                self._min_table[k][b0, positions], self._min_table[k][b1 - width, positions]
+            )
+            high = np.fmax(
+                self._max_table[k][b0, positions], self._max_table[k][b1 - width, positions]
+            )
+            edges = [self.values[i0 : b0 * b, positions], self.values[b1 * b : i1, positions]]
+        else:
+            edges = [self.values[i0:i1, positions]]
+
+        for edge in edges:
+            if len(edge):
+                low = np.fmin(low, np.fmin.reduce(edge, axis=0))
+                high = np.fmax(high, np.fmax.reduce(edge, axis=0))
+
+        return pd.Series(low, index=names), pd.Series(high, index=names)
+
+    def autoscale(self, start=None, end=None, columns=None, step=0.1, default=(49.1, 50.9)):
+        """Y-axis limits for a window across the given columns (see rounded_limits)."""
+        low, high = self.extrema(start, end, columns)
+        return rounded_limits(
+            np.fmin.reduce(low.to_numpy()) if len(low) else np.nan,
+            np.fmax.reduce(high.to_numpy()) if len(high) else np.nan,
+            step=step,
+            default=default,
+        )
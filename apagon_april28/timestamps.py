@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_HOUR = 3600 * NS_PER_SECOND
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# Fixed-width layouts (bytes per timestamp)
+ENTSOE_TIMESTAMP_WIDTH = 16  # "28.04.2025 00:00", the start of "... - 28.04.2025 00:15 (CET/CEST)"
+GRIDRADAR_TIMESTAMP_WIDTH = 29  # "2025/04/28 10:30:00.100", room for up to nanosecond fractions
+TOLEDO_TIMESTAMP_WIDTH = 20  # "28-Apr-2025 11:00:00"
+ISO_OFFSET_TIMESTAMP_WIDTH = 25  # "2025-04-28T00:00:00+02:00"
+
+MONTH_ABBREVIATIONS = [
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+]
+
+
+## Calendar arithmetic
+def _days_from_civil(year, month, day):
+    # Howard Hinnant's days_from_civil, vectorized: proleptic Gregorian date -> days since 1970-01-01
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    yoe = year - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _last_sunday(year, month):
+    # Days since epoch of the last Sunday of a 31-day month (March and October here)
+    last_day = _days_from_civil(year, month, 31)
+    weekday = (last_day + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+    return last_day - (weekday + 1) % 7
+
+
+def _years(ns):
+    return ns.astype("datetime64[ns]").astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+## Byte fields
+def _char_matrix(timestamps, width):
+    # Encode once to fixed-width bytes and view them as an (n, width) uint8 matrix; shorter
+    # strings are NUL-padded, longer ones truncated (e.g. the end of an ENTSO-E MTU interval)
+    raw = np.asarray(timestamps, dtype=f"S{width}")
+    return raw.view(np.uint8).reshape(len(raw), width)
+
+
+def _field(chars, a, b):
+    out = np.zeros(len(chars), dtype=np.int64)
+    for i in range(a, b):
+        out = out * 10 + (chars[:, i].astype(np.int64) - ord("0"))
+    return out
+
+
+def _fraction_ns(chars, a, b):
+    # Fractional seconds with a variable number of digits; padding bytes count as zero
+    nanoseconds = np.zeros(len(chars), dtype=np.int64)
+    for i, weight in zip(range(a, b), 10 ** np.arange(8, -1, -1)):
+        digit = chars[:, i].astype(np.int64) - ord("0")
+        nanoseconds += np.where((digit >= 0) & (digit <= 9), digit, 0) * weight
+    return nanoseconds
+
+
+def _civil_ns(year, month, day, hour, minute, second):
+    days = _days_from_civil(year, month, day)
+    return (days * 86400 + hour * 3600 + minute * 60 + second) * NS_PER_SECOND
+
+
+## Central European Time
+def summer_time_bounds(year):
+    """UTC instants at which Central European Summer Time starts and ends.
+
+    EU rule (in force since 1996): CEST runs from 01:00 UTC on the last Sunday of March to
+    01:00 UTC on the last Sunday of October.
+
+    Args:
+        year (int or array-like): Year(s)
+
+    Returns:
+        tuple: (start, end) as int64 nanoseconds since the Unix epoch
+    """
+    year = np.asarray(year, dtype=np.int64)
+    start = _last_sunday(year, 3) * NS_PER_DAY + NS_PER_HOUR
+    end = _last_sunday(year, 10) * NS_PER_DAY + NS_PER_HOUR
+    return start, end
+
+
+def utc_to_cet(utc_ns):
+    """Convert UTC instants to naive CET/CEST wall-clock time (both int64 nanoseconds)."""
+    utc_ns = np.asarray(utc_ns, dtype=np.int64)
+    start, end = summer_time_bounds(_years(utc_ns))
+    is_summer = (utc_ns >= start) & (utc_ns < end)
+    return utc_ns + np.where(is_summer, 2, 1) * NS_PER_HOUR
+
+
+def cet_to_utc(wall_ns, nonexistent="NaT"):
+    """Localize naive CET/CEST wall-clock times and convert them to UTC.
+
+    In October the hour 02:00-03:00 occurs twice. Exports list it in order, first in CEST
+    and then again in CET, so a row is taken as the CET repeat when the clock has already
+    been later than it, i.e. when it lies below the running maximum of the rows before it.
+    A time that occurs only once in the repeated hour is taken as CEST. In March the hour
+    02:00-03:00 does not exist (ENTSO-E exports still list it, with empty values).
+
+    Args:
+        wall_ns (array-like): Naive wall-clock times as int64 nanoseconds, in file order
+        nonexistent (str, optional): 'NaT' marks times in the skipped March hour as NaT
+            (int64 minimum); 'shift' reads them as CET, i.e. one hour later in CEST.
+            Defaults to 'NaT'.
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the Unix epoch (UTC)
+    """
+    wall_ns = np.asarray(wall_ns, dtype=np.int64)
+    if len(wall_ns) == 0:
+        return wall_ns.copy()
+    start, end = summer_time_bounds(_years(wall_ns))
+    # Same instants on the wall clock: 02:00 CET in March, 03:00 CEST (= 02:00 CET) in October
+    wall_start = start + NS_PER_HOUR
+    wall_end = end + NS_PER_HOUR
+
+    is_summer = (wall_ns >= wall_start + NS_PER_HOUR) & (wall_ns < wall_end)
+    skipped = (wall_ns >= wall_start) & (wall_ns < wall_start + NS_PER_HOUR)
+    ambiguous = (wall_ns >= wall_end) & (wall_ns < wall_end + NS_PER_HOUR)
+    if ambiguous.any():
+        previous_max = np.empty_like(wall_ns)
+        previous_max[0] = np.iinfo(np.int64).min
+        np.maximum.accumulate(wall_ns[:-1], out=previous_max[1:])
+        is_summer |= ambiguous & (wall_ns > previous_max)
+
+    utc_ns = wall_ns - np.where(is_summer, 2, 1) * NS_PER_HOUR
+    if nonexistent == "NaT":
+        utc_ns[skipped] = np.iinfo(np.int64).min
+    elif nonexistent != "shift":
+        raise ValueError(f"Unknown nonexistent option: {nonexistent}")
+    return utc_ns
+
+
+def to_datetime_index(utc_ns, tz="Europe/Madrid", name=None):
+    """Wrap UTC nanoseconds in a DatetimeIndex, converted to tz (None for naive UTC)."""
+    index = pd.DatetimeIndex(np.asarray(utc_ns, dtype="datetime64[ns]"), name=name)
+    return index if tz is None else index.tz_localize("UTC").tz_convert(tz)
+
+
+def bound_ns(value, tz="Europe/Madrid", end=False):
+    """Nanoseconds of a time-range bound, for binary search on an int64 time axis.
+
+    A naive bound is read as wall-clock time in tz, as ``df.loc[start:end]`` does on a
+    tz-aware index; a tz-aware bound is taken as is. With tz None the axis is naive (or
+    UTC) and the bound is used as written.
+
+    Args:
+        value (datetime-like): Bound, e.g. '2025-04-28 12:33' or a pd.Timestamp
+        tz (str, optional): Timezone of the index. Defaults to 'Europe/Madrid'.
+        end (bool, optional): Widen a partial string to the last nanosecond it covers, as
+            ``df.loc`` does for end bounds, so '12:33' ends at 12:33:59.999999999.
+            Defaults to False.
+
+    Returns:
+        int: Nanoseconds since the Unix epoch (UTC, unless tz is None)
+    """
+    ts = pd.Timestamp(value)
+    if tz is not None and ts.tzinfo is None:
+        ts = ts.tz_localize(tz)
+    elif tz is None and ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    if end and isinstance(value, str):
+        period = pd.Period(value)
+        ts += (period + 1).start_time - period.start_time - pd.Timedelta(1, "ns")
+    return ts.as_unit("ns").value
+
+
+## Formats
+def parse_entsoe_mtu(timestamps):
+    """Parse ENTSO-E interval strings into the UTC start of each interval.
+
+    Handles generation ``MTU`` ("28.04.2025 00:00 - 28.04.2025 00:15 (CET/CEST)") and
+    cross-border flow ``Time (CET/CEST)`` ("01.01.2025 00:00 - 01.01.2025 00:15") columns:
+    only the fixed-width start ``%d.%m.%Y %H:%M`` is read. The wall-clock times are
+    localized with cet_to_utc, so the repeated October hour maps to distinct instants.
+
+    Args:
+        timestamps (array-like): Interval strings, in file order
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the Unix epoch (UTC); NaT (int64 minimum) for
+            the placeholder rows of the skipped March hour
+    """
+    chars = _char_matrix(timestamps, ENTSOE_TIMESTAMP_WIDTH)
+    wall_ns = _civil_ns(
+        _field(chars, 6, 10),
+        _field(chars, 3, 5),
+        _field(chars, 0, 2),
+        _field(chars, 11, 13),
+        _field(chars, 14, 16),
+        0,
+    )
+    return cet_to_utc(wall_ns)
+
+
+def parse_gridradar(timestamps):
+    """Parse GridRadar ``%Y/%m/%d %H:%M:%S.%f`` strings (UTC) into int64 UTC nanoseconds.
+
+    Args:
+        timestamps (array-like): Timestamp strings
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the Unix epoch (UTC)
+    """
+    chars = _char_matrix(timestamps, GRIDRADAR_TIMESTAMP_WIDTH)
+    seconds_ns = _civil_ns(
+        _field(chars, 0, 4),
+        _field(chars, 5, 7),
+        _field(chars, 8, 10),
+        _field(chars, 11, 13),
+        _field(chars, 14, 16),
+        _field(chars, 17, 19),
+    )
+    return seconds_ns + _fraction_ns(chars, 20, GRIDRADAR_TIMESTAMP_WIDTH)
+
+
+def parse_toledo(timestamps):
+    """Parse Toledo analyzer ``%d-%b-%Y %H:%M:%S`` strings (Spanish local time) into UTC.
+
+    Args:
+        timestamps (array-like): Timestamp strings such as "28-Apr-2025 11:00:00", in file order
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the Unix epoch (UTC)
+    """
+    chars = _char_matrix(timestamps, TOLEDO_TIMESTAMP_WIDTH)
+
+    # Month abbreviation -> month number through the three bytes packed into one integer
+    codes = (
+        (chars[:, 3].astype(np.int64) << 16) | (chars[:, 4].astype(np.int64) << 8) | chars[:, 5]
+    )
+    known = np.array(
+        [(ord(m[0]) << 16) | (ord(m[1]) << 8) | ord(m[2]) for m in MONTH_ABBREVIATIONS]
+    )
+    order = np.argsort(known)
+    position = np.minimum(np.searchsorted(known[order], codes), len(known) - 1)
+    if not np.all(known[order][position] == codes):
+        raise ValueError("Unrecognised month abbreviation in Toledo timestamps")
+    month = order[position] + 1
+
+    wall_ns = _civil_ns(
+        _field(chars, 7, 11),
+        month,
+        _field(chars, 0, 2),
+        _field(chars, 12, 14),
+        _field(chars, 15, 17),
+        _field(chars, 18, 20),
+    )
+    return cet_to_utc(wall_ns)
+
+
+def parse_iso_offset(timestamps):
+    """Parse ``%Y-%m-%dT%H:%M:%S+HH:MM`` strings (e.g. the NTC export) into UTC.
+
+    The explicit offset is applied directly, so no DST rules are needed.
+
+    Args:
+        timestamps (array-like): Timestamp strings such as "2025-04-28T00:00:00+02:00"
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the Unix epoch (UTC)
+    """
+    chars = _char_matrix(timestamps, ISO_OFFSET_TIMESTAMP_WIDTH)
+    local_ns = _civil_ns(
+        _field(chars, 0, 4),
+        _field(chars, 5, 7),
+        _field(chars, 8, 10),
+        _field(chars, 11, 13),
+        _field(chars, 14, 16),
+        _field(chars, 17, 19),
+    )
+    sign = np.where(chars[:, 19] == ord("-"), -1, 1)
+    offset_ns = sign * (_field(chars, 20, 22) * 3600 + _field(chars, 23, 25) * 60) * NS_PER_SECOND
+    # "Z" (or no offset) leaves the time as UTC
+    offset_ns = np.where(np.isin(chars[:, 19], [ord("+"), ord("-")]), offset_ns, 0)
+    return local_ns - offset_ns